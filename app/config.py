@@ -5,6 +5,106 @@ class Settings(BaseSettings):
     deeplAPI: str
     openAiAPI: str = ""
 
+    # 생성 백엔드 - 쉼표로 구분, 첫 번째가 기본 백엔드 (local: sLLM, openai: OpenAI 호환 API, stub: 테스트용 고정 응답)
+    # 요청의 backend로 불러온 백엔드 중 하나를 선택할 수 있음
+    generationBackends: str = "local"
+    localModelName: str = "qwenCoder"   # resources/models/{이름}-model, {이름}-adapter
+    openAiModel: str = "gpt-4.1-mini"
+    stubResponse: str = ""              # 비어 있으면 선택된 디바이스의 메서드를 호출하는 시나리오 생성
+
+    # OpenAI 클라이언트 - API 주소(빈 문자열이면 기본 주소, 로컬 스텁 서버로 교체 가능), 동시 요청 수, 연결 풀 크기
+    openAiBaseURL: str = ""
+    openAiMaxInFlight: int = 8
+    openAiMaxConnections: int = 16
+    # 요청 당 제한 시간(초) - 대기열 대기와 재시도 포함, 초과 시 504 응답
+    openAiDeadline: float = 60.0
+    # 429, 5xx, 연결 오류 재시도 횟수와 지수 백오프(초) - retry-after 헤더가 있으면 그 시간 이상 대기
+    openAiMaxRetries: int = 3
+    openAiBackoffBase: float = 0.5
+    openAiBackoffMax: float = 8.0
+
+    # 모델 서버 - Unix 소켓 경로를 설정하면 API 워커는 로컬 LLM과 BGE-M3를 로드하지 않고 모델 서버(python -m app.services.model_server)를 사용
+    # 여러 API 워커(uvicorn --workers)가 GPU의 모델 한 벌을 공유, 모델 서버가 준비될 때까지 기다리는 최대 시간(초)
+    modelServerSocket: str = ""
+    modelServerTimeout: float = 600.0
+    # 모델 서버 연결 인증 키 - 비어 있으면 모델 서버가 만든 <소켓 경로>.key 파일 사용
+    modelServerAuthKey: str = ""
+
+    # 서버 시작 시 리소스(카탈로그, 인덱스, 모델 등)를 동시에 로드하는 스레드 수
+    startupWorkers: int = 4
+
+    # 파이프라인 실행기 설정 - 워커 스레드 수와 대기열 크기(초과 시 429 응답)
+    pipelineWorkers: int = 8
+    pipelineQueueSize: int = 16
+    # 스트리밍 응답에서 클라이언트가 받지 않은 이벤트를 쌓아 둘 최대 개수 - 가득 차면 생성 쪽이 대기
+    streamBufferSize: int = 32
+    # 요청 내 단계(번역, 디바이스 전처리, 검색, 검증 등)를 동시에 실행하는 스레드 수
+    stageWorkers: int = 16
+    # 번역을 기다리는 동안 원문으로 디바이스 검색을 먼저 수행 - 번역이 원문을 그대로 돌려준 경우(번역 실패 등)에만 그 결과를 사용
+    # 한국어 입력은 대부분 번역문으로 다시 검색하므로 인코딩 한 번이 낭비됨 - DeepL 장애가 잦은 환경에서만 켜는 것을 권장
+    speculativeRetrieval: bool = False
+
+    # 스테이지 별 동시 실행 수 제한
+    gpuSlots: int = 1       # LLM 생성
+    encodeSlots: int = 2    # BGE-M3 인코딩 (공유 인코더의 배치 forward)
+    httpSlots: int = 8      # DeepL 등 외부 HTTP 호출
+
+    # LLM 배치 생성 설정 - 최대 배치 크기와 요청을 모으는 최대 대기 시간(ms)
+    batchMaxSize: int = 4
+    batchMaxWaitMs: int = 20
+
+    # 추측 디코딩 - "off", "prompt_lookup"(프롬프트의 n-gram으로 초안 생성), "draft"(작은 draft 모델로 초안 생성)
+    # 단독 처리되는 요청에만 적용되며, greedy 디코딩에서는 결과가 같음
+    speculativeDecoding: str = "off"
+    promptLookupTokens: int = 10        # 한 번에 제안할 초안 토큰 수
+    promptLookupMaxNgram: int = 3       # 프롬프트에서 찾을 최대 n-gram 길이
+    draftModelName: str = ""            # resources/models 아래 draft 모델 디렉토리 (Qwen 토크나이저 공유)
+    draftTokens: int = 5
+
+    # 제한 디코딩 - 시나리오 헤더 구조와 선택된 디바이스의 태그/메서드/속성 이름을 벗어나는 토큰을 제한 (켜면 greedy 디코딩 사용)
+    constrainedDecoding: bool = False
+    constrainedCandidates: int = 32     # 최상위 토큰이 벗어날 때 허용 여부를 확인할 상위 후보 수
+
+    # <DEVICES> 부분 토큰 예산 - 넘으면 주석 제거, enum 정리, 순위가 낮은 디바이스 제외 순으로 줄임 (0이면 제한 없음)
+    devicePromptBudget: int = 0
+
+    # 시스템 프롬프트 접두부 KV 캐시 - (grammar, service_doc) 접두부 LRU 크기 (0이면 사용 안 함)
+    prefixCacheSize: int = 4
+
+    # 공유 BGE-M3 인코더 - 동시 encode 호출을 모으는 최대 문장 수와 대기 시간(ms), 입력 최대 토큰 수(명령어, 식별자 기준)
+    encoderMaxBatchSize: int = 32
+    encoderMaxWaitMs: int = 5
+    encoderMaxLength: int = 256
+
+    # 코드 검증 시 식별자 교정 결과 memo 최대 항목 수
+    accessorMemoSize: int = 8192
+
+    # DeepL 클라이언트 - API 주소(로컬 스텁 서버로 교체 가능), 요청 제한 시간(초), 연결 풀 크기
+    deeplURL: str = "https://api-free.deepl.com/v2/translate"
+    deeplTimeout: float = 2.0
+    deeplMaxConnections: int = 10
+    # 연속 실패 횟수가 임계값에 도달하면 cooldown(초) 동안 DeepL 호출을 건너뜀
+    deeplFailureThreshold: int = 3
+    deeplCooldown: float = 30.0
+
+    # 번역 캐시 - SQLite 경로(빈 문자열이면 메모리만 사용), 메모리/디스크 최대 항목 수, TTL(초)
+    translationCachePath: str = "./app/resources/cache/translation_cache.sqlite3"
+    translationCacheMemorySize: int = 2048
+    translationCacheDiskSize: int = 100000
+    translationCacheTTL: int = 30 * 24 * 3600
+
+    # 디바이스 프로필 저장소 - SQLite 경로(빈 문자열이면 메모리만 사용), 메모리에 유지할 프로필/파생 정보 수
+    profileStorePath: str = "./app/resources/cache/device_profiles.sqlite3"
+    profileCacheSize: int = 256
+
+    # 응답 캐시 - 최대 항목 수(0이면 사용 안 함), TTL(초)
+    # 유사 일치 기준 코사인 유사도(0이면 정확 일치만 사용), current_time 구간(초) - 상대적 시간 표현이 있는 명령은 짧은 구간 사용
+    responseCacheSize: int = 1024
+    responseCacheTTL: int = 3600
+    responseCacheSimilarity: float = 0.0
+    responseCacheTimeBucket: int = 3600
+    responseCacheRelativeTimeBucket: int = 60
+
     model_config = SettingsConfigDict(env_file=".env")
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
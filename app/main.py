@@ -1,22 +1,68 @@
-import unsloth
-from fastapi import FastAPI, Request
+from .config import settings
+# 생성 백엔드 목록 - 첫 번째가 기본 백엔드
+BACKEND_NAMES = [name.strip() for name in settings.generationBackends.split(",") if name.strip()]
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-import json, os
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
+from contextlib import asynccontextmanager
+import asyncio, importlib, json, os, time
 from datetime import datetime
 import logging
 from pydantic import BaseModel
 from typing import Dict, Any, Optional, List
 
-from .services.run import generate_joi_code 
-from .services.loader import load_all_resources
-    
-# 사용할 모델 - Qwen2.5-Coder-7B
-MODEL_NAME = "qwenCoder"
+from .services.run import generate_joi_code, stream_joi_code
+from .services.executor import PipelineExecutor, QueueFullError, STAGE_LIMITER
+from .services.translate import TRANSLATION_CACHE, DEEPL_CLIENT
+from .services.loader import ResourceLoader, backend_model_name
+from .services.device_profiles import ProfileRegistry
+from .profile_routes import build_profile_router
 
-app = FastAPI()
 logger = logging.getLogger("uvicorn")
+STARTED_AT = time.monotonic()
+
+# 리소스 로더 - 가벼운 구성 요소는 서버 시작 전에, 모델은 시작 후 백그라운드에서 로드
+LOADER = ResourceLoader(BACKEND_NAMES, workers=settings.startupWorkers, model_server=settings.modelServerSocket)
+MODEL_RESOURCES = LOADER.resources
+# 기본 백엔드의 모델 - 로컬 백엔드는 Qwen2.5-Coder-7B
+MODEL_NAME = backend_model_name(BACKEND_NAMES[0])
+# 생성 요청을 처리하는 데 필요한 구성 요소 (생성 백엔드 제외)
+PIPELINE_COMPONENTS = ["catalog", "grammar", "embedding_data", "response_cache", "prompt_assembler", "encoder", "accessor_index"]
+
+# 파이프라인 실행기 - 동기 생성 파이프라인을 이벤트 루프 밖에서 실행
+PIPELINE = PipelineExecutor(settings.pipelineWorkers, settings.pipelineQueueSize, settings.streamBufferSize)
+
+# 디바이스 프로필 저장소 - 프로필 별 디바이스 목록과 전처리 결과를 보관 (카탈로그 로드 후 생성)
+PROFILES = None
+DEFAULT_PROFILE_ID = "default"
+
+def load_profiles() -> ProfileRegistry:
+    profiles = ProfileRegistry(
+        MODEL_RESOURCES["device_catalog"],
+        MODEL_RESOURCES["embedding_data"]["metadata"]["keys"],
+        path=settings.profileStorePath,
+        cache_size=settings.profileCacheSize,
+    )
+    # 기본 연결된 장치 정보 로드 - profile_id 없이 들어온 요청은 기본 프로필을 사용
+    with open("./app/resources/things_smart_farm.json", "r", encoding="utf-8") as f:
+        profiles.put(DEFAULT_PROFILE_ID, json.load(f))
+    return profiles
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global PROFILES
+    if "local" in BACKEND_NAMES and not settings.modelServerSocket:
+        # unsloth는 transformers보다 먼저 import되어야 함 - 모델 로드를 시작하기 전에 불러옴
+        await asyncio.to_thread(importlib.import_module, "unsloth")
+    await asyncio.to_thread(LOADER.load_light)
+    PROFILES = await asyncio.to_thread(load_profiles)
+    LOADER.start()
+    logger.info(f"serving while models load for {', '.join(BACKEND_NAMES)} (default: {MODEL_NAME})")
+    yield
+    PIPELINE.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # 템플릿 및 정적 파일 설정
 RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "resources")
@@ -25,22 +71,18 @@ STATIC_DIR = os.path.join(RESOURCES_DIR, "static")
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
-# 리소스 로드 - 모델 및 기타 리소스
-MODEL_RESOURCES = load_all_resources(MODEL_NAME)
-logger.info(f"resources loaded for {MODEL_NAME}")
-
-# 기본 연결된 장치 정보 로드
-with open("./app/resources/things_smart_farm.json", "r", encoding="utf-8") as f:
-    DEFAULT_CONNECTED_DEVICES = json.load(f)
-last_connected_devices = DEFAULT_CONNECTED_DEVICES.copy()
+app.include_router(build_profile_router(lambda: PROFILES))
 
 # Request 모델 정의
 class GenerateJOICodeRequest(BaseModel):
     sentence: str
     model: str
-    connected_devices: Dict[str, Any]
+    connected_devices: Dict[str, Any] = {}
     current_time: str
     other_params: Optional[List[Dict[str, Any]]] = None
+    profile_id: Optional[str] = None
+    use_cache: bool = True  # False면 응답 캐시를 사용하지 않고 항상 새로 생성
+    backend: Optional[str] = None  # 생성 백엔드 (local, openai, stub) - 없으면 기본 백엔드
 
 # 기본 라우트 - html 페이지
 @app.get("/", response_class=HTMLResponse)
@@ -53,26 +95,129 @@ async def read_root(request: Request):
         "current_time": current_time,
     })
 
+# 프로세스 생존 여부 - 리소스 로드와 관계없이 응답
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok", "uptime": round(time.monotonic() - STARTED_AT, 3)}
+
+# 요청 처리 준비 여부 - 모든 구성 요소가 로드되기 전에는 503, 구성 요소 별 상태와 로드 시간(초) 포함
+@app.get("/readyz")
+async def readyz():
+    status = LOADER.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+def resource_stats(name: str):
+    # 아직 로드되지 않은 구성 요소는 None
+    resource = MODEL_RESOURCES.get(name)
+    return resource.stats() if resource is not None else None
+
+# 파이프라인 대기열 및 스테이지 사용 현황
+@app.get("/pipeline_status")
+async def pipeline_status():
+    return {
+        "queue": PIPELINE.stats(),
+        "stages": STAGE_LIMITER.stats(),
+        "generation": {name: backend.stats() for name, backend in list(MODEL_RESOURCES["backends"].items())},
+        "prompt": resource_stats("prompt_assembler"),
+        "translation_cache": TRANSLATION_CACHE.stats(),
+        "deepl": DEEPL_CLIENT.stats(),
+        "encoder": resource_stats("encoder"),
+        "accessor_index": resource_stats("accessor_index"),
+        "profiles": PROFILES.stats(),
+        "response_cache": resource_stats("response_cache"),
+    }
+
+def resolve_profile(request: GenerateJOICodeRequest):
+    # 해시 계산, SQLite 조회/저장, 디바이스 전처리는 이벤트 루프 밖에서 수행
+    if request.profile_id is None:
+        # profile_id 없이 connected_devices를 보내면 저장하지 않는 일회용 프로필 사용, 빈 dict이면 기본 프로필
+        if request.connected_devices:
+            return PROFILES.ephemeral(request.connected_devices)
+        profile_id = DEFAULT_PROFILE_ID
+    else:
+        profile_id = request.profile_id
+        # connected_devices를 함께 보내면 프로필을 교체, 빈 dict이면 저장된 상태 유지
+        if request.connected_devices:
+            return PROFILES.put(profile_id, request.connected_devices)
+    profile = PROFILES.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Unknown device profile: {profile_id}")
+    return profile
+
+def resolve_backend(request: GenerateJOICodeRequest) -> str:
+    name = request.backend or MODEL_RESOURCES["default_backend"]
+    if name not in BACKEND_NAMES:
+        raise HTTPException(status_code=400, detail=f"Unknown generation backend: {name} (available: {', '.join(BACKEND_NAMES)})")
+    # 모델을 로드하는 중이면 클라이언트가 재시도하도록 함
+    if not LOADER.ready(PIPELINE_COMPONENTS + [f"backend:{name}"]):
+        raise HTTPException(status_code=503, detail=f"Resources for backend {name} are still loading", headers={"Retry-After": "5"})
+    return name
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 # JOI 코드 생성 API
 @app.post("/generate_joi_code")
 async def generate_code(request: GenerateJOICodeRequest):
-    global last_connected_devices
+    profile = await asyncio.to_thread(resolve_profile, request)
+    backend = resolve_backend(request)
 
-    # connected_devices가 빈 dict이면 이전 상태 유지
-    if request.connected_devices == {}:
-        connected_devices = last_connected_devices
-    else:
-        connected_devices = request.connected_devices
-        last_connected_devices = connected_devices
-
-    result = generate_joi_code(
-        sentence=request.sentence,
-        # model=request.model,
-        model=MODEL_NAME,  # 모델 이름을 서버에서 고정
-        connected_devices=connected_devices,
-        current_time=request.current_time,
-        other_params=request.other_params,
-        model_resources=MODEL_RESOURCES,
-    )
+    try:
+        result = await PIPELINE.run(
+            generate_joi_code,
+            sentence=request.sentence,
+            # model=request.model,
+            model=MODEL_NAME,  # 모델 이름을 서버에서 고정
+            connected_devices=profile.devices,
+            current_time=request.current_time,
+            other_params=request.other_params,
+            model_resources=MODEL_RESOURCES,
+            profile=profile,
+            use_cache=request.use_cache,
+            backend=backend,
+        )
+    except QueueFullError as e:
+        # 대기열 초과 시 즉시 거절하여 클라이언트가 재시도하도록 함
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except TimeoutError as e:
+        # 외부 생성 API가 요청 제한 시간(openAiDeadline) 안에 응답하지 않음
+        raise HTTPException(status_code=504, detail=str(e))
+
+    return result
+
+# JOI 코드 스트리밍 생성 API (Server-Sent Events)
+# prepared: 번역/디바이스 선택 결과, token: 생성된 텍스트 조각, scenario: 검증이 끝난 시나리오, done: 최종 결과, error: 오류
+@app.post("/generate_joi_code/stream")
+async def generate_code_stream(request: GenerateJOICodeRequest):
+    profile = await asyncio.to_thread(resolve_profile, request)
+    backend = resolve_backend(request)
+
+    try:
+        events = PIPELINE.stream(
+            stream_joi_code,
+            sentence=request.sentence,
+            model=MODEL_NAME,  # 모델 이름을 서버에서 고정
+            connected_devices=profile.devices,
+            current_time=request.current_time,
+            other_params=request.other_params,
+            model_resources=MODEL_RESOURCES,
+            profile=profile,
+            use_cache=request.use_cache,
+            backend=backend,
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
+    async def event_source():
+        try:
+            async for event in events:
+                yield format_sse(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"Streaming generation failed: {e}")
+            yield format_sse("error", {"detail": str(e)})
 
-    return result
\ No newline at end of file
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
\ No newline at end of file
@@ -0,0 +1,62 @@
+import asyncio, uuid
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Dict, Any, Optional, Callable
+
+from .services.device_profiles import ProfileRegistry
+
+# 프로필 생성/교체 요청 - 연결된 디바이스 전체 목록
+class DeviceProfileRequest(BaseModel):
+    connected_devices: Dict[str, Any]
+    profile_id: Optional[str] = None
+
+# 프로필 수정 요청 - 디바이스 ID 별 새 정보, None이면 삭제
+class DeviceProfilePatch(BaseModel):
+    connected_devices: Dict[str, Optional[Dict[str, Any]]]
+
+def build_profile_router(get_registry: Callable[[], ProfileRegistry]) -> APIRouter:
+    """
+    디바이스 프로필 등록 API - 등록한 profile_id로 /generate_joi_code를 호출하면
+    connected_devices를 매번 보내지 않아도 되고, 디바이스 전처리 결과를 재사용합니다.
+    get_registry는 저장소를 반환하며, 저장소는 서버 시작 시(lifespan) 생성됩니다.
+    저장소 호출(SQLite 조회/저장, 디바이스 전처리)은 이벤트 루프 밖의 스레드에서 실행합니다.
+    """
+    router = APIRouter(prefix="/profiles")
+
+    async def get_or_404(profile_id: str):
+        profile = await asyncio.to_thread(get_registry().get, profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail=f"Unknown device profile: {profile_id}")
+        return profile
+
+    @router.post("", status_code=201)
+    async def create_profile(request: DeviceProfileRequest):
+        profile_id = request.profile_id or uuid.uuid4().hex
+        if await asyncio.to_thread(get_registry().get, profile_id) is not None:
+            raise HTTPException(status_code=409, detail=f"Device profile already exists: {profile_id}")
+        profile = await asyncio.to_thread(get_registry().put, profile_id, request.connected_devices)
+        return profile.summary()
+
+    @router.get("/{profile_id}")
+    async def read_profile(profile_id: str):
+        profile = await get_or_404(profile_id)
+        return {**profile.summary(), "connected_devices": dict(profile.devices)}
+
+    @router.put("/{profile_id}")
+    async def replace_profile(profile_id: str, request: DeviceProfileRequest):
+        profile = await asyncio.to_thread(get_registry().put, profile_id, request.connected_devices)
+        return profile.summary()
+
+    @router.patch("/{profile_id}")
+    async def patch_profile(profile_id: str, request: DeviceProfilePatch):
+        profile = await asyncio.to_thread(get_registry().patch, profile_id, request.connected_devices)
+        if profile is None:
+            raise HTTPException(status_code=404, detail=f"Unknown device profile: {profile_id}")
+        return profile.summary()
+
+    @router.delete("/{profile_id}", status_code=204)
+    async def delete_profile(profile_id: str):
+        if not await asyncio.to_thread(get_registry().delete, profile_id):
+            raise HTTPException(status_code=404, detail=f"Unknown device profile: {profile_id}")
+
+    return router
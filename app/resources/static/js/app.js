@@ -75,7 +75,7 @@ class JOICodeGenerator {
                 other_params: null
             };
             
-            const response = await fetch('/generate_joi_code', {
+            const response = await fetch('/generate_joi_code/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(payload)
@@ -85,8 +85,7 @@ class JOICodeGenerator {
                 throw new Error(`서버 오류: ${response.status} - ${response.statusText}`);
             }
             
-            const result = await response.json();
-            this.showResult(result);
+            await this.readStream(response);
             
         } catch (error) {
             this.showError(error.message);
@@ -94,6 +93,59 @@ class JOICodeGenerator {
             this.setLoading(false);
         }
     }
+
+    // SSE 응답을 읽으며 생성 중인 코드와 완성된 시나리오를 바로 표시
+    async readStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let generated = '';
+        const scenarios = [];
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+
+            for (const raw of events) {
+                const event = this.parseEvent(raw);
+                if (!event) continue;
+
+                if (event.name === 'token') {
+                    generated += event.data.text;
+                    this.showProgress(generated, scenarios);
+                } else if (event.name === 'scenario') {
+                    scenarios.push(event.data);
+                    this.showProgress(generated, scenarios);
+                } else if (event.name === 'done') {
+                    this.showResult(event.data);
+                } else if (event.name === 'error') {
+                    throw new Error(`생성 오류: ${event.data.detail}`);
+                }
+            }
+        }
+    }
+
+    parseEvent(raw) {
+        let name = 'message';
+        let data = '';
+        for (const line of raw.split('\n')) {
+            if (line.startsWith('event: ')) name = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+        }
+        return data ? { name, data: JSON.parse(data) } : null;
+    }
+
+    showProgress(generated, scenarios) {
+        const progress = scenarios.length
+            ? `${JSON.stringify(scenarios, null, 2)}\n\n// 생성 중...\n${generated}`
+            : `// 생성 중...\n${generated}`;
+        document.getElementById('generatedCode').textContent = progress;
+        this.resultDiv.style.display = 'block';
+    }
     
     setLoading(isLoading) {
         const btnText = this.generateBtn.querySelector('.btn-text');
@@ -0,0 +1,259 @@
+import re, threading, hashlib
+from collections import OrderedDict
+import numpy as np
+from .embedding import normalize_rows
+from .joi_tool import extract_accessors
+
+# 교정 대상 접근자 종류 - extract_accessors의 블록 이름과 대응
+ACCESSOR_KINDS = {"tag": "Tags", "method": "Methods", "attribute": "Attributes"}
+
+CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+DIGITS = re.compile(r"\d+")
+
+
+def normalize_identifier(name: str) -> str:
+    """
+    대소문자, 밑줄, camelCase 차이를 무시한 비교용 형태를 반환합니다.
+    예: "#livingRoom" -> "livingroom", "switch_turnOn" -> "switchturnon"
+    """
+    return CAMEL_BOUNDARY.sub("", name.lstrip("#")).replace("_", "").lower()
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    인접 문자 교환을 한 번의 편집으로 보는 편집 거리입니다.
+    limit을 넘는 것이 확실해지면 limit + 1을 반환합니다.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(prev[j] + 1, current[j - 1] + 1, prev[j - 1] + cost)
+            if prev2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], prev2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        prev2, prev = prev, current
+    return prev[-1]
+
+
+def lexical_match(name: str, normalized: dict) -> tuple:
+    """
+    표기 차이(대소문자, 밑줄, camelCase)로 설명되는 교정과 짧은 오타로 좁힌 후보를 찾습니다.
+    표기만 다른 후보가 하나면 임베딩 없이 교정하고, 오타 후보는 임베딩 비교에서 우선할 후보로만 사용합니다.
+    숫자가 다른 이름(#bedroom1, #bedroom2)은 서로 다른 대상이므로 오타 후보에서 제외합니다.
+    normalized: {정규화된 이름: [후보 이름]}
+    반환값: (교정된 이름 또는 None, 임베딩 비교에서 우선할 후보 이름 목록)
+    """
+    key = normalize_identifier(name)
+    exact = normalized.get(key)
+    if exact:
+        return (exact[0], []) if len(exact) == 1 else (None, exact)
+
+    # 짧은 이름일수록 허용하는 오타 수를 줄임
+    limit = 1 if len(key) <= 8 else 2
+    digits = DIGITS.findall(key)
+    best, best_distance = [], limit + 1
+    for candidate_key, names in normalized.items():
+        if DIGITS.findall(candidate_key) != digits:
+            continue
+        distance = edit_distance(key, candidate_key, limit)
+        if distance < best_distance:
+            best, best_distance = list(names), distance
+        elif distance == best_distance:
+            best += names
+    return None, best
+
+
+class AccessorIndex:
+    """
+    디바이스 카탈로그의 태그/메서드/속성 이름 임베딩을 로드 시점에 한 번 계산해 둡니다.
+    종류별로 정규화된 행렬 하나와 디바이스 별 행 번호를 가지며,
+    요청 시에는 선택된 디바이스의 행만 골라 내적 한 번으로 후보와 비교합니다.
+    카탈로그에 없는 이름(사용자 태그, 모델이 만든 잘못된 식별자)의 임베딩은 크기 제한 LRU에 보관합니다.
+
+    교정 결과는 (카탈로그 버전, 종류, 식별자, 후보 집합) 단위로 memo에 남겨 요청 간에 재사용하며,
+    표기 차이로 설명되는 경우는 임베딩 없이 어휘 비교로 처리하고, 짧은 오타는 임베딩 비교의 후보를 좁히는 데 사용합니다.
+    """
+    def __init__(self, device_classes: dict, model, max_extra: int = 4096, memo_size: int = 8192):
+        self.model = model
+        self.max_extra = max_extra
+        self.memo_size = memo_size
+
+        accessors = {device: extract_accessors(doc) for device, doc in device_classes.items()}
+        self.names = {}
+        self.rows = {}
+        self.matrix = {}
+        self.device_rows = {}
+        for kind, block in ACCESSOR_KINDS.items():
+            names = sorted({name for info in accessors.values() for name in info.get(block, [])})
+            self.names[kind] = names
+            self.rows[kind] = {name: i for i, name in enumerate(names)}
+            self.matrix[kind] = self._encode(names)
+            self.device_rows[kind] = {
+                device: np.array(sorted({self.rows[kind][name] for name in info.get(block, [])}), dtype=np.int64)
+                for device, info in accessors.items()
+            }
+
+        # 카탈로그 버전 - 이름 목록이 같으면 같은 버전
+        catalog = "\n".join(f"{kind}:{name}" for kind, names in self.names.items() for name in names)
+        self.version = hashlib.sha256(catalog.encode("utf-8")).hexdigest()[:16]
+
+        self._extra = OrderedDict()
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {
+            "encode_calls": 0, "encoded_names": 0,
+            "lookups": 0, "memo_hits": 0, "lexical_hits": 0, "embedding_lookups": 0,
+        }
+
+    def _encode(self, names: list) -> np.ndarray:
+        if not names:
+            return None
+        output = self.model.encode(list(names), return_dense=True, return_sparse=False, return_colbert_vecs=False)
+        vectors = np.asarray(output["dense_vecs"], dtype=np.float32)
+        return normalize_rows(vectors)
+
+    def embed(self, names: list) -> np.ndarray:
+        """
+        카탈로그에 없는 이름들의 정규화된 임베딩을 반환합니다.
+        캐시에 없는 이름은 모아서 한 번에 인코딩합니다.
+        """
+        with self._lock:
+            missing = list(dict.fromkeys(name for name in names if name not in self._extra))
+        if missing:
+            vectors = self._encode(missing)
+            with self._lock:
+                self.metrics["encode_calls"] += 1
+                self.metrics["encoded_names"] += len(missing)
+                for name, vector in zip(missing, vectors):
+                    self._extra[name] = vector
+        with self._lock:
+            result = []
+            for name in names:
+                vector = self._extra.get(name)
+                if vector is None:
+                    # 같은 호출 안에서 LRU에서 밀려난 경우
+                    vector = self._encode([name])[0]
+                else:
+                    self._extra.move_to_end(name)
+                result.append(vector)
+            while len(self._extra) > self.max_extra:
+                self._extra.popitem(last=False)
+        return np.stack(result)
+
+    def candidates(self, kind: str, devices: list, names: list = ()) -> tuple:
+        """
+        선택된 디바이스에 속한 kind 접근자의 (이름 목록, 정규화 행렬)을 반환합니다.
+        names 중 카탈로그에 없는 이름(디바이스 문서에 덧붙인 사용자 태그 등)은 후보에 추가합니다.
+        """
+        device_rows = [self.device_rows[kind][device] for device in devices if device in self.device_rows[kind]]
+        rows = np.unique(np.concatenate(device_rows)) if device_rows else np.zeros(0, dtype=np.int64)
+        candidate_names = [self.names[kind][row] for row in rows]
+        matrix = self.matrix[kind][rows] if len(rows) else None
+
+        extra = [name for name in dict.fromkeys(names) if name not in self.rows[kind]]
+        if extra:
+            extra_matrix = self.embed(extra)
+            candidate_names += extra
+            matrix = extra_matrix if matrix is None else np.vstack([matrix, extra_matrix])
+        return candidate_names, matrix
+
+    def _memo_get(self, key: tuple) -> tuple:
+        with self._lock:
+            if key not in self._memo:
+                return False, None
+            self._memo.move_to_end(key)
+            return True, self._memo[key]
+
+    def _memo_put(self, key: tuple, correction):
+        with self._lock:
+            self._memo[key] = correction
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def correct(self, unknown: dict, candidates: dict, threshold: float) -> dict:
+        """
+        종류별 미확인 식별자를 후보 중 가장 유사한 이름으로 교정합니다.
+        memo -> 어휘 비교 -> 임베딩 비교 순서로 시도하며, 임베딩이 필요한 식별자는 한 번에 인코딩합니다.
+        임베딩 유사도가 threshold 미만이면 교정하지 않습니다.
+        반환값: {kind: {원래 이름: 교정된 이름}}
+        """
+        corrections = {kind: {} for kind in unknown}
+        queries = []
+        counts = {"lookups": 0, "memo_hits": 0, "lexical_hits": 0}
+        for kind, names in unknown.items():
+            candidate_names, matrix = candidates[kind]
+            if matrix is None or not names:
+                continue
+            candidate_key = hash(tuple(candidate_names))
+            normalized = None
+            for name in names:
+                counts["lookups"] += 1
+                key = (self.version, kind, name, candidate_key)
+                hit, correction = self._memo_get(key)
+                if hit:
+                    counts["memo_hits"] += 1
+                else:
+                    if normalized is None:
+                        normalized = {}
+                        for candidate in candidate_names:
+                            normalized.setdefault(normalize_identifier(candidate), []).append(candidate)
+                    correction, narrowed = lexical_match(name, normalized)
+                    if correction is None:
+                        queries.append((kind, name, key, narrowed))
+                        continue
+                    counts["lexical_hits"] += 1
+                    self._memo_put(key, correction)
+                if correction is not None:
+                    corrections[kind][name] = correction
+
+        with self._lock:
+            for name, value in counts.items():
+                self.metrics[name] += value
+            self.metrics["embedding_lookups"] += len(queries)
+        if not queries:
+            return corrections
+
+        vectors = self.embed([name for _, name, _, _ in queries])
+        for kind in corrections:
+            index = [i for i, (k, _, _, _) in enumerate(queries) if k == kind]
+            if not index:
+                continue
+            candidate_names, matrix = candidates[kind]
+            positions = {candidate: row for row, candidate in enumerate(candidate_names)}
+            scores = vectors[index] @ matrix.T
+            for i, row_scores in zip(index, scores):
+                _, name, key, narrowed = queries[i]
+                # 오타로 좁힌 후보를 우선하되 threshold 미만이면 전체 후보에서 다시 고름
+                row = max((positions[n] for n in narrowed), key=row_scores.__getitem__) if narrowed else None
+                if row is None or row_scores[row] < threshold:
+                    row = int(row_scores.argmax())
+                # 교정하지 않는 결과도 memo에 남겨 같은 식별자를 다시 인코딩하지 않음
+                correction = candidate_names[row] if row_scores[row] >= threshold else None
+                self._memo_put(key, correction)
+                if correction is not None:
+                    corrections[kind][name] = correction
+        return corrections
+
+    def stats(self) -> dict:
+        with self._lock:
+            metrics = dict(self.metrics)
+            memo_size = len(self._memo)
+            extra_cached = len(self._extra)
+        lookups = metrics["lookups"]
+        return {
+            "catalog": {kind: len(names) for kind, names in self.names.items()},
+            "catalog_version": self.version,
+            "extra_cached": extra_cached,
+            "memo_size": memo_size,
+            **metrics,
+            "memo_hit_rate": round(metrics["memo_hits"] / lookups, 3) if lookups else 0.0,
+            "lexical_hit_rate": round(metrics["lexical_hits"] / lookups, 3) if lookups else 0.0,
+            "encode_avoided_rate": round(1 - metrics["embedding_lookups"] / lookups, 3) if lookups else 0.0,
+        }
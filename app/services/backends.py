@@ -0,0 +1,253 @@
+import re, time, queue, threading
+from app.config import settings
+from .constrained_decoding import JOIConstraint
+import logging
+logger = logging.getLogger("uvicorn")
+
+# 스텁 백엔드가 호출할 인자 없는 메서드
+NO_ARG_METHOD_PATTERN = re.compile(r"^\s+(\w+)\(\) -> \w+", re.MULTILINE)
+
+
+class ChunkStream:
+    """
+    생성 스레드가 넣은 텍스트 조각을 순서대로 꺼내는 이터레이터 - TextIteratorStreamer와 같은 방식으로 사용합니다.
+    """
+    _END = object()
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, text: str):
+        if text:
+            self._queue.put(text)
+
+    def end(self):
+        self._queue.put(self._END)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is self._END:
+                return
+            yield item
+
+
+def generation_result(text: str, inference_time: float, batch_size: int = 1, prompt_tokens: int = None, cached_tokens: int = 0, speculative: bool = False) -> dict:
+    """
+    백엔드 공통 생성 결과 - 응답 log의 추론 관련 값으로 사용됩니다.
+    """
+    return {
+        "text": text,
+        "inference_time": inference_time,
+        "batch_size": batch_size,
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "speculative": speculative,
+    }
+
+
+class LocalBackend:
+    """
+    로컬 sLLM(unsloth/HF) 백엔드 - 동시 요청은 GenerationBatcher에서 묶어서 생성합니다.
+    """
+    name = "local"
+
+    def __init__(self, model_name: str, tokenizer, stop_token_ids: list, generator, version: str = ""):
+        self.model_name = model_name
+        self.tokenizer = tokenizer
+        self.stop_token_ids = stop_token_ids
+        self.generator = generator
+        self.version = version or model_name
+
+    def build_inputs(self, context: dict) -> tuple:
+        """
+        프롬프트 토큰, 접두부 KV 캐시 조회 정보, 생성 제한(JOIConstraint 또는 None)을 반환합니다.
+        """
+        messages = context["messages"]
+        inputs = self.tokenizer.apply_chat_template(messages, tokenize=True, add_generation_prompt=True, return_tensors="pt")
+
+        # 시스템 프롬프트 접두부 - 선택된 디바이스 집합이 같으면 KV 캐시를 재사용
+        prefix = {
+            "key": (frozenset(context["service_selected"]), hash(context["service_doc"])),
+            "text": self.tokenizer.apply_chat_template(messages[:1], tokenize=False),
+        }
+
+        # 선택된 디바이스의 태그/메서드/속성만 생성하도록 제한 - 모델 서버 호출은 API 워커에서 만든 제한을 사용
+        # (API 워커에서 제한 디코딩을 끈 경우 모델 서버 호출에는 카탈로그가 없으므로 제한하지 않음)
+        constraint = None
+        if self.generator.constrained_decoding is not None:
+            constraint = context.get("constraint")
+            if constraint is None and "device_classes" in context:
+                constraint = JOIConstraint.from_catalog(context["device_classes"], context["service_selected"])
+        return inputs[0], prefix, constraint
+
+    def decode(self, generated_ids) -> str:
+        # stop_token_ids에 해당하는 토큰이 생성된 경우, 해당 인덱스까지 잘라냄
+        stop_indexes = [i for i, tok_id in enumerate(generated_ids) if tok_id in self.stop_token_ids]
+        if stop_indexes:
+            generated_ids = generated_ids[:stop_indexes[0]]
+
+        return self.tokenizer.decode(generated_ids, skip_special_tokens=True).strip()
+
+    def _result(self, generation: dict) -> dict:
+        return generation_result(
+            self.decode(generation["ids"]),
+            generation["inference_time"],
+            batch_size=generation["batch_size"],
+            prompt_tokens=generation["prompt_tokens"],
+            cached_tokens=generation["cached_tokens"],
+            speculative=generation["speculative"],
+        )
+
+    def generate(self, context: dict) -> dict:
+        # 동시 요청과 묶어서 생성 - 배치 대기 및 GPU 슬롯 대기 시간은 추론 시간에서 제외
+        return self._result(self.generator.generate(*self.build_inputs(context)))
+
+    def stream(self, context: dict, cancelled: threading.Event = None) -> tuple:
+        """
+        (텍스트 조각 이터레이터, 생성 결과를 반환하는 함수)를 반환합니다. 함수는 생성 스레드에서 실행해야 합니다.
+        """
+        from transformers import TextIteratorStreamer
+        input_ids, prefix, constraint = self.build_inputs(context)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        return streamer, lambda: self._result(self.generator.stream(input_ids, prefix, streamer, cancelled, constraint))
+
+    def stats(self) -> dict:
+        return {"model": self.model_name, **self.generator.stats()}
+
+
+class RemoteBackend:
+    """
+    모델 서버 프로세스의 로컬 백엔드를 호출합니다 - 배치와 KV 캐시는 모델 서버에서 모든 API 워커의 요청에 대해 처리합니다.
+    생성 제한(JOIConstraint)은 API 워커에서 만들어 함께 보냅니다.
+    """
+    name = "local"
+
+    def __init__(self, client, model_name: str, version: str):
+        self.client = client
+        self.model_name = model_name
+        self.version = version
+
+    def _context(self, context: dict) -> dict:
+        # 모델 서버에 필요한 값만 전달 - 요청 별 카탈로그는 보내지 않음
+        return {
+            "messages": context["messages"],
+            "service_selected": sorted(context["service_selected"]),
+            "service_doc": context["service_doc"],
+            "constraint": JOIConstraint.from_catalog(context["device_classes"], context["service_selected"]) if settings.constrainedDecoding else None,
+        }
+
+    def generate(self, context: dict) -> dict:
+        return self.client.call("generate", context=self._context(context))
+
+    def stream(self, context: dict, cancelled: threading.Event = None) -> tuple:
+        chunks = ChunkStream()
+        remote_context = self._context(context)
+
+        def run() -> dict:
+            try:
+                return self.client.stream("stream", chunks.put, cancelled, context=remote_context)
+            finally:
+                chunks.end()
+        return chunks, run
+
+    def stats(self) -> dict:
+        try:
+            remote = self.client.call("stats")["local"] or {}
+        except Exception as e:
+            remote = {"error": str(e)}
+        return {"model": self.model_name, "model_server": self.client.path, **remote}
+
+
+class OpenAIBackend:
+    """
+    OpenAI 호환 Chat Completions API 백엔드 - 동시 요청 제한, 재시도, deadline은 OpenAIClient에서 처리합니다.
+    """
+    name = "openai"
+
+    def __init__(self, client, model_name: str = "gpt-4.1-mini"):
+        self.client = client
+        self.model_name = model_name
+        self.version = model_name
+
+    @staticmethod
+    def _cached_tokens(usage) -> int:
+        details = getattr(usage, "prompt_tokens_details", None)
+        return (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+
+    def _result(self, text: str, usage, inference_time: float) -> dict:
+        return generation_result(
+            text.strip(),
+            inference_time,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            cached_tokens=self._cached_tokens(usage) if usage else 0,
+        )
+
+    def generate(self, context: dict) -> dict:
+        start = time.perf_counter()
+        response = self.client.create_sync(model=self.model_name, messages=context["messages"])
+        return self._result(response.choices[0].message.content or "", response.usage, time.perf_counter() - start)
+
+    def stream(self, context: dict, cancelled: threading.Event = None) -> tuple:
+        chunks = ChunkStream()
+
+        def run() -> dict:
+            start = time.perf_counter()
+            try:
+                text, usage = self.client.stream_sync(chunks.put, cancelled, model=self.model_name, messages=context["messages"])
+            finally:
+                chunks.end()
+            return self._result(text, usage, time.perf_counter() - start)
+        return chunks, run
+
+    def stats(self) -> dict:
+        return {"model": self.model_name, **self.client.stats()}
+
+
+class StubBackend:
+    """
+    테스트와 부하 시험용 결정적 백엔드 - 모델을 호출하지 않습니다.
+    response가 있으면 항상 그 문자열을, 없으면 선택된 디바이스마다 인자 없는 첫 메서드를 호출하는 시나리오를 반환합니다.
+    """
+    name = "stub"
+
+    def __init__(self, response: str = ""):
+        self.response = response
+        self.model_name = "stub"
+        self.version = f"stub:{response}"
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0}
+
+    def render(self, context: dict) -> str:
+        if self.response:
+            return self.response
+        calls = []
+        for device in sorted(context["service_selected"]):
+            method = NO_ARG_METHOD_PATTERN.search(context["device_classes"][device])
+            if method:
+                calls.append(f"(#{device}).{method.group(1)}()")
+        body = "\n".join(calls[:1])
+        return f'```\nname = "Scenario1"\ncron = ""\nperiod = -1\n{body}\n```'
+
+    def generate(self, context: dict) -> dict:
+        start = time.perf_counter()
+        with self._lock:
+            self.counters["requests"] += 1
+        return generation_result(self.render(context), time.perf_counter() - start)
+
+    def stream(self, context: dict, cancelled: threading.Event = None) -> tuple:
+        chunks = ChunkStream()
+
+        def run() -> dict:
+            try:
+                result = self.generate(context)
+                for line in result["text"].splitlines(keepends=True):
+                    chunks.put(line)
+            finally:
+                chunks.end()
+            return result
+        return chunks, run
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"model": self.model_name, **self.counters}
@@ -0,0 +1,281 @@
+import threading, time, queue, torch
+from concurrent.futures import Future
+from transformers import StoppingCriteria, StoppingCriteriaList, LogitsProcessor, LogitsProcessorList
+from .executor import stage
+from .constrained_decoding import ConstrainedDecoding
+import logging
+logger = logging.getLogger("uvicorn")
+
+
+class CancelledCriteria(StoppingCriteria):
+    """
+    스트리밍 클라이언트의 연결이 끊어지면 생성을 중단합니다.
+    """
+    def __init__(self, cancelled):
+        self.cancelled = cancelled
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.cancelled.is_set()
+
+
+class JOILogitsProcessor(LogitsProcessor):
+    """
+    배치의 각 행을 해당 요청의 JOIConstraint로 제한합니다 (constraint가 None인 행은 제한하지 않음).
+    최상위 토큰만 확인하므로 greedy 디코딩에서 사용합니다 (constrainedDecoding을 켜면 로더가 greedy 디코딩으로 설정).
+    최상위 토큰이 구조를 벗어날 때만 상위 max_candidates개 중 허용되는 토큰으로 제한하며,
+    허용되는 후보가 없으면 제한하지 않고 이후 검증 단계에 맡깁니다.
+    """
+    def __init__(self, decoding: ConstrainedDecoding, constraints: list, prompt_length: int):
+        self.decoding = decoding
+        self.constraints = constraints
+        self.prompt_length = prompt_length
+        self._generated = [([], []) for _ in constraints]   # 행 별 (생성된 토큰, 각 토큰까지의 생성 상태)
+
+    def _state(self, row: int, ids: list) -> tuple:
+        # 새로 생성된 토큰만 상태에 반영
+        # 추측 디코딩에서는 초안이 거절되면 길이가 줄어들 수 있으므로 공통 접두부의 상태부터 이어감
+        constraint = self.constraints[row]
+        cached_ids, states = self._generated[row]
+        common = 0
+        for old, new in zip(cached_ids, ids):
+            if old != new:
+                break
+            common += 1
+        del cached_ids[common:], states[common:]
+        state = states[-1] if states else constraint.START
+        for token_id in ids[common:]:
+            state = constraint.advance(state, self.decoding.piece(token_id))
+            cached_ids.append(token_id)
+            states.append(state)
+        return state
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        steps = forced = unconstrained = 0
+        for row, constraint in enumerate(self.constraints):
+            if constraint is None:
+                continue
+            steps += 1
+            state = self._state(row, input_ids[row, self.prompt_length:].tolist())
+            candidates = torch.topk(scores[row], min(self.decoding.max_candidates, scores.shape[-1])).indices.tolist()
+            if constraint.accepts(state, self.decoding.piece(candidates[0])):
+                continue
+
+            allowed = [t for t in candidates[1:] if constraint.accepts(state, self.decoding.piece(t))]
+            if not allowed:
+                unconstrained += 1
+                continue
+            forced += 1
+            masked = torch.full_like(scores[row], float("-inf"))
+            masked[allowed] = scores[row, allowed]
+            scores[row] = masked
+        if steps:
+            self.decoding.count(steps, forced, unconstrained)
+        return scores
+
+
+class GenerationBatcher:
+    """
+    동시에 들어온 프롬프트를 짧은 대기 시간 동안 모아 하나의 generate 호출로 처리합니다.
+    프롬프트는 왼쪽 패딩으로 정렬되며, 각 결과는 요청한 호출자에게 Future로 전달됩니다.
+
+    speculative_kwargs가 있으면 단독 처리 시 추측 디코딩(prompt lookup 또는 draft 모델)을 사용합니다.
+    greedy 디코딩에서는 결과가 같고, 실패하면 일반 디코딩으로 전환합니다.
+
+    constrained_decoding이 있으면 요청 별 JOIConstraint로 JOI 코드 구조와 접근자 이름을 벗어나는 토큰을 제한합니다.
+    """
+    def __init__(self, model, tokenizer, stop_token_ids: list, max_batch_size: int = 4, max_wait_ms: int = 20, generate_kwargs: dict = None, prefix_cache=None, speculative_kwargs: dict = None, constrained_decoding=None):
+        self.model = model
+        self.prefix_cache = prefix_cache
+        self.constrained_decoding = constrained_decoding
+        self.stop_token_ids = stop_token_ids
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else stop_token_ids[0]
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.generate_kwargs = generate_kwargs or {}
+
+        # 추측 디코딩 - 본 모델의 forward 횟수로 초안 토큰 채택 수를 계산
+        self.speculative_kwargs = speculative_kwargs or {}
+        self.speculative_enabled = bool(self.speculative_kwargs)
+        self._forward_count = threading.local()
+        self._metrics_lock = threading.Lock()
+        self.metrics = {"speculative_runs": 0, "plain_runs": 0, "generated_tokens": 0, "forward_passes": 0, "fallbacks": 0}
+        if self.speculative_enabled:
+            model.register_forward_hook(self._count_forward)
+
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._loop, name="joi-generation-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, input_ids, prefix: dict = None, constraint=None) -> Future:
+        """
+        프롬프트 토큰(1차원)을 제출하고 생성 결과를 담을 Future를 반환합니다.
+        prefix는 {"key": 접두부 캐시 키, "text": 시스템 프롬프트 접두부 문자열} 형태로, 단독 처리 시 KV 캐시 재사용에 쓰입니다.
+        constraint(JOIConstraint)가 있으면 해당 요청의 생성 토큰을 제한합니다.
+        결과는 {"ids": 생성된 토큰(프롬프트 제외), "batch_size": 함께 처리된 요청 수, "prompt_tokens": 프롬프트 토큰 수, "inference_time": 초, "cached_tokens": 재사용한 접두부 토큰 수} 형태입니다.
+        """
+        future = Future()
+        self._queue.put((torch.as_tensor(input_ids, dtype=torch.long).view(-1), prefix, constraint, future))
+        return future
+
+    def generate(self, input_ids, prefix: dict = None, constraint=None) -> dict:
+        return self.submit(input_ids, prefix, constraint).result()
+
+    def _collect(self) -> list:
+        # 첫 요청이 올 때까지 대기한 뒤, max_wait 동안 추가 요청을 모음
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def stream(self, input_ids, prefix: dict = None, streamer=None, cancelled=None, constraint=None) -> dict:
+        """
+        배치를 거치지 않고 호출한 스레드에서 단독으로 생성합니다.
+        생성된 토큰은 streamer로 전달되며, cancelled(threading.Event)가 설정되면 생성을 중단합니다.
+        """
+        ids = torch.as_tensor(input_ids, dtype=torch.long).view(-1)
+        try:
+            return self._generate([(ids, prefix, constraint)], streamer=streamer, cancelled=cancelled)[0]
+        except Exception:
+            # 생성 실패 시에도 streamer를 소비하는 쪽이 멈추지 않도록 종료 신호 전달
+            if streamer is not None:
+                streamer.end()
+            raise
+
+    def _count_forward(self, module, args, output):
+        if getattr(self._forward_count, "active", False):
+            self._forward_count.value += 1
+
+    def stats(self) -> dict:
+        """
+        추측 디코딩 통계 - acceptance_rate는 생성 토큰 중 초안에서 채택된 토큰의 비율,
+        tokens_per_forward는 본 모델 forward 한 번에 확정된 평균 토큰 수입니다.
+        """
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        generated = metrics["generated_tokens"]
+        forwards = metrics["forward_passes"]
+        return {
+            "speculative": self.speculative_enabled,
+            "mode": "draft" if "assistant_model" in self.speculative_kwargs else "prompt_lookup" if self.speculative_kwargs else "off",
+            **metrics,
+            "accepted_tokens": generated - forwards,
+            "acceptance_rate": round((generated - forwards) / generated, 3) if generated else 0.0,
+            "tokens_per_forward": round(generated / forwards, 3) if forwards else 0.0,
+            "constrained": self.constrained_decoding.stats() if self.constrained_decoding is not None else None,
+        }
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self._generate([(ids, prefix, constraint) for ids, prefix, constraint, _ in batch])
+            except Exception as e:
+                logger.error(f"Batched generation failed: {e}")
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (*_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _generate(self, items: list, streamer=None, cancelled=None) -> list:
+        max_len = max(len(ids) for ids, *_ in items)
+        input_ids = torch.full((len(items), max_len), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(items), max_len), dtype=torch.long)
+        for row, (ids, *_) in enumerate(items):
+            input_ids[row, max_len - len(ids):] = ids
+            attention_mask[row, max_len - len(ids):] = 1
+
+        extra_kwargs = {}
+        if streamer is not None:
+            extra_kwargs["streamer"] = streamer
+        if cancelled is not None:
+            extra_kwargs["stopping_criteria"] = StoppingCriteriaList([CancelledCriteria(cancelled)])
+
+        # 추측 디코딩은 transformers에서 배치 크기 1만 지원
+        speculative = len(items) == 1 and self.speculative_enabled
+
+        with stage("gpu"):
+            start = time.perf_counter()
+            outputs, cached_tokens, speculative = self._run_generate(items, input_ids, attention_mask, extra_kwargs, speculative, streamer)
+            elapsed = time.perf_counter() - start
+
+        if len(items) > 1:
+            logger.info(f"Generated batch of {len(items)} prompts in {elapsed:.3f} seconds")
+
+        return [{
+            "ids": outputs[row][max_len:].cpu(),
+            "batch_size": len(items),
+            "prompt_tokens": len(items[row][0]),
+            "inference_time": elapsed,
+            "cached_tokens": cached_tokens,
+            "speculative": speculative,
+        } for row in range(len(items))]
+
+    def _run_generate(self, items: list, input_ids, attention_mask, extra_kwargs: dict, speculative: bool, streamer) -> tuple:
+        def run(use_speculative: bool):
+            kwargs = dict(extra_kwargs)
+            # 왼쪽 패딩으로 접두부 위치가 어긋나므로, 접두부 KV 캐시는 단독 처리 시에만 재사용
+            # (generate가 캐시를 수정하므로 시도할 때마다 새로 조회)
+            cached_tokens = 0
+            ids, prefix, _ = items[0]
+            if len(items) == 1 and prefix and self.prefix_cache is not None:
+                kwargs["past_key_values"], cached_tokens = self.prefix_cache.lookup(ids, prefix["key"], prefix["text"])
+            # 행 별 생성 상태를 가지므로 시도할 때마다 새 processor 사용
+            constraints = [constraint for *_, constraint in items]
+            if self.constrained_decoding is not None and any(c is not None for c in constraints):
+                kwargs["logits_processor"] = LogitsProcessorList([
+                    JOILogitsProcessor(self.constrained_decoding, constraints, input_ids.shape[1])
+                ])
+            if use_speculative:
+                kwargs.update(self.speculative_kwargs)
+
+            self._forward_count.value = 0
+            self._forward_count.active = use_speculative
+            try:
+                outputs = self.model.generate(
+                    input_ids=input_ids.to(self.model.device),
+                    attention_mask=attention_mask.to(self.model.device),
+                    eos_token_id=self.stop_token_ids,
+                    pad_token_id=self.pad_token_id,
+                    **self.generate_kwargs,
+                    **kwargs,
+                )
+            finally:
+                self._forward_count.active = False
+
+            with self._metrics_lock:
+                if use_speculative:
+                    self.metrics["speculative_runs"] += 1
+                    self.metrics["generated_tokens"] += outputs.shape[1] - input_ids.shape[1]
+                    self.metrics["forward_passes"] += self._forward_count.value
+                else:
+                    self.metrics["plain_runs"] += 1
+            return outputs, cached_tokens
+
+        if not speculative:
+            return (*run(False), False)
+        try:
+            return (*run(True), True)
+        except (TypeError, ValueError) as e:
+            # 추측 디코딩 인자를 지원하지 않는 모델/설정이면(generate의 인자 검사 오류) 이후 요청부터 일반 디코딩 사용
+            logger.warning(f"Speculative decoding is not supported, disabling it: {e}")
+            self.speculative_enabled = False
+            error = e
+        except Exception as e:
+            # OOM 등 그 밖의 오류는 이번 요청만 일반 디코딩으로 다시 시도
+            logger.warning(f"Speculative decoding failed, retrying this request with plain decoding: {e}")
+            error = e
+        with self._metrics_lock:
+            self.metrics["fallbacks"] += 1
+        # 이미 토큰을 내보낸 스트리밍 요청은 다시 생성하지 않음
+        if streamer is not None:
+            raise error
+        return (*run(False), False)
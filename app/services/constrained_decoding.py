@@ -0,0 +1,199 @@
+import re, threading
+
+# 시나리오 헤더 - 구분자('---') 이후 처음 세 줄
+HEADER_PARTS = [
+    ["n", "a", "m", "e", r"\s*", "=", r"\s*", '"', r'[^"\n]*', '"', r"\s*"],
+    ["c", "r", "o", "n", r"\s*", "=", r"\s*", '"', r'[^"\n]*', '"', r"\s*"],
+    ["p", "e", "r", "i", "o", "d", r"\s*", "=", r"\s*", "-?", r"\d+", r"\s*"],
+]
+
+def prefix_pattern(parts: list) -> re.Pattern:
+    """
+    parts를 이어 붙인 패턴과 일치하는 문자열의 앞부분(생성 중인 줄)과 일치하는 패턴
+    """
+    pattern = ""
+    for part in reversed(parts):
+        pattern = f"(?:{part}{pattern})?"
+    return re.compile(pattern)
+
+HEADER_PATTERNS = [(re.compile("".join(parts)), prefix_pattern(parts)) for parts in HEADER_PARTS]
+# 코드 본문의 접근자 - '#' 뒤의 태그, ')' 뒤 '.'의 메서드/속성
+TAG_PATTERN = re.compile(r"#(\w*)")
+MEMBER_PATTERN = re.compile(r"\)\s*\.(\w*)")
+STRING_PATTERN = re.compile(r'"[^"\n]*("|$)')
+# 주석 - '//' 또는 공백/줄 끝이 뒤따르는 '#' (parse_scenarios와 같은 규칙)
+COMMENT_PATTERN = re.compile(r"//|#(?=\s|$)")
+
+
+class IdentifierTrie:
+    """
+    허용된 식별자의 문자 단위 트라이 - 생성 중인 식별자가 어떤 식별자의 앞부분인지 확인합니다.
+    """
+    END = None
+
+    def __init__(self, words):
+        self.root = {}
+        for word in words:
+            node = self.root
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[self.END] = True
+
+    def _walk(self, prefix: str):
+        node = self.root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def has_prefix(self, prefix: str) -> bool:
+        return self._walk(prefix) is not None
+
+    def __contains__(self, word: str) -> bool:
+        node = self._walk(word)
+        return node is not None and self.END in node
+
+
+class JOIConstraint:
+    """
+    한 요청의 생성 결과가 따라야 하는 JOI 코드 구조입니다.
+    - 코드 블록 안의 각 시나리오는 name/cron/period 헤더로 시작하고 '---'로 구분
+    - '#' 뒤에는 선택된 디바이스의 태그, ')' 뒤 '.' 다음에는 선택된 디바이스의 메서드/속성만 허용
+    코드 블록 밖의 텍스트와 문자열 리터럴, 주석은 제한하지 않습니다.
+    """
+    def __init__(self, tags, members):
+        self.tags = IdentifierTrie(tags)
+        self.members = IdentifierTrie(members)
+
+    @classmethod
+    def from_catalog(cls, device_classes, service_selected) -> "JOIConstraint":
+        """
+        요청의 CatalogOverlay에서 선택된 디바이스의 접근자로 트라이를 만듭니다.
+        """
+        tags, members = set(), set()
+        for device in service_selected:
+            if device not in device_classes:
+                continue
+            accessors = device_classes.accessors(device)
+            tags.update(tag.lstrip("#") for tag in accessors["Tags"])
+            members.update(accessors["Methods"])
+            members.update(accessors["Attributes"])
+        return cls(tags, members)
+
+    # 생성 상태 - (코드 블록 안 여부, 현재 시나리오의 헤더 줄 수, 생성 중인 마지막 줄)
+    START = (False, 0, "")
+
+    @staticmethod
+    def _close_line(in_code: bool, header: int, stripped: str) -> tuple:
+        if stripped.startswith("```"):
+            return not in_code, 0
+        if in_code and stripped == "---":
+            return in_code, 0
+        if in_code and header < 3 and stripped:
+            return in_code, header + 1
+        return in_code, header
+
+    def advance(self, state: tuple, piece: str) -> tuple:
+        """
+        state 뒤에 piece를 이어 붙인 상태를 반환합니다. 완성된 줄만 다시 읽으므로 생성된 전체 텍스트를 매번 훑지 않습니다.
+        """
+        in_code, header, line = state
+        lines = (line + piece).split("\n")
+        for complete in lines[:-1]:
+            in_code, header = self._close_line(in_code, header, complete.strip())
+        return in_code, header, lines[-1]
+
+    def scan(self, text: str) -> tuple:
+        return self.advance(self.START, text)
+
+    def accepts(self, state: tuple, piece: str) -> bool:
+        """
+        state(이미 생성된 텍스트의 상태) 뒤에 piece를 이어 붙여도 구조를 벗어나지 않는지 확인합니다.
+        """
+        in_code, header, line = state
+        new_from = len(line)
+        lines = (line + piece).split("\n")
+        for i, line in enumerate(lines):
+            complete = i < len(lines) - 1
+            stripped = line.strip()
+            if stripped.startswith("```") or (in_code and not complete and "```".startswith(stripped)):
+                pass
+            elif in_code and header < 3:
+                if not self._header_ok(line, header, complete):
+                    return False
+            elif in_code and not self._body_ok(line, complete, new_from):
+                return False
+
+            if complete:
+                in_code, header = self._close_line(in_code, header, stripped)
+            new_from = 0
+        return True
+
+    def _header_ok(self, line: str, header: int, complete: bool) -> bool:
+        stripped = line.strip()
+        if not stripped:
+            # 헤더 사이의 빈 줄은 parse_scenarios에서 헤더를 잘못 읽게 함
+            return header == 0 or not complete
+        if header == 0 and "---".startswith(stripped):
+            return True
+        full, partial = HEADER_PATTERNS[header]
+        if complete:
+            return full.fullmatch(stripped) is not None
+        return partial.fullmatch(line.lstrip()) is not None
+
+    def _body_ok(self, line: str, complete: bool, new_from: int) -> bool:
+        # 문자열 리터럴과 주석은 검사하지 않음
+        code = STRING_PATTERN.sub(lambda m: " " * len(m.group()), line)
+        comment = COMMENT_PATTERN.search(code)
+        if comment is not None:
+            code = code[:comment.start()]
+        for pattern, trie in ((TAG_PATTERN, self.tags), (MEMBER_PATTERN, self.members)):
+            for match in pattern.finditer(code):
+                name_end = match.end(1)
+                if name_end < new_from:
+                    continue
+                if name_end == len(code) and not complete and len(code) == len(line):
+                    if not trie.has_prefix(match.group(1)):
+                        return False
+                elif match.group(1) not in trie:
+                    return False
+        return True
+
+
+class ConstrainedDecoding:
+    """
+    생성 스케줄러가 요청 별 JOIConstraint로 로짓을 제한할 때 공유하는 토큰 문자열 캐시와 통계입니다.
+    """
+    def __init__(self, tokenizer, max_candidates: int = 32):
+        self.tokenizer = tokenizer
+        self.max_candidates = max_candidates
+        self.special_ids = set(tokenizer.all_special_ids)
+        self._pieces = {}
+        self._lock = threading.Lock()
+        self.counters = {"steps": 0, "forced": 0, "unconstrained": 0}
+
+    def piece(self, token_id: int) -> str:
+        text = self._pieces.get(token_id)
+        if text is None:
+            if token_id in self.special_ids:
+                text = ""
+            else:
+                try:
+                    text = self.tokenizer.decode([token_id])
+                except Exception:
+                    text = ""
+            self._pieces[token_id] = text
+        return text
+
+    def count(self, steps: int, forced: int, unconstrained: int):
+        with self._lock:
+            self.counters["steps"] += steps
+            self.counters["forced"] += forced
+            self.counters["unconstrained"] += unconstrained
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        stats["forced_rate"] = round(stats["forced"] / stats["steps"], 3) if stats["steps"] else 0.0
+        return stats
@@ -0,0 +1,162 @@
+import asyncio, threading, time
+import httpx
+import logging
+logger = logging.getLogger("uvicorn")
+
+# 차단기에 실패로 기록하는 4xx 응답 - 429(요청 과다), 403(인증 키 오류), 456(사용량 초과)
+FAILURE_STATUS = {403, 429, 456}
+
+
+class CircuitBreaker:
+    """
+    연속 실패가 failure_threshold에 도달하면 cooldown 동안 호출을 차단합니다.
+    cooldown이 지나면 한 번의 시험 호출을 허용하고, 성공하면 다시 정상 상태로 돌아갑니다.
+    """
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return "open"
+            return "half-open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """
+        결과 없이 끝난 시험 호출(취소 등)을 정리합니다. 상태는 바꾸지 않으며, 다음 호출이 다시 시험 호출이 됩니다.
+        """
+        with self._lock:
+            self._trial_running = False
+
+
+class DeepLClient:
+    """
+    연결 풀을 공유하는 비동기 DeepL 클라이언트입니다.
+    동기 코드(파이프라인 스레드)에서는 translate_sync로 전용 이벤트 루프에 요청을 위임합니다.
+    실패하거나 차단된 경우 None을 반환하며, 호출하는 쪽에서 원문을 유지합니다.
+    """
+    def __init__(self, url: str, auth_key: str, timeout: float = 2.0, max_connections: int = 10, breaker: CircuitBreaker = None):
+        self.url = url
+        self.auth_key = auth_key
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.breaker = breaker or CircuitBreaker()
+
+        self._client = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.metrics = {"requests": 0, "errors": 0, "timeouts": 0, "short_circuited": 0, "latency_total": 0.0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                headers={"Authorization": f"DeepL-Auth-Key {self.auth_key}"},
+            )
+        return self._client
+
+    def _count(self, name: str, value=1):
+        with self._metrics_lock:
+            self.metrics[name] += value
+
+    async def translate(self, texts: list, source: str, target: str):
+        """
+        texts를 한 번의 요청으로 번역합니다. 실패 시 None을 반환합니다.
+        """
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            return None
+
+        data = {"source_lang": source, "target_lang": target, "text": list(texts)}
+        start = time.perf_counter()
+        self._count("requests")
+        # 어떤 경로로 끝나든(취소 포함) 차단기의 시험 호출을 정리
+        outcome = None
+        try:
+            # httpx의 timeout은 연결, 읽기 등 단계별 제한이므로 요청 전체에 제한 시간을 따로 적용
+            response = await asyncio.wait_for(self._get_client().post(self.url, data=data), self.timeout)
+            if response.status_code != 200:
+                self._count("errors")
+                # 요청 자체의 문제(4xx)는 서비스 장애로 보지 않음 - 이후 요청도 실패하는 FAILURE_STATUS는 제외
+                outcome = "failure" if response.status_code in FAILURE_STATUS or response.status_code >= 500 else "success"
+                logger.warning(f"DeepL error: {response.status_code}, {response.text}")
+                return None
+            translations = [t["text"] for t in response.json()["translations"]]
+            outcome = "success"
+            return translations
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            self._count("timeouts")
+            outcome = "failure"
+            logger.warning(f"DeepL request timed out after {self.timeout} seconds")
+            return None
+        except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+            # 연결 실패, 응답 형식 오류
+            self._count("errors")
+            outcome = "failure"
+            logger.warning(f"DeepL request failed: {e}")
+            return None
+        finally:
+            self._count("latency_total", time.perf_counter() - start)
+            if outcome == "success":
+                self.breaker.record_success()
+            elif outcome == "failure":
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="deepl-client", daemon=True).start()
+        return self._loop
+
+    def translate_sync(self, texts: list, source: str, target: str):
+        future = asyncio.run_coroutine_threadsafe(self.translate(texts, source, target), self._ensure_loop())
+        return future.result()
+
+    def stats(self) -> dict:
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        requests = metrics["requests"]
+        return {
+            "state": self.breaker.state,
+            "requests": requests,
+            "errors": metrics["errors"],
+            "timeouts": metrics["timeouts"],
+            "short_circuited": metrics["short_circuited"],
+            "error_rate": round((metrics["errors"] + metrics["timeouts"]) / requests, 3) if requests else 0.0,
+            "avg_latency": round(metrics["latency_total"] / requests, 3) if requests else 0.0,
+        }
@@ -0,0 +1,149 @@
+import re, hashlib
+from dataclasses import dataclass
+from types import MappingProxyType
+from collections.abc import Mapping
+from .joi_tool import extract_accessors
+
+ENUM_BLOCK_PATTERN = re.compile(r"Enums:\n((?:\s+\w+: \[[^\]]+\]\n*)+)")
+ENUM_LINE_PATTERN = re.compile(r"(\w+): \[([^\]]+)\]")
+# 디바이스 설명 중 Enums 이전 부분(이름, 태그) - Speaker 요약에 사용
+SUMMARY_PATTERN = re.compile(r'Device\s+\w+:(?:.*?\n)*?(?=^\s*Enums:)', re.MULTILINE)
+# 디바이스 설명에서 사용자 태그를 넣을 위치 - "Device X:", '"""', "Tags:", 디바이스 태그 다음 줄
+TAG_INSERT_LINE = 4
+
+
+@dataclass(frozen=True, slots=True)
+class DeviceSchema:
+    """
+    서비스 목록의 디바이스 하나를 로드 시점에 파싱해 둔 불변 객체입니다.
+    head/tail은 사용자 태그를 넣을 위치를 기준으로 나눈 설명 문자열입니다.
+    """
+    name: str
+    doc: str
+    tags: tuple
+    enums: tuple        # ((enum 이름, (값, ...)), ...)
+    attributes: tuple
+    methods: tuple
+    head: str
+    tail: str
+    summary_tail: str   # Enums 이전 부분 중 head 이후 - 없으면 None
+
+    @classmethod
+    def compile(cls, name: str, doc: str) -> "DeviceSchema":
+        accessors = extract_accessors(doc)
+        enum_block = ENUM_BLOCK_PATTERN.search(doc)
+        enums = tuple(
+            (enum_name, tuple(value.strip() for value in values.split(",")))
+            for enum_name, values in ENUM_LINE_PATTERN.findall(enum_block.group(1))
+        ) if enum_block else ()
+
+        lines = doc.splitlines()
+        summary = SUMMARY_PATTERN.search(doc)
+        summary_tail = None
+        if summary:
+            summary_tail = "\n".join(summary.group().strip().splitlines()[TAG_INSERT_LINE:])
+
+        return cls(
+            name=name,
+            doc=doc,
+            tags=tuple(accessors.get("Tags", [])),
+            enums=enums,
+            attributes=tuple(accessors.get("Attributes", [])),
+            methods=tuple(accessors.get("Methods", [])),
+            head="\n".join(lines[:TAG_INSERT_LINE]),
+            tail="\n".join(lines[TAG_INSERT_LINE:]),
+            summary_tail=summary_tail,
+        )
+
+    def render(self, extra_tags: tuple = ()) -> str:
+        """
+        사용자 태그를 디바이스 태그 아래에 추가한 설명을 반환합니다.
+        """
+        if not extra_tags:
+            return self.doc
+        return "\n".join([self.head, *(f"    #{tag}" for tag in extra_tags), self.tail])
+
+    def render_summary(self, extra_tags: tuple = ()) -> str:
+        """
+        Enums 이전 부분(이름, 태그)만 반환합니다. 해당 부분이 없으면 None을 반환합니다.
+        """
+        if self.summary_tail is None:
+            return None
+        parts = [self.head, *(f"    #{tag}" for tag in extra_tags)]
+        if self.summary_tail:
+            parts.append(self.summary_tail)
+        return "\n".join(parts)
+
+
+class DeviceCatalog(Mapping):
+    """
+    디바이스 이름 -> DeviceSchema 의 읽기 전용 매핑입니다. 로드 시점에 한 번만 만들고 모든 요청이 공유합니다.
+    """
+    def __init__(self, device_classes: dict):
+        self._schemas = MappingProxyType({
+            name: DeviceSchema.compile(name, doc) for name, doc in device_classes.items()
+        })
+        # 설명 문자열에서 파생한 값(토큰 수 등)을 캐시할 때 쓰는 카탈로그 버전
+        digest = hashlib.sha256()
+        for name, schema in self._schemas.items():
+            digest.update(f"{name}\0{schema.doc}\0".encode("utf-8"))
+        self.version = digest.hexdigest()[:16]
+
+    def __getitem__(self, name: str) -> DeviceSchema:
+        return self._schemas[name]
+
+    def __iter__(self):
+        return iter(self._schemas)
+
+    def __len__(self) -> int:
+        return len(self._schemas)
+
+    def overlay(self, tag_device: dict) -> "CatalogOverlay":
+        return CatalogOverlay(self, tag_device)
+
+
+class CatalogOverlay(Mapping):
+    """
+    요청 별 사용자 태그를 카탈로그 위에 얹은 디바이스 이름 -> 설명 문자열 매핑입니다.
+    카탈로그를 복사하지 않으며, 설명 문자열은 처음 조회할 때 만들어 둡니다.
+    """
+    __slots__ = ("catalog", "extra_tags", "_rendered")
+
+    def __init__(self, catalog: DeviceCatalog, tag_device: dict):
+        self.catalog = catalog
+        self.extra_tags = {
+            device: tuple(sorted(set(tags))) for device, tags in tag_device.items() if device in catalog
+        }
+        self._rendered = {}
+
+    def __getitem__(self, name: str) -> str:
+        doc = self._rendered.get(name)
+        if doc is None:
+            doc = self.catalog[name].render(self.extra_tags.get(name, ()))
+            self._rendered[name] = doc
+        return doc
+
+    def __iter__(self):
+        return iter(self.catalog)
+
+    def __len__(self) -> int:
+        return len(self.catalog)
+
+    def __contains__(self, name) -> bool:
+        return name in self.catalog
+
+    def summary(self, name: str) -> str:
+        if name not in self.catalog:
+            return None
+        return self.catalog[name].render_summary(self.extra_tags.get(name, ()))
+
+    def accessors(self, name: str) -> dict:
+        """
+        extract_accessors(self[name])와 같은 결과를 설명 문자열을 파싱하지 않고 반환합니다.
+        """
+        schema = self.catalog[name]
+        return {
+            "Tags": list(schema.tags) + [f"#{tag}" for tag in self.extra_tags.get(name, ())],
+            "Attributes": list(schema.attributes),
+            "Methods": list(schema.methods),
+        }
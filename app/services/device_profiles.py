@@ -0,0 +1,208 @@
+import os, json, time, sqlite3, hashlib, threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from collections import OrderedDict
+import numpy as np
+from .joi_tool import extract_device_tags
+
+
+def profile_hash(connected_devices: dict) -> str:
+    """
+    연결된 디바이스 목록의 내용 해시 - 키 순서와 공백에 영향을 받지 않음
+    """
+    payload = json.dumps(connected_devices, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def derive_device_state(connected_devices: dict, device_catalog, retrieval_keys: list) -> dict:
+    """
+    연결된 디바이스 목록으로부터 요청 처리에 필요한 정보를 계산합니다.
+    - tag_device, tag_sets: extract_device_tags 결과
+    - device_classes: 사용자 태그를 얹은 디바이스 설명 (CatalogOverlay)
+    - available: 사용 가능한 디바이스 이름 목록
+    - retrieval_mask: 검색 인덱스 문서 중 사용 가능한 디바이스 표시 (hybrid_recommend에 전달)
+    """
+    tag_device, tag_sets = extract_device_tags(connected_devices, device_catalog)
+    available = list(tag_device.keys())
+    available_set = {device.lower() for device in available}
+    return {
+        "tag_device": tag_device,
+        "tag_sets": tag_sets,
+        "device_classes": device_catalog.overlay(tag_device),
+        "available": available,
+        "retrieval_mask": np.array([key.lower() in available_set for key in retrieval_keys], dtype=bool),
+    }
+
+
+@dataclass(frozen=True, slots=True)
+class DeviceProfile:
+    profile_id: str
+    devices: MappingProxyType
+    content_hash: str
+    updated_at: float
+    state: dict
+
+    def summary(self) -> dict:
+        return {
+            "profile_id": self.profile_id,
+            "content_hash": self.content_hash,
+            "num_devices": len(self.devices),
+            "updated_at": self.updated_at,
+        }
+
+
+class ProfileRegistry:
+    """
+    집(프로필) 별 연결된 디바이스 목록을 서버에 저장하고, 내용 해시 별로 파생 정보를 캐시합니다.
+    - SQLite: 워커 프로세스 간에 공유되는 프로필 원본 (path가 빈 문자열이면 메모리만 사용)
+    - 메모리: 최근 사용한 프로필과 해시 별 파생 정보 LRU
+    조회 시 SQLite의 해시와 비교하므로 다른 워커에서 갱신한 프로필도 바로 반영됩니다.
+    """
+    def __init__(self, device_catalog, retrieval_keys: list, path: str = "", cache_size: int = 256):
+        self.device_catalog = device_catalog
+        self.retrieval_keys = list(retrieval_keys)
+        self.cache_size = cache_size
+        self._profiles = OrderedDict()
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "reloads": 0, "misses": 0, "derived": 0}
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS profiles ("
+                " profile_id TEXT PRIMARY KEY, devices TEXT NOT NULL,"
+                " content_hash TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _state(self, content_hash: str, connected_devices: dict) -> dict:
+        state = self._states.get(content_hash)
+        if state is None:
+            state = derive_device_state(connected_devices, self.device_catalog, self.retrieval_keys)
+            self.counters["derived"] += 1
+            self._states[content_hash] = state
+        self._states.move_to_end(content_hash)
+        while len(self._states) > self.cache_size:
+            self._states.popitem(last=False)
+        return state
+
+    def _remember(self, profile_id: str, connected_devices: dict, content_hash: str, updated_at: float) -> DeviceProfile:
+        profile = DeviceProfile(
+            profile_id=profile_id,
+            devices=MappingProxyType(connected_devices),
+            content_hash=content_hash,
+            updated_at=updated_at,
+            state=self._state(content_hash, connected_devices),
+        )
+        self._profiles[profile_id] = profile
+        self._profiles.move_to_end(profile_id)
+        # 원본이 SQLite에 있을 때만 메모리에서 밀어낼 수 있음
+        while self._db is not None and len(self._profiles) > self.cache_size:
+            self._profiles.popitem(last=False)
+        return profile
+
+    def get(self, profile_id: str) -> DeviceProfile:
+        """
+        프로필을 반환합니다. 없으면 None을 반환합니다.
+        """
+        with self._lock:
+            profile = self._profiles.get(profile_id)
+            if self._db is None:
+                self.counters["hits" if profile is not None else "misses"] += 1
+                return profile
+
+            row = self._db.execute(
+                "SELECT content_hash FROM profiles WHERE profile_id = ?", (profile_id,)
+            ).fetchone()
+            if row is None:
+                self._profiles.pop(profile_id, None)
+                self.counters["misses"] += 1
+                return None
+            if profile is not None and profile.content_hash == row[0]:
+                self._profiles.move_to_end(profile_id)
+                self.counters["hits"] += 1
+                return profile
+
+            devices, content_hash, updated_at = self._db.execute(
+                "SELECT devices, content_hash, updated_at FROM profiles WHERE profile_id = ?", (profile_id,)
+            ).fetchone()
+            self.counters["reloads"] += 1
+            return self._remember(profile_id, json.loads(devices), content_hash, updated_at)
+
+    def put(self, profile_id: str, connected_devices: dict) -> DeviceProfile:
+        """
+        프로필을 만들거나 통째로 교체합니다. 저장된 내용과 같으면 저장을 생략합니다.
+        다른 워커가 그사이 프로필을 바꿨을 수 있으므로 메모리가 아닌 SQLite의 해시와 비교합니다.
+        """
+        content_hash = profile_hash(connected_devices)
+        with self._lock:
+            profile = self._profiles.get(profile_id)
+            if self._db is None:
+                stored_hash = profile.content_hash if profile is not None else None
+            else:
+                row = self._db.execute(
+                    "SELECT content_hash FROM profiles WHERE profile_id = ?", (profile_id,)
+                ).fetchone()
+                stored_hash = row[0] if row is not None else None
+            if stored_hash == content_hash and profile is not None and profile.content_hash == content_hash:
+                self._profiles.move_to_end(profile_id)
+                return profile
+
+            now = time.time()
+            if self._db is not None and stored_hash != content_hash:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?)",
+                    (profile_id, json.dumps(connected_devices, ensure_ascii=False), content_hash, now),
+                )
+            return self._remember(profile_id, dict(connected_devices), content_hash, now)
+
+    def ephemeral(self, connected_devices: dict) -> DeviceProfile:
+        """
+        저장하지 않는 일회용 프로필을 만듭니다 - profile_id 없이 connected_devices를 보낸 요청용
+        파생 정보는 내용 해시 별 캐시를 함께 사용합니다.
+        """
+        content_hash = profile_hash(connected_devices)
+        with self._lock:
+            state = self._state(content_hash, connected_devices)
+        return DeviceProfile(
+            profile_id="",
+            devices=MappingProxyType(dict(connected_devices)),
+            content_hash=content_hash,
+            updated_at=time.time(),
+            state=state,
+        )
+
+    def patch(self, profile_id: str, changes: dict) -> DeviceProfile:
+        """
+        디바이스 단위로 프로필을 수정합니다. 값이 None인 디바이스는 삭제합니다.
+        프로필이 없으면 None을 반환합니다.
+        """
+        profile = self.get(profile_id)
+        if profile is None:
+            return None
+        connected_devices = dict(profile.devices)
+        for device_id, device in changes.items():
+            if device is None:
+                connected_devices.pop(device_id, None)
+            else:
+                connected_devices[device_id] = device
+        return self.put(profile_id, connected_devices)
+
+    def delete(self, profile_id: str) -> bool:
+        with self._lock:
+            existed = self._profiles.pop(profile_id, None) is not None
+            if self._db is not None:
+                existed = self._db.execute("DELETE FROM profiles WHERE profile_id = ?", (profile_id,)).rowcount > 0
+            return existed
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_profiles"] = len(self._profiles)
+            stats["cached_states"] = len(self._states)
+            if self._db is not None:
+                stats["stored_profiles"] = self._db.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+        return stats
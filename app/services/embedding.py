@@ -1,8 +1,7 @@
 import os
 import numpy as np
 import re, json, pickle
-from sklearn.metrics.pairwise import cosine_similarity
-from FlagEmbedding import BGEM3FlagModel
+from scipy.sparse import csr_matrix
 from functools import lru_cache
 
 def split_camel_case(identifier):
@@ -91,45 +90,111 @@ def prioritize_devices_in_results(results, query, max_k=7):
     final_results = prioritized + others
     return final_results[:max_k]
 
-# ColBERT 유사도 계산 함수
-def colbert_maxsim_score(query_vecs, doc_vecs):
-    sim_matrix = cosine_similarity(query_vecs, doc_vecs)  # (q_len, d_len)
-    max_sims = np.max(sim_matrix, axis=1)  # 각 쿼리 토큰의 최대 유사도
-    return np.mean(max_sims)  # 평균
+# 희소(어휘) 임베딩 인덱스 생성 함수
+def build_sparse_index(sparse_embeddings: list) -> dict:
+    """
+    문서 별 {토큰 id: 가중치} 딕셔너리 목록을 토큰 vocab과 CSR 행렬(문서 x 토큰)로 변환합니다.
+    """
+    vocab = {}
+    indptr, indices, data = [0], [], []
+    for doc_weights in sparse_embeddings:
+        for token, weight in doc_weights.items():
+            indices.append(vocab.setdefault(str(token), len(vocab)))
+            data.append(weight)
+        indptr.append(len(indices))
 
-# 하이브리드 추천 함수 (우선순위 적용)
-def hybrid_recommend(model, query, embedding_data, devices_available=None, max_k=7, weights = (0.35, 0.4, 0.25)):
+    matrix = csr_matrix(
+        (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int32)),
+        shape=(len(sparse_embeddings), len(vocab)),
+    )
+    return {"vocab": vocab, "matrix": matrix}
 
-    dense_embeddings = embedding_data['dense']
-    colbert_embeddings = embedding_data['colbert']
-    sparse_embeddings = embedding_data['sparse']
-    metadata = embedding_data['metadata']
+# 희소 유사도 계산 함수 - 쿼리 가중치를 vocab 공간의 벡터로 만든 뒤 한 번의 행렬-벡터 곱으로 계산
+def compute_sparse_scores(query_weights: dict, sparse_index: dict) -> np.ndarray:
+    vocab = sparse_index["vocab"]
+    query_vec = np.zeros(len(vocab), dtype=np.float32)
+    for token, weight in query_weights.items():
+        col = vocab.get(str(token))
+        if col is not None:
+            query_vec[col] = weight
+    return sparse_index["matrix"] @ query_vec
 
+def normalize_rows(matrix) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+# ColBERT 인덱스 생성 함수
+def build_colbert_index(colbert_embeddings: list) -> dict:
+    """
+    문서 별 ColBERT 토큰 벡터를 정규화하여 하나의 행렬로 이어 붙이고, 각 문서의 시작 위치를 기록합니다.
+    """
+    dim = next(len(doc[0]) for doc in colbert_embeddings if len(doc))
+    # 토큰이 없는 문서는 0 벡터 하나로 채워 구간이 비지 않도록 함
+    docs = [normalize_rows(doc) if len(doc) else np.zeros((1, dim), dtype=np.float32) for doc in colbert_embeddings]
+    lengths = np.array([len(doc) for doc in docs])
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return {"matrix": np.concatenate(docs), "offsets": offsets}
+
+# float16 인덱스의 ColBERT 행렬을 float32로 변환할 때 한 번에 변환하는 토큰 수
+COLBERT_CHUNK_TOKENS = 1024
+
+# ColBERT 유사도 계산 함수 - 쿼리 토큰 x 전체 문서 토큰 유사도를 한 번에 계산한 뒤 문서 구간 별 MaxSim 평균
+def compute_colbert_scores(query_vecs, colbert_index: dict) -> np.ndarray:
+    query = normalize_rows(query_vecs)
+    matrix = colbert_index["matrix"]
+    if matrix.dtype == np.float32:
+        sim_matrix = query @ matrix.T  # (q_len, 전체 문서 토큰 수)
+    else:
+        # float16 인덱스는 행렬 전체를 float32로 복사하지 않고 구간 단위로 변환하여 계산
+        sim_matrix = np.empty((len(query), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), COLBERT_CHUNK_TOKENS):
+            block = np.asarray(matrix[start:start + COLBERT_CHUNK_TOKENS], dtype=np.float32)
+            sim_matrix[:, start:start + len(block)] = query @ block.T
+    max_sims = np.maximum.reduceat(sim_matrix, colbert_index["offsets"], axis=1)  # (q_len, 문서 수)
+    return max_sims.mean(axis=0)
+
+# 하이브리드 추천 함수 (우선순위 적용)
+def encode_query(model, query) -> dict:
+    """
+    쿼리 하나의 dense(정규화), sparse, ColBERT 임베딩을 반환합니다.
+    """
     query_emb = model.encode(
         [query], 
         return_dense=True,
         return_sparse=True,
         return_colbert_vecs=True
     )
-    
-    dense_scores = cosine_similarity([query_emb['dense_vecs'][0]], dense_embeddings)[0]
+    return {
+        'dense': normalize_rows(query_emb['dense_vecs'][0]),
+        'sparse': query_emb['lexical_weights'][0],
+        'colbert': query_emb['colbert_vecs'][0],
+    }
 
-    sparse_scores = []
-    query_weights = query_emb['lexical_weights'][0]
-    for doc_weights in sparse_embeddings:
-        score = sum(query_weights.get(token, 0) * doc_weights.get(token, 0) for token in query_weights)
-        sparse_scores.append(score)
+def hybrid_recommend(model, query, embedding_data, devices_available=None, max_k=7, weights = (0.35, 0.4, 0.25), query_emb=None):
+    """
+    query_emb: encode_query 결과 - 이미 인코딩한 쿼리면 다시 인코딩하지 않음
+    """
+    dense_embeddings = embedding_data['dense']
+    colbert_index = embedding_data['colbert']
+    sparse_index = embedding_data['sparse']
+    metadata = embedding_data['metadata']
+
+    if query_emb is None:
+        query_emb = encode_query(model, query)
     
-    colbert_scores = [
-        colbert_maxsim_score(query_emb['colbert_vecs'][0], doc_emb)
-        for doc_emb in colbert_embeddings
-    ]
+    # 문서 벡터는 로드 시 정규화되어 있으므로 내적이 곧 코사인 유사도
+    dense_scores = dense_embeddings @ query_emb['dense']
+
+    sparse_scores = compute_sparse_scores(query_emb['sparse'], sparse_index)
     
+    colbert_scores = compute_colbert_scores(query_emb['colbert'], colbert_index)
+
 
     # 점수 정규화
     dense_norm = dense_scores / np.max(dense_scores)
-    sparse_norm = np.array(sparse_scores) / (np.max(sparse_scores) + 1e-6)
-    colbert_norm = np.array(colbert_scores) / (np.max(colbert_scores) + 1e-6)
+    sparse_norm = sparse_scores / (np.max(sparse_scores) + 1e-6)
+    colbert_norm = colbert_scores / (np.max(colbert_scores) + 1e-6)
 
     combined_scores = (
         weights[0] * dense_norm +
@@ -139,7 +204,10 @@ def hybrid_recommend(model, query, embedding_data, devices_available=None, max_k
 
     sorted_indices = np.argsort(combined_scores)[::-1]
 
-    if devices_available is not None:
+    # devices_available: 디바이스 이름 목록 또는 문서 별 사용 가능 여부(bool 배열)
+    if isinstance(devices_available, np.ndarray):
+        sorted_indices = sorted_indices[devices_available[sorted_indices]]
+    elif devices_available is not None:
         available_set = set(d.lower() for d in devices_available)
         sorted_indices = [i for i in sorted_indices if metadata['keys'][i].lower() in available_set]
 
@@ -162,18 +230,20 @@ def hybrid_recommend(model, query, embedding_data, devices_available=None, max_k
 
 # 사용 예시
 if __name__ == "__main__":
+    from FlagEmbedding import BGEM3FlagModel
+
     model = BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
     
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
     # 데이터 로드
-    dense_embeddings = np.load(os.path.join(BASE_DIR, '../resources', 'embedding_result', 'dense_embeddings.npy'))
+    dense_embeddings = normalize_rows(np.load(os.path.join(BASE_DIR, '../resources', 'embedding_result', 'dense_embeddings.npy')))
 
     with open(os.path.join(BASE_DIR, '../resources', 'embedding_result', 'colbert_embeddings.pkl'), 'rb') as f:
-        colbert_embeddings = pickle.load(f)
+        colbert_embeddings = build_colbert_index(pickle.load(f))
 
     with open(os.path.join(BASE_DIR, '../resources', 'embedding_result', 'sparse_embeddings.json')) as f:
-        sparse_embeddings = json.load(f)
+        sparse_embeddings = build_sparse_index(json.load(f))
 
     with open(os.path.join(BASE_DIR, '../resources', 'embedding_result', 'metadata.json')) as f:
         metadata = json.load(f)
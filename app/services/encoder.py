@@ -0,0 +1,149 @@
+import threading, time, queue
+from concurrent.futures import Future
+import numpy as np
+from .executor import stage
+import logging
+logger = logging.getLogger("uvicorn")
+
+OUTPUTS = ("dense_vecs", "lexical_weights", "colbert_vecs")
+
+
+class SharedEncoder:
+    """
+    BGE-M3 가중치 한 벌을 검색(dense/sparse/ColBERT)과 코드 검증(접근자 이름 임베딩)이 함께 사용하도록 합니다.
+    BGEM3FlagModel.encode와 같은 형태로 호출하며, 동시에 들어온 encode 호출은 짧은 대기 시간 동안 모아 한 번의 forward로 처리합니다.
+    입력은 max_length 토큰으로 자릅니다 - 명령어와 식별자는 짧으므로 긴 패딩 없이 인코딩합니다.
+    """
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: int = 5, max_length: int = 256):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.max_length = max_length
+
+        self._metrics_lock = threading.Lock()
+        self.metrics = {"calls": 0, "texts": 0, "forward_passes": 0, "coalesced_calls": 0}
+
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._loop, name="joi-encoder", daemon=True)
+        self._worker.start()
+
+    def submit(self, texts: list, return_dense: bool = True, return_sparse: bool = False, return_colbert_vecs: bool = False) -> Future:
+        """
+        texts를 제출하고 {"dense_vecs", "lexical_weights", "colbert_vecs"} 결과를 담을 Future를 반환합니다.
+        요청하지 않은 항목은 None입니다.
+        """
+        future = Future()
+        self._queue.put((list(texts), (return_dense, return_sparse, return_colbert_vecs), future))
+        return future
+
+    def encode(self, texts, return_dense: bool = True, return_sparse: bool = False, return_colbert_vecs: bool = False, **kwargs) -> dict:
+        single = isinstance(texts, str)
+        output = self.submit([texts] if single else texts, return_dense, return_sparse, return_colbert_vecs).result()
+        if single:
+            output = {key: value[0] if value is not None else None for key, value in output.items()}
+        return output
+
+    def embed(self, texts: list) -> np.ndarray:
+        """
+        정규화된 dense 벡터만 반환합니다.
+        """
+        return np.asarray(self.encode(list(texts))["dense_vecs"], dtype=np.float32)
+
+    def _collect(self) -> list:
+        # 첫 요청이 올 때까지 대기한 뒤, max_wait 동안 max_batch_size개 문장이 될 때까지 추가 요청을 모음
+        batch = [self._queue.get()]
+        count = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            count += len(item[0])
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                outputs = self._encode(batch)
+            except Exception as e:
+                logger.error(f"Batched encoding failed: {e}")
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (*_, future), output in zip(batch, outputs):
+                future.set_result(output)
+
+    def _encode(self, batch: list) -> list:
+        # 배치 안의 요청 중 하나라도 필요로 하는 출력은 모두 계산
+        flags = [any(item[1][i] for item in batch) for i in range(len(OUTPUTS))]
+        texts = [text for item in batch for text in item[0]]
+        if texts:
+            with stage("encode"):
+                output = self.model.encode(
+                    texts,
+                    batch_size=self.max_batch_size,
+                    max_length=self.max_length,
+                    return_dense=flags[0],
+                    return_sparse=flags[1],
+                    return_colbert_vecs=flags[2],
+                )
+        else:
+            output = {}
+
+        with self._metrics_lock:
+            self.metrics["calls"] += len(batch)
+            self.metrics["texts"] += len(texts)
+            self.metrics["forward_passes"] += 1
+            self.metrics["coalesced_calls"] += len(batch) - 1
+
+        results, offset = [], 0
+        for item_texts, wanted, _ in batch:
+            end = offset + len(item_texts)
+            results.append({
+                key: output[key][offset:end] if wanted[i] and texts else None
+                for i, key in enumerate(OUTPUTS)
+            })
+            offset = end
+        return results
+
+    def stats(self) -> dict:
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        forwards = metrics["forward_passes"]
+        return {
+            **metrics,
+            "queued": self._queue.qsize(),
+            "avg_batch_texts": round(metrics["texts"] / forwards, 2) if forwards else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_length": self.max_length,
+        }
+
+
+class RemoteEncoder:
+    """
+    모델 서버 프로세스의 SharedEncoder를 호출합니다 - 여러 API 워커의 호출도 모델 서버에서 함께 묶입니다.
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def encode(self, texts, return_dense: bool = True, return_sparse: bool = False, return_colbert_vecs: bool = False, **kwargs) -> dict:
+        return self.client.call(
+            "encode", texts=texts, return_dense=return_dense, return_sparse=return_sparse, return_colbert_vecs=return_colbert_vecs
+        )
+
+    def embed(self, texts: list) -> np.ndarray:
+        return np.asarray(self.encode(list(texts))["dense_vecs"], dtype=np.float32)
+
+    def stats(self) -> dict:
+        try:
+            remote = self.client.call("stats")["encoder"] or {}
+        except Exception as e:
+            remote = {"error": str(e)}
+        return {"model_server": self.client.path, **remote}
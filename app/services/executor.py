@@ -0,0 +1,262 @@
+import asyncio, functools, threading, time
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
+from app.config import settings
+
+
+_STREAM_END = object()
+
+
+class QueueFullError(Exception):
+    """
+    파이프라인 대기열이 가득 차서 요청을 받을 수 없을 때 발생합니다.
+    """
+    pass
+
+
+class StageLimiter:
+    """
+    파이프라인 스테이지(gpu, encode, http) 별 동시 실행 수를 제한합니다.
+    """
+    def __init__(self, limits: dict):
+        self._limits = dict(limits)
+        self._semaphores = {name: threading.BoundedSemaphore(n) for name, n in limits.items()}
+        self._active = {name: 0 for name in limits}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, name: str):
+        semaphore = self._semaphores[name]
+        semaphore.acquire()
+        with self._lock:
+            self._active[name] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active[name] -= 1
+            semaphore.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: {"active": self._active[name], "limit": self._limits[name]} for name in self._limits}
+
+
+class PipelineExecutor:
+    """
+    동기 파이프라인을 전용 스레드 풀에서 실행하여 이벤트 루프가 막히지 않도록 합니다.
+    실행 중 + 대기 중인 요청 수가 max_workers + max_queue를 넘으면 QueueFullError를 발생시킵니다.
+    stream_buffer: 스트리밍 응답에서 소비되지 않은 채 쌓일 수 있는 최대 항목 수
+    """
+    def __init__(self, max_workers: int, max_queue: int, stream_buffer: int = 32):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="joi-pipeline")
+        self._max_workers = max_workers
+        self._stream_buffer = max(1, stream_buffer)
+        self._capacity = max_workers + max_queue
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self._capacity:
+                raise QueueFullError(f"pipeline queue is full ({self._pending}/{self._capacity})")
+            self._pending += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args, **kwargs) -> asyncio.Future:
+        """
+        입장 가능 여부를 즉시 확인한 뒤 fn을 스레드 풀에 제출합니다.
+        이벤트 루프 안에서 호출해야 합니다.
+        """
+        self._admit()
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        return await self.submit(fn, *args, **kwargs)
+
+    def stream(self, gen_fn, *args, **kwargs):
+        """
+        동기 제너레이터 gen_fn을 스레드 풀에서 실행하고, 생성된 항목을 비동기 이터레이터로 전달합니다.
+        gen_fn에는 cancelled(threading.Event)가 전달되며, 소비하는 쪽이 중단하면 설정됩니다.
+        버퍼(stream_buffer)가 가득 차면 소비하는 쪽이 따라올 때까지 gen_fn을 멈춥니다.
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        # 버퍼 자리 - 생성 쪽이 항목을 넣기 전에 얻고, 소비하는 쪽이 항목을 꺼내면 돌려줌
+        space = threading.Semaphore(self._stream_buffer)
+        cancelled = threading.Event()
+
+        def put(item) -> bool:
+            # 버퍼에 자리가 날 때까지 대기하되, 소비하는 쪽이 중단하면 포기
+            while not space.acquire(timeout=0.1):
+                if cancelled.is_set():
+                    return False
+            loop.call_soon_threadsafe(items.put_nowait, (item, None))
+            return True
+
+        def produce():
+            try:
+                for item in gen_fn(*args, cancelled=cancelled, **kwargs):
+                    if cancelled.is_set() or not put(item):
+                        break
+            except Exception as e:
+                loop.call_soon_threadsafe(items.put_nowait, (None, e))
+            finally:
+                loop.call_soon_threadsafe(items.put_nowait, (_STREAM_END, None))
+
+        self.submit(produce)
+
+        async def iterate():
+            try:
+                while True:
+                    item, error = await items.get()
+                    if error is not None:
+                        raise error
+                    if item is _STREAM_END:
+                        break
+                    space.release()
+                    yield item
+            finally:
+                cancelled.set()
+
+        return iterate()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = self._pending
+        return {
+            "running": min(pending, self._max_workers),
+            "queued": max(0, pending - self._max_workers),
+            "capacity": self._capacity,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class StageGraph:
+    """
+    요청 하나의 처리 단계를 의존 관계에 따라 실행하고, 단계 별 실행 구간을 기록합니다.
+    의존하는 단계가 모두 끝나면 스레드 풀에 제출되므로 서로 독립적인 단계는 동시에 실행됩니다.
+    단계 함수는 의존 단계의 결과를 deps 순서대로 인자로 받으며, 의존 단계가 실패하면 같은 예외로 실패합니다.
+    """
+    def __init__(self, pool: ThreadPoolExecutor):
+        self._pool = pool
+        self._origin = time.perf_counter()
+        self._futures = {}
+        self._deps = {}
+        self._spans = {}
+        self._lock = threading.Lock()
+
+    def _run(self, name: str, fn, args: list):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._spans[name] = (start - self._origin, time.perf_counter() - self._origin)
+
+    def add(self, name: str, fn, deps: tuple = ()) -> Future:
+        """
+        단계를 등록합니다. 의존 단계는 먼저 등록되어 있어야 합니다.
+        """
+        future = Future()
+        dep_futures = [self._futures[dep] for dep in deps]
+        self._futures[name] = future
+        self._deps[name] = tuple(deps)
+        remaining = [len(dep_futures)]
+
+        def launch():
+            errors = [f.exception() for f in dep_futures if f.exception() is not None]
+            if errors:
+                future.set_exception(errors[0])
+                return
+            args = [f.result() for f in dep_futures]
+
+            def task():
+                try:
+                    future.set_result(self._run(name, fn, args))
+                except Exception as e:
+                    future.set_exception(e)
+            self._pool.submit(task)
+
+        def on_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                launch()
+
+        if not dep_futures:
+            launch()
+        for dep_future in dep_futures:
+            dep_future.add_done_callback(on_done)
+        return future
+
+    def call(self, name: str, fn, deps: tuple = ()):
+        """
+        의존 단계를 기다린 뒤 호출한 스레드에서 단계를 실행하고 결과를 반환합니다.
+        """
+        args = [self._futures[dep].result() for dep in deps]
+        future = Future()
+        self._futures[name] = future
+        self._deps[name] = tuple(deps)
+        try:
+            result = self._run(name, fn, args)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    def result(self, name: str):
+        return self._futures[name].result()
+
+    def done(self, name: str) -> bool:
+        return self._futures[name].done()
+
+    def error(self, name: str):
+        """
+        끝난 단계에서 발생한 예외 - 실행 중이거나 성공했으면 None
+        """
+        future = self._futures[name]
+        return future.exception() if future.done() else None
+
+    def timings(self) -> dict:
+        """
+        단계 별 소요 시간(초)과 임계 경로 - 가장 늦게 끝난 단계에서 가장 늦게 끝난 의존 단계를 따라간 경로
+        """
+        with self._lock:
+            spans = dict(self._spans)
+        path = []
+        name = max(spans, key=lambda n: spans[n][1]) if spans else None
+        while name is not None:
+            path.append(name)
+            deps = [dep for dep in self._deps.get(name, ()) if dep in spans]
+            name = max(deps, key=lambda n: spans[n][1]) if deps else None
+        return {
+            "stages": {name: round(end - start, 3) for name, (start, end) in spans.items()},
+            "critical_path": path[::-1],
+        }
+
+
+# 요청 처리 단계를 실행하는 프로세스 전역 스레드 풀 - 단계는 서로를 기다리지 않으므로 교착되지 않음
+STAGE_POOL = ThreadPoolExecutor(max_workers=settings.stageWorkers, thread_name_prefix="joi-stage")
+
+# 프로세스 전역 스테이지 제한 - run.py, validate.py 등에서 공유
+STAGE_LIMITER = StageLimiter({
+    "gpu": settings.gpuSlots,
+    "encode": settings.encodeSlots,
+    "http": settings.httpSlots,
+})
+stage = STAGE_LIMITER.slot
@@ -0,0 +1,149 @@
+import os, json, hashlib, argparse
+import numpy as np
+from .joi_tool import extract_classes_by_name
+from .embedding import build_sparse_index, build_colbert_index, normalize_rows
+from .index_store import INDEX_FILENAME, IndexValidationError, open_index, write_index
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
+EMBEDDING_DIR = os.path.join(ROOT_DIR, "resources", "embedding_result")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_retrieval_texts(service_list_path: str, texts_path: str = None) -> tuple:
+    """
+    디바이스 별로 임베딩할 텍스트와 서비스 목록의 디바이스 문서를 (texts, docs)로 반환합니다.
+    texts_path(metadata.json 형식 또는 {디바이스: 텍스트})에 검색용 키워드 텍스트가 있으면 우선 사용하고,
+    없는 디바이스는 서비스 목록의 디바이스 문서를 그대로 사용합니다.
+    """
+    with open(service_list_path, "r", encoding="utf-8") as f:
+        device_classes = extract_classes_by_name(f.read())
+
+    overrides = {}
+    if texts_path and os.path.exists(texts_path):
+        with open(texts_path, encoding="utf-8") as f:
+            data = json.load(f)
+        overrides = dict(zip(data["keys"], data["texts"])) if "keys" in data else data
+
+    docs = dict(sorted(device_classes.items()))
+    return {key: overrides.get(key, doc) for key, doc in docs.items()}, docs
+
+
+def device_fingerprint(text: str, doc: str) -> str:
+    """
+    디바이스 별 인덱스 지문 - 키워드 텍스트를 임베딩하더라도 서비스 목록의 문서가 바뀌면 다시 임베딩합니다.
+    """
+    return text_hash(f"{text}\0{doc}")
+
+
+def extract_previous_vectors(index: dict) -> dict:
+    """
+    이전 인덱스에서 디바이스 별 dense/sparse/ColBERT 벡터를 꺼내 재사용할 수 있도록 반환합니다.
+    """
+    keys = index["metadata"]["keys"]
+    offsets = list(index["colbert"]["offsets"]) + [len(index["colbert"]["matrix"])]
+    vocab_tokens = {col: token for token, col in index["sparse"]["vocab"].items()}
+    sparse_matrix = index["sparse"]["matrix"]
+
+    vectors = {}
+    for i, key in enumerate(keys):
+        row = sparse_matrix.getrow(i)
+        vectors[key] = {
+            "dense": np.asarray(index["dense"][i], dtype=np.float32),
+            "colbert": np.asarray(index["colbert"]["matrix"][offsets[i]:offsets[i + 1]], dtype=np.float32),
+            "sparse": {vocab_tokens[col]: float(weight) for col, weight in zip(row.indices, row.data)},
+        }
+    return vectors
+
+
+def embed_texts(model, texts: list, batch_size: int) -> list:
+    """
+    BGE-M3로 dense, sparse, ColBERT 벡터를 배치 단위로 계산합니다.
+    """
+    output = model.encode(
+        texts,
+        batch_size=batch_size,
+        return_dense=True,
+        return_sparse=True,
+        return_colbert_vecs=True,
+    )
+    return [{
+        "dense": np.asarray(output["dense_vecs"][i], dtype=np.float32),
+        "colbert": np.asarray(output["colbert_vecs"][i], dtype=np.float32),
+        "sparse": {str(token): float(weight) for token, weight in output["lexical_weights"][i].items()},
+    } for i in range(len(texts))]
+
+
+def build_index(service_list_path: str, index_path: str, texts_path: str = None, model=None,
+                full: bool = False, batch_size: int = 16, dtype: str = "float32") -> dict:
+    """
+    서비스 목록으로부터 검색 인덱스를 만듭니다.
+    이전 인덱스가 있으면 임베딩 텍스트나 디바이스 문서가 바뀐 디바이스만 다시 임베딩하고 나머지 벡터는 재사용합니다.
+    문서는 바뀌었는데 키워드 텍스트(texts_path)가 그대로인 디바이스는 "stale_texts"로 알립니다.
+    """
+    texts, docs = load_retrieval_texts(service_list_path, texts_path)
+    hashes = {key: device_fingerprint(text, docs[key]) for key, text in texts.items()}
+    text_hashes = {key: text_hash(text) for key, text in texts.items()}
+
+    previous, previous_hashes, previous_text_hashes = {}, {}, {}
+    if not full and os.path.exists(index_path):
+        try:
+            index = open_index(index_path)
+            previous_hashes = index["header"].get("doc_hashes", {})
+            previous_text_hashes = index["header"].get("text_hashes", {})
+            previous = extract_previous_vectors(index)
+        except IndexValidationError as e:
+            print(f"Ignoring previous index: {e}")
+
+    changed = [key for key in texts if key not in previous or previous_hashes.get(key) != hashes[key]]
+    # 키워드 텍스트는 문서에서 따로 만들어지므로, 문서만 바뀐 경우 키워드 텍스트도 갱신해야 검색 결과에 반영됨
+    stale_texts = [
+        key for key in changed
+        if texts[key] != docs[key] and previous_text_hashes.get(key) == text_hashes[key]
+    ]
+    for key in stale_texts:
+        print(f"Warning: the service list doc of {key} changed but its retrieval text in {texts_path} did not")
+    if changed:
+        if model is None:
+            from FlagEmbedding import BGEM3FlagModel
+            model = BGEM3FlagModel(os.path.join(ROOT_DIR, "resources", "models", "bge-m3"), use_fp16=False, local_files_only=True)
+        for key, vectors in zip(changed, embed_texts(model, [texts[key] for key in changed], batch_size)):
+            previous[key] = vectors
+
+    keys = list(texts)
+    embedding_data = {
+        "dense": normalize_rows(np.stack([previous[key]["dense"] for key in keys])),
+        "colbert": build_colbert_index([previous[key]["colbert"] for key in keys]),
+        "sparse": build_sparse_index([previous[key]["sparse"] for key in keys]),
+        "metadata": {"keys": keys, "texts": [texts[key] for key in keys]},
+    }
+    write_index(index_path, embedding_data, service_list_path, dtype, extra={"doc_hashes": hashes, "text_hashes": text_hashes})
+
+    return {
+        "total": len(keys),
+        "embedded": changed,
+        "removed": sorted(set(previous_hashes) - set(keys)),
+        "stale_texts": stale_texts,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the retrieval index from the device service list")
+    parser.add_argument("--service-list", default=os.path.join(ROOT_DIR, "resources", "service_list_ver1.1.9.txt"))
+    parser.add_argument("--texts", default=os.path.join(EMBEDDING_DIR, "metadata.json"),
+                        help="JSON with retrieval texts per device (metadata.json format or {device: text})")
+    parser.add_argument("--output", default=os.path.join(EMBEDDING_DIR, INDEX_FILENAME))
+    parser.add_argument("--full", action="store_true", help="re-embed every device instead of only changed ones")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--float16", action="store_true", help="store dense/ColBERT vectors as float16")
+    args = parser.parse_args()
+
+    result = build_index(
+        args.service_list, args.output, args.texts,
+        full=args.full, batch_size=args.batch_size, dtype="float16" if args.float16 else "float32",
+    )
+    print(f"Index written to {args.output}: {result['total']} devices, "
+          f"{len(result['embedded'])} embedded {result['embedded']}, {len(result['removed'])} removed {result['removed']}")
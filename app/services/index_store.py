@@ -0,0 +1,198 @@
+import os, json, hashlib, pickle
+import numpy as np
+from scipy.sparse import csr_matrix
+from .embedding import build_sparse_index, build_colbert_index, normalize_rows
+import logging
+logger = logging.getLogger("uvicorn")
+
+# 검색 인덱스 파일 형식
+# [MAGIC 8바이트][헤더 길이 uint64][헤더 JSON][블록 정렬 패딩][블록...]
+# 헤더에는 버전, 원본 서비스 목록 체크섬, 키 테이블, 각 블록의 위치/타입/모양이 기록됩니다.
+INDEX_MAGIC = b"JOIIDX01"
+INDEX_VERSION = 1
+INDEX_FILENAME = "retrieval_index.bin"
+BLOCK_ALIGN = 64
+
+
+class IndexValidationError(ValueError):
+    """
+    인덱스 파일이 손상되었거나 현재 서비스 목록과 맞지 않을 때 발생합니다.
+    """
+    pass
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _align(n: int) -> int:
+    return (n + BLOCK_ALIGN - 1) // BLOCK_ALIGN * BLOCK_ALIGN
+
+
+def write_index(path: str, embedding_data: dict, service_list_path: str, dtype: str = "float32", extra: dict = None):
+    """
+    hybrid_recommend에서 사용하는 embedding_data를 하나의 인덱스 파일로 저장합니다.
+    임시 파일에 쓴 뒤 교체하므로 읽는 쪽은 항상 완전한 파일만 보게 됩니다.
+    """
+    sparse_index = embedding_data["sparse"]
+    sparse_matrix = sparse_index["matrix"]
+    vocab_tokens = np.zeros(len(sparse_index["vocab"]), dtype=np.int64)
+    for token, col in sparse_index["vocab"].items():
+        vocab_tokens[col] = int(token)
+
+    blocks = {
+        "dense": np.ascontiguousarray(embedding_data["dense"], dtype=dtype),
+        "colbert_matrix": np.ascontiguousarray(embedding_data["colbert"]["matrix"], dtype=dtype),
+        "colbert_offsets": np.ascontiguousarray(embedding_data["colbert"]["offsets"], dtype=np.int64),
+        "sparse_data": np.ascontiguousarray(sparse_matrix.data, dtype=np.float32),
+        "sparse_indices": np.ascontiguousarray(sparse_matrix.indices, dtype=np.int32),
+        "sparse_indptr": np.ascontiguousarray(sparse_matrix.indptr, dtype=np.int32),
+        "sparse_vocab": vocab_tokens,
+    }
+
+    header = {
+        "version": INDEX_VERSION,
+        "service_list": os.path.basename(service_list_path),
+        "service_list_sha256": file_sha256(service_list_path),
+        "num_docs": len(embedding_data["metadata"]["keys"]),
+        "keys": embedding_data["metadata"]["keys"],
+        "texts": embedding_data["metadata"]["texts"],
+        "blocks": {},
+        **(extra or {}),
+    }
+
+    # 헤더 크기가 블록 위치에 영향을 주므로, 위치를 상대값으로 계산한 뒤 데이터 시작점을 더함
+    offset = 0
+    payload_hash = hashlib.sha256()
+    for name, array in blocks.items():
+        header["blocks"][name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset = _align(offset + array.nbytes)
+        payload_hash.update(array.tobytes())
+    header["payload_sha256"] = payload_hash.hexdigest()
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = _align(len(INDEX_MAGIC) + 8 + len(header_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_MAGIC)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(header_bytes)
+        for name, array in blocks.items():
+            f.seek(data_start + header["blocks"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_index_header(path: str) -> tuple:
+    with open(path, "rb") as f:
+        if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            raise IndexValidationError(f"{path} is not a retrieval index file")
+        header_len = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    if header.get("version") != INDEX_VERSION:
+        raise IndexValidationError(f"unsupported index version {header.get('version')} (expected {INDEX_VERSION})")
+    return header, _align(len(INDEX_MAGIC) + 8 + header_len)
+
+
+def open_index(path: str, service_list_path: str = None, verify_payload: bool = False) -> dict:
+    """
+    인덱스 파일을 np.memmap으로 열어 hybrid_recommend에서 사용하는 embedding_data를 반환합니다.
+    데이터는 필요할 때 페이지 단위로 읽히며, 같은 파일을 연 워커 프로세스끼리 페이지를 공유합니다.
+    """
+    header, data_start = read_index_header(path)
+
+    if service_list_path is not None and header["service_list_sha256"] != file_sha256(service_list_path):
+        raise IndexValidationError(
+            f"{path} was built from a different {header['service_list']} - rebuild the index"
+        )
+
+    blocks = {}
+    for name, block in header["blocks"].items():
+        shape = tuple(block["shape"])
+        if 0 in shape:
+            blocks[name] = np.zeros(shape, dtype=block["dtype"])
+            continue
+        blocks[name] = np.memmap(path, dtype=block["dtype"], mode="r", offset=data_start + block["offset"], shape=shape)
+
+    if verify_payload:
+        payload_hash = hashlib.sha256()
+        for array in blocks.values():
+            payload_hash.update(np.ascontiguousarray(array).tobytes())
+        if payload_hash.hexdigest() != header["payload_sha256"]:
+            raise IndexValidationError(f"{path} payload checksum mismatch")
+
+    sparse_matrix = csr_matrix(
+        (blocks["sparse_data"], blocks["sparse_indices"], blocks["sparse_indptr"]),
+        shape=(header["num_docs"], len(blocks["sparse_vocab"])),
+        copy=False,
+    )
+
+    return {
+        "dense": blocks["dense"],
+        "colbert": {"matrix": blocks["colbert_matrix"], "offsets": np.asarray(blocks["colbert_offsets"])},
+        "sparse": {"vocab": {str(token): col for col, token in enumerate(blocks["sparse_vocab"].tolist())}, "matrix": sparse_matrix},
+        "metadata": {"keys": header["keys"], "texts": header["texts"]},
+        "header": header,
+    }
+
+
+def load_legacy_embedding_data(embedding_dir: str) -> dict:
+    """
+    npy + pickle + JSON으로 나뉜 이전 형식의 임베딩 데이터를 로드합니다.
+    """
+    paths = {
+        'dense': os.path.join(embedding_dir, 'dense_embeddings.npy'),
+        'colbert': os.path.join(embedding_dir, 'colbert_embeddings.pkl'),
+        'sparse': os.path.join(embedding_dir, 'sparse_embeddings.json'),
+        'meta': os.path.join(embedding_dir, 'metadata.json'),
+    }
+
+    dense_embeddings = normalize_rows(np.load(paths['dense']))
+    with open(paths['colbert'], 'rb') as f:
+        colbert_embeddings = build_colbert_index(pickle.load(f))
+    with open(paths['sparse'], encoding='utf-8') as f:
+        sparse_embeddings = build_sparse_index(json.load(f))
+    with open(paths['meta'], encoding='utf-8') as f:
+        metadata = json.load(f)
+
+    return {
+        'dense': dense_embeddings,
+        'colbert': colbert_embeddings,
+        'sparse': sparse_embeddings,
+        'metadata': metadata
+    }
+
+
+def load_embedding_data(root_dir: str, service_list_path: str) -> dict:
+    """
+    검색 인덱스 파일이 있으면 memmap으로 열고, 없거나 서비스 목록과 맞지 않으면 이전 형식으로 로드합니다.
+    """
+    embedding_dir = os.path.join(root_dir, "resources", "embedding_result")
+    index_path = os.path.join(embedding_dir, INDEX_FILENAME)
+    if os.path.exists(index_path):
+        try:
+            return open_index(index_path, service_list_path)
+        except IndexValidationError as e:
+            logger.warning(f"Ignoring retrieval index: {e}")
+    return load_legacy_embedding_data(embedding_dir)
+
+
+if __name__ == "__main__":
+    # 이전 형식의 임베딩 데이터를 인덱스 파일로 변환
+    import argparse
+    root_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+    parser = argparse.ArgumentParser(description="Convert legacy embedding files into a retrieval index")
+    parser.add_argument("--service-list", default=os.path.join(root_dir, "resources", "service_list_ver1.1.9.txt"))
+    parser.add_argument("--float16", action="store_true", help="store dense/ColBERT vectors as float16")
+    args = parser.parse_args()
+
+    embedding_dir = os.path.join(root_dir, "resources", "embedding_result")
+    index_path = os.path.join(embedding_dir, INDEX_FILENAME)
+    write_index(index_path, load_legacy_embedding_data(embedding_dir), args.service_list, "float16" if args.float16 else "float32")
+    print(f"Index written to {index_path}")
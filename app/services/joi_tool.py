@@ -4,6 +4,50 @@ import re,json,os,copy
 #     # //로 시작하는 주석 제거 (줄 끝 주석 포함)
 #     return re.sub(r'\s*//.*$', '', line).rstrip()
 
+def extract_classes_by_name(text: str):
+    """
+    문자열로 저장된 디바이스 문서에서 각 디바이스의 설명을 추출해
+    디바이스 이름을 키로, 디바이스 설명을 값으로 하는 딕셔너리를 반환합니다.
+    """
+    # pattern = r'class\s+(\w+)\s*:\s*\n\s+"""(.*?)"""'
+    pattern = r'Device\s+(\w+)\s*:\s*\n\s+"""(.*?)"""'
+    matches = re.finditer(pattern, text, re.DOTALL)
+
+    class_dict = {}
+    for match in matches:
+        class_name = match.group(1)
+        full_class_def = match.group(0)  # 전체 클래스 문자열
+        class_dict[class_name] = full_class_def
+
+    return class_dict
+
+def extract_accessors(dsl_text: str):
+    """
+    디바이스 설명에서 태그, 속성, 메서드 접근자를 추출합니다.
+    각 접근자는 해당하는 키로 묶인 딕셔너리 형태로 반환됩니다.
+    """
+    block_patterns = {
+        "Tags": re.compile(r"Tags:\n((?:\s+#[^\n]*\n)+)"),
+        # "Enums": re.compile(r"Enums:\n((?:\s+\w+: \[[^\]]+\]\n*)+)"),
+        "Attributes": re.compile(r"Attributes:\n((?:\s+\w+_\w+: [^\n]+\n*)+)"),
+        "Methods": re.compile(r"Methods:\n((?:\s+\w+\([^\)]*\) -> \w+[^\n]*\n*)+)")
+    }
+
+    # Apply all patterns to the sample DSL text
+    blocks = {
+        name: (pattern.search(dsl_text).group(1).strip()).split("\n    ")
+        for name, pattern in block_patterns.items()
+        if pattern.search(dsl_text)
+    }
+    
+    if blocks.get("Tags"):
+        blocks["Tags"] = [line.strip() for line in blocks.get("Tags", [])]
+    if blocks.get("Attributes"):
+        blocks["Attributes"] = [line.split(":")[0].strip() for line in blocks.get("Attributes", [])]
+    if blocks.get("Methods"):
+        blocks["Methods"] = [line.split("(")[0].strip() for line in blocks.get("Methods", [])]
+    return blocks
+
 def parse_scenarios(script: str):
     """
     생성된 문자열에서 시나리오 코드를 파싱하여 딕셔너리 형태로 반환합니다.
@@ -48,6 +92,33 @@ def extract_last_code_block(text):
   matches = re.findall(pattern, text, re.DOTALL)
   return matches[-1].strip() if matches else None
 
+def extract_completed_scenarios(text: str) -> list:
+    """
+    생성 중인 문자열에서 끝이 확정된 시나리오 문자열 목록을 반환합니다.
+    시나리오는 다음 '---' 구분자가 나오거나 코드 블록이 닫히면 완료된 것으로 봅니다.
+    """
+    fences = [m.end() for m in re.finditer(r"```[^\n]*\n?", text)]
+    closed = False
+    if len(fences) % 2 == 1:
+        # 열린 코드 블록 - 마지막 ``` 이후가 생성 중인 코드
+        text = text[fences[-1]:]
+    elif fences:
+        # 닫힌 코드 블록 - 마지막 블록 전체가 완료된 코드
+        text = text[fences[-2]:text.rindex("```")]
+        closed = True
+
+    parts = text.split('---')
+    if not closed:
+        parts = parts[:-1]
+    return [part.strip() for part in parts if part.strip()]
+
+def build_system_prompt(grammar: str, service_doc: str) -> str:
+    """
+    문법 규칙 뒤에 선택된 디바이스 문서를 붙여 시스템 프롬프트를 구성합니다.
+    문법 부분은 모든 요청에서 동일하므로 접두부 KV 캐시의 기준이 됩니다.
+    """
+    return f"{grammar}\n<DEVICES>\n{service_doc}\n</DEVICES>"
+
 def extract_device_tags(connected_devices: dict, device_classes: dict) -> tuple:
     """
     연결된 디바이스의 태그를 추출하고, 디바이스 클래스에 해당하는 태그와
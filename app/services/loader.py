@@ -1,29 +1,74 @@
 # model_loader.py
-import unsloth
-import os, re
-import numpy as np
-import json
-import pickle
-from unsloth import FastLanguageModel
-from unsloth.chat_templates import get_chat_template
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer
-from peft import PeftModel
-
-from FlagEmbedding import BGEM3FlagModel
-
-# 서비스 문서 파싱 함수
-def extract_classes_by_name(text: str):
-    pattern = r'Device\s+(\w+)\s*:\s*\n\s+"""(.*?)"""'
-    matches = re.finditer(pattern, text, re.DOTALL)
-    return {match.group(1): match.group(0) for match in matches}
-
-def load_all_resources(model_name: str):
+import os, time
+from concurrent.futures import ThreadPoolExecutor
+from app.config import settings
+from .executor import StageGraph
+from .joi_tool import build_system_prompt, extract_classes_by_name
+from .index_store import load_embedding_data
+from .accessor_index import AccessorIndex
+from .encoder import SharedEncoder, RemoteEncoder
+from .model_server import ModelClient
+from .device_catalog import DeviceCatalog
+from .prompt_budget import PromptAssembler
+from .response_cache import ResponseCache, resource_version
+from .backends import LocalBackend, OpenAIBackend, StubBackend, RemoteBackend
+import logging
+logger = logging.getLogger("uvicorn")
+
+# LLM 생성 인자 - 배치 내 모든 요청에 동일하게 적용
+GENERATION_KWARGS = {
+    "max_new_tokens": 1024,
+    "use_cache": True,
+    # 더 일관된 출력을 위한 인자들
+    # "do_sample": False,
+    "temperature": 0.1,
+    "repetition_penalty": 1.2,
+}
+
+def generation_kwargs() -> dict:
+    """
+    제한 디코딩은 최상위 토큰만 확인하므로, 켜져 있으면 샘플링 대신 greedy 디코딩을 사용합니다.
+    """
+    if settings.constrainedDecoding:
+        return {**GENERATION_KWARGS, "do_sample": False, "temperature": None}
+    return GENERATION_KWARGS
+
+def load_speculative_kwargs(root_dir: str, model, tokenizer) -> dict:
+    """
+    설정에 따라 generate에 넘길 추측 디코딩 인자를 반환합니다.
+    draft 모델을 불러올 수 없거나 토크나이저가 다르면 prompt lookup을 사용합니다.
     """
-    모델과 어댑터를 로드하고 필요한 리소스를 반환합니다.
+    mode = settings.speculativeDecoding
+    if mode == "draft" and settings.draftModelName:
+        draft_path = os.path.join(root_dir, "resources", "models", settings.draftModelName)
+        try:
+            from transformers import AutoTokenizer, AutoModelForCausalLM
+            draft_tokenizer = AutoTokenizer.from_pretrained(draft_path)
+            if draft_tokenizer.vocab_size != tokenizer.vocab_size:
+                raise ValueError(f"tokenizer mismatch ({draft_tokenizer.vocab_size} != {tokenizer.vocab_size})")
+            draft_model = AutoModelForCausalLM.from_pretrained(draft_path, torch_dtype="auto").to(model.device).eval()
+            return {"assistant_model": draft_model, "num_assistant_tokens": settings.draftTokens}
+        except Exception as e:
+            logger.warning(f"Draft model unavailable, using prompt lookup instead: {e}")
+            mode = "prompt_lookup"
+    if mode in ("prompt_lookup", "draft"):
+        return {
+            "prompt_lookup_num_tokens": settings.promptLookupTokens,
+            "max_matching_ngram_size": settings.promptLookupMaxNgram,
+        }
+    return {}
+
+def load_local_backend(root_dir: str, model_name: str, grammar_rules: str) -> LocalBackend:
+    """
+    로컬 모델과 어댑터를 로드하고 생성 스케줄러를 구성합니다.
+    unsloth는 transformers보다 먼저 import되어야 하므로 main.py의 lifespan에서 로컬 백엔드를 사용할 때 미리 불러옵니다.
+    torch/transformers를 사용하는 모듈은 로컬 백엔드를 로드할 때만 import합니다.
     """
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    root_dir = os.path.abspath(os.path.join(base_dir, ".."))
+    from unsloth import FastLanguageModel
+    from unsloth.chat_templates import get_chat_template
+    from .batching import GenerationBatcher
+    from .prefix_cache import PrefixCache
+    from .constrained_decoding import ConstrainedDecoding
 
     model_base_path = os.path.join(root_dir, "resources", "models", f"{model_name}-model")
     adapter_path = os.path.join(root_dir, "resources", "models", f"{model_name}-adapter")
@@ -51,50 +96,258 @@ def load_all_resources(model_name: str):
     ]
     stop_token_ids = [tokenizer.convert_tokens_to_ids(tok) for tok in stop_tokens if tok in tokenizer.get_vocab()]
 
-    # 3. 디바이스 docs 추출
-    with open(os.path.join(root_dir,"resources","service_list_ver1.1.9.txt"), "r", encoding="utf-8") as f:
-        service_doc = f.read()
-    device_classes = extract_classes_by_name(service_doc)
-
-    # 4. 문법 규칙 불러오기
-    with open(os.path.join(root_dir, "resources", "grammar_ver1_1_8.txt"), "r", encoding="utf-8") as f:
-        grammar_rules = f.read()
-
-    # 4. 임베딩 및 문장 유사도 모델 - 첫 실행 시 다운로드에 시간이 소요됨
-    embed_model = BGEM3FlagModel(os.path.join(root_dir, "resources", "models", "bge-m3"), use_fp16=False, local_files_only=True)
-    sim_model = SentenceTransformer(os.path.join(root_dir, "resources", "models", "bge-m3"))
-
-    # 5. 임베딩 데이터 로드
-    paths = {
-        'dense': os.path.join(root_dir, 'resources', 'embedding_result', 'dense_embeddings.npy'),
-        'colbert': os.path.join(root_dir, 'resources', 'embedding_result', 'colbert_embeddings.pkl'),
-        'sparse': os.path.join(root_dir, 'resources', 'embedding_result', 'sparse_embeddings.json'),
-        'meta': os.path.join(root_dir, 'resources', 'embedding_result', 'metadata.json'),
-    }
-
-    # 데이터 로드
-    dense_embeddings = np.load(paths['dense'])
-    with open(paths['colbert'], 'rb') as f:
-        colbert_embeddings = pickle.load(f)
-    with open(paths['sparse'], encoding='utf-8') as f:
-        sparse_embeddings = json.load(f)
-    with open(paths['meta'], encoding='utf-8') as f:
-        metadata = json.load(f)
-    
-    embedding_data = {
-        'dense': dense_embeddings,
-        'colbert': colbert_embeddings,
-        'sparse': sparse_embeddings,
-        'metadata': metadata
-    }
-
-    return {
-        "model": model,
-        "tokenizer": tokenizer,
-        "stop_token_ids": stop_token_ids,
-        "embed_model": embed_model,
-        "embedding_data": embedding_data,
-        "sim_model": sim_model,
-        "device_classes": device_classes,
-        "grammar": grammar_rules
-    }
+    # 문법 접두부 KV 캐시 - 시스템 프롬프트 중 <DEVICES> 이전 부분은 모든 요청에서 동일
+    prefix_cache = None
+    if settings.prefixCacheSize > 0:
+        system_text = tokenizer.apply_chat_template(
+            [{"role": "system", "content": build_system_prompt(grammar_rules, "")}], tokenize=False
+        )
+        base_text = system_text[:system_text.index("<DEVICES>\n") + len("<DEVICES>\n")]
+        prefix_cache = PrefixCache(model, tokenizer, base_text, max_entries=settings.prefixCacheSize)
+
+    # 동시 요청을 묶어 처리하는 생성 스케줄러
+    generator = GenerationBatcher(
+        model, tokenizer, stop_token_ids,
+        max_batch_size=settings.batchMaxSize,
+        max_wait_ms=settings.batchMaxWaitMs,
+        generate_kwargs=generation_kwargs(),
+        prefix_cache=prefix_cache,
+        speculative_kwargs=load_speculative_kwargs(root_dir, model, tokenizer),
+        constrained_decoding=ConstrainedDecoding(tokenizer, settings.constrainedCandidates) if settings.constrainedDecoding else None,
+    )
+
+    # 응답 캐시 버전 - 어댑터가 바뀌면 이전 응답을 재사용하지 않음
+    adapter_files = sorted(os.listdir(adapter_path)) if os.path.isdir(adapter_path) else []
+    adapter_version = ";".join(
+        f"{name}:{os.path.getsize(os.path.join(adapter_path, name))}:{int(os.path.getmtime(os.path.join(adapter_path, name)))}"
+        for name in adapter_files
+    )
+    return LocalBackend(model_name, tokenizer, stop_token_ids, generator, version=f"{model_name}:{adapter_version}")
+
+def load_openai_backend() -> OpenAIBackend:
+    from .openai_client import OpenAIClient
+    client = OpenAIClient(
+        api_key=settings.openAiAPI,
+        base_url=settings.openAiBaseURL,
+        max_in_flight=settings.openAiMaxInFlight,
+        max_connections=settings.openAiMaxConnections,
+        deadline=settings.openAiDeadline,
+        max_retries=settings.openAiMaxRetries,
+        backoff_base=settings.openAiBackoffBase,
+        backoff_max=settings.openAiBackoffMax,
+    )
+    return OpenAIBackend(client, settings.openAiModel)
+
+def load_remote_backend(client: ModelClient, root_dir: str) -> RemoteBackend:
+    """
+    모델 서버의 로컬 백엔드가 로드될 때까지 기다린 뒤 원격 백엔드를 반환합니다.
+    """
+    status = client.wait_ready("backend:local", settings.modelServerTimeout)
+    return RemoteBackend(client, status["local"]["model"], status["local"]["version"])
+
+def backend_model_name(name: str) -> str:
+    """
+    백엔드를 로드하기 전에도 알 수 있는 모델 이름
+    """
+    return {"local": settings.localModelName, "openai": settings.openAiModel}.get(name, name)
+
+class ResourceLoader:
+    """
+    생성 백엔드와 공유 리소스를 의존 관계에 따라 동시에 로드하고, 구성 요소 별 상태와 소요 시간을 기록합니다.
+    - load_light: 카탈로그, 문법, 검색 인덱스, 응답 캐시 등 가벼운 구성 요소를 로드하고 끝날 때까지 대기
+    - start: 모델(생성 백엔드, BGE-M3)과 이에 의존하는 구성 요소를 백그라운드에서 로드
+    로드된 값은 resources(파이프라인의 model_resources)에 채워집니다.
+    model_server(Unix 소켓 경로)가 있으면 로컬 백엔드와 인코더를 로드하지 않고 모델 서버를 사용합니다.
+    """
+    def __init__(self, backend_names: list, workers: int = 4, model_server: str = ""):
+        for name in backend_names:
+            if name not in ("local", "openai", "stub"):
+                raise ValueError(f"Unknown generation backend: {name}")
+        self.backend_names = list(backend_names)
+        self.model_client = ModelClient(model_server) if model_server else None
+        self.root_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+        self.service_list_path = os.path.join(self.root_dir, "resources", "service_list_ver1.1.9.txt")
+        self.resources = {"backends": {}, "default_backend": backend_names[0]}
+        self.components = []
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="joi-loader")
+        self._graph = StageGraph(self._pool)
+        self._started = time.perf_counter()
+        self._ready_at = None
+        self._complete = False    # 모든 구성 요소가 등록되었는지 (start 호출 이후)
+
+    def _component(self, name: str, fn, deps: tuple = ()):
+        def load(*args):
+            try:
+                value = fn(*args)
+            except Exception as e:
+                logger.error(f"Failed to load {name}: {e}")
+                raise
+            logger.info(f"{name} loaded")
+            return value
+        future = self._graph.add(name, load, deps)
+        self.components.append(name)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, _=None):
+        if self._complete and self._ready_at is None and self.ready():
+            self._ready_at = time.perf_counter()
+            logger.info(f"all resources loaded in {self._ready_at - self._started:.1f} seconds")
+
+    def load_light(self):
+        resources = self.resources
+
+        # 3. 디바이스 docs 추출
+        def catalog():
+            with open(self.service_list_path, "r", encoding="utf-8") as f:
+                service_doc = f.read()
+            resources["device_classes"] = extract_classes_by_name(service_doc)
+            # 요청 간에 공유하는 불변 카탈로그 - 태그, 속성, 메서드, 설명 조각을 미리 파싱
+            resources["device_catalog"] = DeviceCatalog(resources["device_classes"])
+            return service_doc
+
+        # 4. 문법 규칙 불러오기
+        def grammar():
+            with open(os.path.join(self.root_dir, "resources", "grammar_ver1_1_8.txt"), "r", encoding="utf-8") as f:
+                resources["grammar"] = f.read()
+            return resources["grammar"]
+
+        # 5. 임베딩 데이터 로드 - 검색 인덱스 파일이 있으면 memmap으로 열고, 없으면 이전 형식으로 로드
+        def embedding_data():
+            resources["embedding_data"] = load_embedding_data(self.root_dir, self.service_list_path)
+
+        # 응답 캐시 - 서비스 목록, 문법, 백엔드(모델/어댑터)가 바뀌면 이전 응답을 재사용하지 않음
+        def response_cache(service_doc, grammar_rules):
+            resources["resource_version"] = resource_version(service_doc, grammar_rules)
+            resources["response_cache"] = ResponseCache(
+                max_entries=settings.responseCacheSize,
+                ttl_seconds=settings.responseCacheTTL,
+                similarity_threshold=settings.responseCacheSimilarity,
+                time_bucket=settings.responseCacheTimeBucket,
+                relative_time_bucket=settings.responseCacheRelativeTimeBucket,
+            )
+
+        futures = [
+            self._component("catalog", catalog),
+            self._component("grammar", grammar),
+            self._component("embedding_data", embedding_data),
+            self._component("response_cache", response_cache, ("catalog", "grammar")),
+        ]
+        for future in futures:
+            future.result()
+
+    def start(self, models_only: bool = False):
+        """
+        모델을 백그라운드에서 로드합니다. load_light 이후에 호출해야 합니다.
+        models_only이면 생성 백엔드와 인코더만 로드합니다 (모델 서버).
+        """
+        resources = self.resources
+
+        # 생성 백엔드 - 같은 프로세스에서 여러 백엔드를 함께 사용할 수 있음
+        def backend(name: str):
+            def load(grammar_rules):
+                if name == "local" and self.model_client is not None:
+                    loaded = load_remote_backend(self.model_client, self.root_dir)
+                elif name == "local":
+                    loaded = load_local_backend(self.root_dir, settings.localModelName, grammar_rules)
+                elif name == "openai":
+                    loaded = load_openai_backend()
+                else:
+                    loaded = StubBackend(settings.stubResponse)
+                resources["backends"][name] = loaded
+            return load
+
+        for name in self.backend_names:
+            self._component(f"backend:{name}", backend(name), ("grammar",))
+
+        # 4. 임베딩 모델 - 검색과 코드 검증이 BGE-M3 가중치 한 벌을 공유, 첫 실행 시 다운로드에 시간이 소요됨
+        def encoder():
+            if self.model_client is not None:
+                self.model_client.wait_ready("encoder", settings.modelServerTimeout)
+                resources["encoder"] = RemoteEncoder(self.model_client)
+                return
+            from FlagEmbedding import BGEM3FlagModel  # 모델 서버 모드에서는 필요 없으므로 사용할 때 import
+            resources["encoder"] = SharedEncoder(
+                BGEM3FlagModel(os.path.join(self.root_dir, "resources", "models", "bge-m3"), use_fp16=False, local_files_only=True),
+                max_batch_size=settings.encoderMaxBatchSize,
+                max_wait_ms=settings.encoderMaxWaitMs,
+                max_length=settings.encoderMaxLength,
+            )
+
+        self._component("encoder", encoder)
+        if models_only:
+            self._complete = True
+            self._on_done()
+            return
+
+        # <DEVICES> 부분 구성 - 디바이스 설명 조각의 토큰 수를 캐시 (토큰 예산은 로컬 모델 토크나이저 기준)
+        # 토크나이저만 따로 로드하므로 로컬 모델 로드 여부와 관계없이 준비됨
+        def prompt_assembler(_):
+            tokenizer = None
+            if settings.devicePromptBudget > 0:
+                if "local" in self.backend_names:
+                    from transformers import AutoTokenizer
+                    tokenizer = AutoTokenizer.from_pretrained(
+                        os.path.join(self.root_dir, "resources", "models", f"{settings.localModelName}-model")
+                    )
+                else:
+                    logger.warning("devicePromptBudget requires the local tokenizer, prompt budget disabled")
+            resources["prompt_assembler"] = PromptAssembler(
+                tokenizer, resources["device_catalog"], budget=settings.devicePromptBudget if tokenizer is not None else 0
+            )
+
+        self._component("prompt_assembler", prompt_assembler, ("catalog",))
+
+        # 코드 검증용 접근자 임베딩 - 카탈로그의 태그/메서드/속성 이름을 미리 인코딩
+        def accessor_index(*_):
+            resources["accessor_index"] = AccessorIndex(resources["device_classes"], resources["encoder"], memo_size=settings.accessorMemoSize)
+
+        self._component("accessor_index", accessor_index, ("catalog", "encoder"))
+        self._complete = True
+        self._on_done()
+
+    def wait(self) -> dict:
+        """
+        모든 구성 요소가 로드될 때까지 기다린 뒤 resources를 반환합니다. 실패한 구성 요소가 있으면 그 예외가 발생합니다.
+        """
+        for name in list(self.components):
+            self._graph.result(name)
+        return self.resources
+
+    def ready(self, names: list = None) -> bool:
+        """
+        names(없으면 전체) 구성 요소가 모두 로드되었는지 확인합니다.
+        """
+        for name in names if names is not None else self.components:
+            if name not in self.components or not self._graph.done(name) or self._graph.error(name) is not None:
+                return False
+        return self._complete or names is not None
+
+    def status(self) -> dict:
+        """
+        구성 요소 별 상태(loading, ready, failed)와 로드 소요 시간(초)
+        """
+        seconds = self._graph.timings()["stages"]
+        components = {}
+        for name in self.components:
+            if not self._graph.done(name):
+                components[name] = {"state": "loading", "seconds": None}
+            elif self._graph.error(name) is not None:
+                components[name] = {"state": "failed", "seconds": seconds.get(name), "error": str(self._graph.error(name))}
+            else:
+                components[name] = {"state": "ready", "seconds": seconds.get(name)}
+        return {
+            "ready": self.ready(),
+            "startup_seconds": round(self._ready_at - self._started, 3) if self._ready_at is not None else None,
+            "components": components,
+        }
+
+def load_all_resources(backend_names: list, workers: int = 4) -> dict:
+    """
+    생성 백엔드와 공유 리소스(카탈로그, 임베딩, 캐시 등)를 모두 로드하여 반환합니다.
+    backend_names의 첫 번째 백엔드가 기본 백엔드이며, 나머지는 요청에서 backend로 선택할 수 있습니다.
+    """
+    loader = ResourceLoader(backend_names, workers)
+    loader.load_light()
+    loader.start()
+    return loader.wait()
@@ -0,0 +1,252 @@
+"""
+모델 서버 - LLM(로컬 백엔드)과 BGE-M3 인코더를 한 프로세스에 로드하고 Unix 소켓으로 여러 API 워커에 제공합니다.
+API 워커는 HTTP 처리, 캐시, 번역, 검증을 맡고 생성과 인코딩 호출만 모델 서버로 보냅니다.
+동시에 들어온 호출은 모델 서버의 GenerationBatcher, SharedEncoder에서 워커와 관계없이 함께 묶입니다.
+
+사용법:
+    python -m app.services.model_server [--socket /tmp/joi-model-server.sock]
+    modelServerSocket=/tmp/joi-model-server.sock python -m uvicorn app.main:app --workers 4
+
+연결은 인증 키(modelServerAuthKey, 없으면 모델 서버가 만든 <소켓>.key 파일)로 확인합니다.
+"""
+import argparse, os, secrets, threading, time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+from app.config import settings
+import logging
+logger = logging.getLogger("uvicorn")
+
+DEFAULT_SOCKET = "/tmp/joi-model-server.sock"
+# 같은 호출을 다시 보내도 결과가 같은 호출 - 연결이 끊어지면 응답을 받지 못했더라도 다시 시도
+IDEMPOTENT_OPS = {"status", "stats", "encode"}
+
+
+class ModelServerError(Exception):
+    """
+    모델 서버에서 호출이 실패했거나 모델 서버에 연결할 수 없을 때 발생합니다.
+    """
+    pass
+
+
+def model_server_authkey(path: str, create: bool = False) -> bytes:
+    """
+    연결 인증 키 - modelServerAuthKey가 없으면 소켓 옆의 키 파일(소유자만 읽기 가능)을 사용하며, create면 없을 때 만듭니다.
+    """
+    if settings.modelServerAuthKey:
+        return settings.modelServerAuthKey.encode("utf-8")
+    key_path = f"{path}.key"
+    if create and not os.path.exists(key_path):
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    try:
+        with open(key_path, encoding="utf-8") as f:
+            return f.read().strip().encode("utf-8")
+    except OSError as e:
+        raise ModelServerError(f"cannot read the model server auth key {key_path}: {e}")
+
+
+class ModelClient:
+    """
+    모델 서버 연결 풀 - 연결 하나는 한 번에 한 호출만 사용하며, 호출이 끝나면 풀로 돌려놓습니다.
+    연결이 끊어진 경우(모델 서버 재시작 등) 새 연결로 한 번 다시 시도합니다.
+    생성 호출은 이미 보낸 뒤 끊어지면 모델 서버에서 두 번 생성될 수 있으므로 다시 시도하지 않습니다.
+    """
+    def __init__(self, path: str, max_idle: int = 16):
+        self.path = path
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return Client(self.path, family="AF_UNIX", authkey=model_server_authkey(self.path))
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise ModelServerError(f"cannot connect to model server at {self.path}: {e}")
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _request(self, op: str, payload: dict, on_chunk=None, cancelled: threading.Event = None):
+        for attempt in range(2):
+            conn = self._connect()
+            sent = False
+            try:
+                conn.send((op, payload))
+                sent = True
+                cancel_sent = False
+                while True:
+                    # 스트리밍 중 취소되면 모델 서버에 알리고 남은 응답을 받음
+                    if cancelled is not None and cancelled.is_set() and not cancel_sent:
+                        conn.send(("cancel", None))
+                        cancel_sent = True
+                    if on_chunk is not None and not conn.poll(0.1):
+                        continue
+                    kind, value = conn.recv()
+                    if kind == "chunk":
+                        on_chunk(value)
+                        continue
+                    self._release(conn)
+                    if kind == "error":
+                        raise ModelServerError(value)
+                    return value
+            except (OSError, EOFError) as e:
+                conn.close()
+                # 이미 보낸 생성/스트리밍 호출은 다시 시도하지 않음
+                if attempt == 1 or (sent and op not in IDEMPOTENT_OPS):
+                    raise ModelServerError(f"model server connection lost: {e}")
+
+    def call(self, op: str, **payload):
+        return self._request(op, payload)
+
+    def stream(self, op: str, on_chunk, cancelled: threading.Event = None, **payload):
+        return self._request(op, payload, on_chunk, cancelled)
+
+    def wait_ready(self, component: str, timeout: float) -> dict:
+        """
+        모델 서버에서 component가 로드될 때까지 기다린 뒤 모델 서버 상태를 반환합니다.
+        """
+        expires = time.monotonic() + timeout
+        last_error = None
+        while time.monotonic() < expires:
+            try:
+                status = self.call("status")
+                state = status["components"].get(component, {}).get("state")
+                if state == "ready":
+                    return status
+                if state == "failed":
+                    raise ModelServerError(f"{component} failed to load on the model server: {status['components'][component].get('error')}")
+                last_error = f"{component} is {state or 'not loaded'}"
+            except ModelServerError as e:
+                if "failed to load" in str(e):
+                    raise
+                last_error = str(e)
+            time.sleep(1.0)
+        raise ModelServerError(f"model server not ready after {timeout} seconds ({last_error})")
+
+
+def handle_stream(conn, backend, context: dict):
+    """
+    생성된 텍스트 조각을 보내고, 조각 사이에 API 워커의 취소 요청을 확인합니다.
+    """
+    cancelled = threading.Event()
+    streamer, run = backend.stream(context, cancelled)
+    outcome = {}
+
+    def generate():
+        try:
+            outcome["result"] = run()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=generate, name="joi-model-stream", daemon=True)
+    thread.start()
+    for text in streamer:
+        if text:
+            conn.send(("chunk", text))
+        while conn.poll():
+            if conn.recv()[0] == "cancel":
+                cancelled.set()
+    thread.join()
+    # 생성이 끝난 뒤 도착한 취소 요청은 버림
+    while conn.poll():
+        conn.recv()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def handle_connection(conn, loader):
+    """
+    한 API 워커 연결의 호출을 순서대로 처리합니다. 연결마다 스레드 하나를 사용합니다.
+    """
+    resources = loader.resources
+    with conn:
+        while True:
+            try:
+                op, payload = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if op == "status":
+                    status = loader.status()
+                    local = resources["backends"].get("local")
+                    status["local"] = {"model": local.model_name, "version": local.version} if local is not None else None
+                    result = status
+                elif op == "stats":
+                    local = resources["backends"].get("local")
+                    encoder = resources.get("encoder")
+                    result = {
+                        "local": local.stats() if local is not None else None,
+                        "encoder": encoder.stats() if encoder is not None else None,
+                    }
+                elif op == "encode":
+                    result = resources["encoder"].encode(**payload)
+                elif op == "generate":
+                    result = resources["backends"]["local"].generate(payload["context"])
+                elif op == "stream":
+                    result = handle_stream(conn, resources["backends"]["local"], payload["context"])
+                elif op == "cancel":
+                    continue    # 이미 끝난 스트리밍 호출의 취소 요청
+                else:
+                    raise ValueError(f"unknown model server operation: {op}")
+                conn.send(("ok", result))
+            except (EOFError, OSError):
+                return
+            except Exception as e:
+                logger.error(f"Model server {op} failed: {e}")
+                try:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+                except (EOFError, OSError):
+                    return
+
+
+def serve(path: str, workers: int = 4):
+    """
+    로컬 백엔드와 인코더를 백그라운드에서 로드하면서 path의 Unix 소켓으로 연결을 받습니다.
+    로드 상태는 status 호출로 확인할 수 있습니다.
+    """
+    from .loader import ResourceLoader
+
+    loader = ResourceLoader(["local"], workers=workers)
+    loader.load_light()
+    loader.start(models_only=True)
+
+    if os.path.exists(path):
+        os.remove(path)
+    # 소켓은 만들어질 때부터 소유자만 접근할 수 있도록 함
+    umask = os.umask(0o077)
+    try:
+        listener = Listener(path, family="AF_UNIX", authkey=model_server_authkey(path, create=True))
+    finally:
+        os.umask(umask)
+    logger.info(f"model server listening on {path}")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError, EOFError) as e:
+                logger.warning(f"Rejected model server connection: {e}")
+                continue
+            threading.Thread(target=handle_connection, args=(conn, loader), name="joi-model-conn", daemon=True).start()
+    finally:
+        listener.close()
+
+
+if __name__ == "__main__":
+    import unsloth  # noqa: F401 - transformers보다 먼저 import되어야 함
+
+    parser = argparse.ArgumentParser(description="Serve the local LLM and BGE-M3 encoder to API workers over a Unix socket")
+    parser.add_argument("--socket", default=settings.modelServerSocket or DEFAULT_SOCKET)
+    parser.add_argument("--workers", type=int, default=settings.startupWorkers, help="loader threads")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(args.socket, args.workers)
@@ -0,0 +1,239 @@
+import asyncio, random, threading, time
+from collections import deque
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+import logging
+logger = logging.getLogger("uvicorn")
+
+# 재시도할 오류 - 요청 제한(429), 서버 오류(5xx), 연결 실패, 제한 시간 초과
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    대기열 대기와 재시도를 포함한 요청 처리 시간이 deadline을 넘었을 때 발생합니다.
+    """
+    pass
+
+
+def retry_after(error: Exception):
+    """
+    오류 응답의 retry-after-ms / retry-after 헤더(초)를 반환합니다. 없으면 None
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            continue
+    return None
+
+
+class OpenAIClient:
+    """
+    연결 풀을 공유하는 비동기 OpenAI 호환 Chat Completions 클라이언트입니다.
+    동기 코드(파이프라인 스레드)에서는 create_sync / stream_sync로 전용 이벤트 루프에 요청을 위임합니다.
+    - 동시 요청 수를 max_in_flight로 제한하며, 대기 중인 요청은 도착 순서대로 처리
+    - 429, 5xx, 연결 오류는 지수 백오프(full jitter)로 재시도하고, retry-after 헤더가 있으면 그 시간 이상 대기
+    - 대기열 대기와 재시도를 포함한 요청 전체가 deadline(초) 안에 끝나지 않으면 DeadlineExceeded 발생
+    """
+    def __init__(self, api_key: str, base_url: str = "", max_in_flight: int = 8, max_connections: int = 16,
+                 deadline: float = 60.0, max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.api_key = api_key
+        self.base_url = base_url or None
+        self.max_in_flight = max_in_flight
+        self.max_connections = max_connections
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._client = None
+        self._slots = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._latencies = deque(maxlen=1024)
+        self.metrics = {
+            "requests": 0, "attempts": 0, "retries": 0, "rate_limited": 0, "errors": 0, "deadline_exceeded": 0,
+            "in_flight": 0, "queued": 0, "queue_wait_total": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+        }
+
+    def _get_client(self) -> AsyncOpenAI:
+        if self._client is None:
+            # 재시도와 제한 시간은 이 클래스에서 처리
+            self._client = AsyncOpenAI(
+                api_key=self.api_key or "unused",
+                base_url=self.base_url,
+                max_retries=0,
+                timeout=self.deadline,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                ),
+            )
+            # asyncio.Semaphore는 대기 중인 요청을 도착 순서대로 깨움
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self._client
+
+    def _count(self, name: str, value=1):
+        with self._metrics_lock:
+            self.metrics[name] += value
+
+    def _count_usage(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        with self._metrics_lock:
+            self.metrics["prompt_tokens"] += usage.prompt_tokens or 0
+            self.metrics["completion_tokens"] += usage.completion_tokens or 0
+            self.metrics["cached_tokens"] += (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        wait = retry_after(error)
+        return max(delay, wait) if wait is not None else delay
+
+    async def _acquire(self, expires: float):
+        self._count("queued")
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), max(0.0, expires - start))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"OpenAI request waited {self.deadline} seconds for a free slot")
+        finally:
+            self._count("queued", -1)
+            self._count("queue_wait_total", time.monotonic() - start)
+        self._count("in_flight")
+
+    def _release(self):
+        self._count("in_flight", -1)
+        self._slots.release()
+
+    async def _with_retries(self, attempt_fn, deadline: float = None):
+        """
+        슬롯을 얻은 뒤 attempt_fn(남은 시간)을 실행하고, 재시도할 수 있는 오류면 백오프 후 다시 실행합니다.
+        재시도 대기 중에는 슬롯을 반납합니다.
+        """
+        self._get_client()
+        expires = time.monotonic() + (deadline or self.deadline)
+        self._count("requests")
+        start = time.perf_counter()
+        try:
+            for attempt in range(self.max_retries + 1):
+                await self._acquire(expires)
+                try:
+                    remaining = expires - time.monotonic()
+                    self._count("attempts")
+                    return await asyncio.wait_for(attempt_fn(remaining), remaining)
+                except asyncio.TimeoutError:
+                    raise DeadlineExceeded(f"OpenAI request exceeded the {deadline or self.deadline} second deadline")
+                except RETRYABLE_ERRORS as e:
+                    if isinstance(e, openai.RateLimitError):
+                        self._count("rate_limited")
+                    delay = self.backoff(attempt, e)
+                    if attempt == self.max_retries or time.monotonic() + delay >= expires:
+                        # APITimeoutError는 APIConnectionError의 하위 클래스 - 마지막 시도의 시간 초과는 DeadlineExceeded로 알림
+                        if isinstance(e, openai.APITimeoutError):
+                            raise DeadlineExceeded(f"OpenAI request timed out on attempt {attempt + 1}") from e
+                        raise
+                    logger.warning(f"OpenAI request failed ({type(e).__name__}), retrying in {delay:.2f} seconds")
+                    self._count("retries")
+                finally:
+                    self._release()
+                await asyncio.sleep(delay)
+        except DeadlineExceeded:
+            self._count("deadline_exceeded")
+            raise
+        except Exception:
+            self._count("errors")
+            raise
+        finally:
+            with self._metrics_lock:
+                self._latencies.append(time.perf_counter() - start)
+
+    async def create(self, deadline: float = None, **kwargs):
+        """
+        chat.completions.create 응답을 반환합니다.
+        """
+        async def attempt(remaining: float):
+            return await self._client.chat.completions.create(timeout=remaining, **kwargs)
+
+        response = await self._with_retries(attempt, deadline)
+        self._count_usage(response.usage)
+        return response
+
+    async def stream(self, on_text, cancelled: threading.Event = None, deadline: float = None, **kwargs):
+        """
+        스트리밍 응답의 텍스트 조각마다 on_text를 호출하고 (전체 텍스트, usage)를 반환합니다.
+        텍스트 조각을 전달하기 전에 실패한 요청만 재시도합니다.
+        """
+        sent = [False]
+
+        async def attempt(remaining: float):
+            text, usage = "", None
+            response = await self._client.chat.completions.create(
+                timeout=remaining, stream=True, stream_options={"include_usage": True}, **kwargs
+            )
+            try:
+                async for event in response:
+                    if cancelled is not None and cancelled.is_set():
+                        break
+                    usage = event.usage or usage
+                    if event.choices and event.choices[0].delta.content:
+                        sent[0] = True
+                        text += event.choices[0].delta.content
+                        on_text(event.choices[0].delta.content)
+            except RETRYABLE_ERRORS:
+                if sent[0]:
+                    raise RuntimeError("OpenAI stream was interrupted")
+                raise
+            finally:
+                await response.close()
+            return text, usage
+
+        text, usage = await self._with_retries(attempt, deadline)
+        self._count_usage(usage)
+        return text, usage
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="openai-client", daemon=True).start()
+        return self._loop
+
+    def create_sync(self, deadline: float = None, **kwargs):
+        return asyncio.run_coroutine_threadsafe(self.create(deadline, **kwargs), self._ensure_loop()).result()
+
+    def stream_sync(self, on_text, cancelled: threading.Event = None, deadline: float = None, **kwargs) -> tuple:
+        return asyncio.run_coroutine_threadsafe(self.stream(on_text, cancelled, deadline, **kwargs), self._ensure_loop()).result()
+
+    def stats(self) -> dict:
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+            latencies = sorted(self._latencies)
+        requests = metrics["requests"]
+        return {
+            "requests": requests,
+            "attempts": metrics["attempts"],
+            "retries": metrics["retries"],
+            "rate_limited": metrics["rate_limited"],
+            "errors": metrics["errors"],
+            "deadline_exceeded": metrics["deadline_exceeded"],
+            "in_flight": metrics["in_flight"],
+            "queued": metrics["queued"],
+            "limit": self.max_in_flight,
+            "avg_queue_wait": round(metrics["queue_wait_total"] / requests, 3) if requests else 0.0,
+            "p50_latency": round(latencies[len(latencies) // 2], 3) if latencies else 0.0,
+            "p95_latency": round(latencies[int(len(latencies) * 0.95)], 3) if latencies else 0.0,
+            "prompt_tokens": metrics["prompt_tokens"],
+            "completion_tokens": metrics["completion_tokens"],
+            "cached_tokens": metrics["cached_tokens"],
+        }
@@ -0,0 +1,115 @@
+"""
+부하 시험용 OpenAI 호환 스텁 서버 - 실제 API 없이 openai 백엔드를 시험합니다.
+
+사용법:
+    python -m app.services.openai_stub [--port 8100] [--latency 0.5] [--rate-limit 0.1] [--error-rate 0.0]
+    generationBackends=openai openAiBaseURL=http://localhost:8100/v1 python -m uvicorn app.main:app
+
+--rate-limit, --error-rate 비율만큼 429(retry-after 포함), 500 응답을 반환합니다.
+"""
+import argparse, asyncio, json, random, time, uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_RESPONSE = '```\nname = "Scenario1"\ncron = ""\nperiod = -1\n(#Light).switch_on()\n```'
+
+
+def build_app(response: str = DEFAULT_RESPONSE, latency: float = 0.5, rate_limit: float = 0.0, error_rate: float = 0.0,
+              retry_after: float = 0.2, chunk_size: int = 8) -> FastAPI:
+    app = FastAPI()
+    counters = {"requests": 0, "rate_limited": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def usage(messages: list) -> dict:
+        # 토큰 수 대신 대략적인 단어 수를 사용
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(response.split()),
+            "total_tokens": prompt_tokens + len(response.split()),
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        counters["requests"] += 1
+        roll = random.random()
+        if roll < rate_limit:
+            counters["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after-ms": str(int(retry_after * 1000))},
+            )
+        if roll < rate_limit + error_rate:
+            counters["errors"] += 1
+            return JSONResponse({"error": {"message": "Internal server error", "type": "server_error"}}, status_code=500)
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+
+        if not body.get("stream"):
+            counters["in_flight"] += 1
+            counters["max_in_flight"] = max(counters["max_in_flight"], counters["in_flight"])
+            try:
+                await asyncio.sleep(latency)
+            finally:
+                counters["in_flight"] -= 1
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": response}, "finish_reason": "stop"}],
+                "usage": usage(body.get("messages", [])),
+            }
+
+        async def events():
+            counters["in_flight"] += 1
+            counters["max_in_flight"] = max(counters["max_in_flight"], counters["in_flight"])
+            try:
+                pieces = [response[i:i + chunk_size] for i in range(0, len(response), chunk_size)]
+                for piece in pieces:
+                    await asyncio.sleep(latency / max(1, len(pieces)))
+                    chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [], "usage": usage(body.get("messages", [])),
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                counters["in_flight"] -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return counters
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.5, help="response latency in seconds")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="retry-after of 429 responses in seconds")
+    parser.add_argument("--response", default=DEFAULT_RESPONSE, help="fixed completion text")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        build_app(args.response, args.latency, args.rate_limit, args.error_rate, args.retry_after),
+        host=args.host, port=args.port, log_level="warning",
+    )
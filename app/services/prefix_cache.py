@@ -0,0 +1,95 @@
+import copy, threading, torch
+from collections import OrderedDict
+import logging
+logger = logging.getLogger("uvicorn")
+
+
+def common_prefix_length(a, b) -> int:
+    """
+    두 토큰 시퀀스의 공통 접두부 길이를 반환합니다.
+    """
+    n = min(len(a), len(b))
+    a = torch.as_tensor(a[:n])
+    b = torch.as_tensor(b[:n])
+    mismatch = (a != b).nonzero()
+    return int(mismatch[0]) if len(mismatch) else n
+
+
+class PrefixCache:
+    """
+    시스템 프롬프트 접두부의 KV 캐시를 보관하고 재사용합니다.
+    - 문법(grammar) 접두부: 모델/어댑터/문법 버전 당 한 번만 prefill
+    - (grammar, service_doc) 전체 접두부: 선택된 디바이스 집합을 키로 하는 LRU
+    """
+    def __init__(self, model, tokenizer, base_text: str, max_entries: int = 4):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # 문법 접두부는 모든 요청에서 동일하므로 로드 시 한 번만 prefill
+        self._base_ids = self._tokenize(base_text)
+        self._base_cache = self._prefill(self._base_ids)
+        logger.info(f"Grammar prefix cached: {len(self._base_ids)} tokens")
+
+    def _tokenize(self, text: str) -> torch.Tensor:
+        return self.tokenizer(text, add_special_tokens=False, return_tensors="pt")["input_ids"][0]
+
+    @torch.no_grad()
+    def _prefill(self, ids: torch.Tensor, cache=None, cached_len: int = 0):
+        from transformers import DynamicCache
+        if cache is None:
+            cache = DynamicCache()
+        self.model(
+            input_ids=ids[None, cached_len:].to(self.model.device),
+            past_key_values=cache,
+            use_cache=True,
+        )
+        return cache
+
+    def _build_entry(self, prefix_text: str):
+        # 문법 접두부 캐시를 복사한 뒤 디바이스 문서 부분만 추가로 prefill
+        prefix_ids = self._tokenize(prefix_text)
+        shared = common_prefix_length(self._base_ids, prefix_ids)
+        cache = copy.deepcopy(self._base_cache)
+        if shared < len(self._base_ids):
+            cache.crop(shared)
+        if shared < len(prefix_ids):
+            cache = self._prefill(prefix_ids, cache, shared)
+        return prefix_ids, cache
+
+    def lookup(self, input_ids, key, prefix_text: str):
+        """
+        input_ids에 재사용할 수 있는 KV 캐시 사본과 캐시된 토큰 수를 반환합니다.
+        generate 호출 시 past_key_values로 전달하면 캐시되지 않은 토큰만 prefill 됩니다.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is None:
+            entry = self._build_entry(prefix_text)
+            with self._lock:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        prefix_ids, cache = entry
+        cached = common_prefix_length(prefix_ids, input_ids)
+        # 마지막 토큰의 logits 계산을 위해 최소 한 토큰은 캐시에서 제외
+        cached = min(cached, len(input_ids) - 1)
+        cache = copy.deepcopy(cache)
+        if cached < len(prefix_ids):
+            cache.crop(cached)
+        return cache, cached
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
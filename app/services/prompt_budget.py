@@ -0,0 +1,126 @@
+import re, threading
+from collections import OrderedDict
+
+SEPARATOR = "\n---\n"
+COMMENT_PATTERN = re.compile(r"[ \t]*//[^\n]*")
+# 값 정의가 모두 빠진 Enums 블록 - 다음 줄이 같은 들여쓰기의 다른 블록
+EMPTY_ENUMS_PATTERN = re.compile(r"^([ \t]*)Enums:\n(?:[ \t]*\n)*(?=\1\S)", re.MULTILINE)
+# 압축 단계 - 0: 원본, 1: 주석 제거, 2: enum 정리
+FULL, NO_COMMENTS, COLLAPSED_ENUMS = 0, 1, 2
+
+
+def strip_comments(doc: str) -> str:
+    """
+    '//' 설명 주석(지원 모드 문자열 포함)을 제거합니다.
+    """
+    return COMMENT_PATTERN.sub("", doc)
+
+
+def collapse_enums(doc: str, enums: tuple) -> str:
+    """
+    한 곳에서만 쓰이는 enum은 사용 위치에 값 목록을 직접 쓰고, 쓰이지 않는 enum과 함께 Enums 블록에서 제거합니다.
+    """
+    for name, values in enums:
+        uses = len(re.findall(rf"\b{name}\b", doc)) - 1
+        if uses > 1:
+            continue
+        doc = re.sub(rf"^[ \t]+{name}: \[[^\]]*\][^\n]*\n", "", doc, count=1, flags=re.MULTILINE)
+        if uses == 1:
+            doc = re.sub(rf"\b{name}\b", f"[{', '.join(values)}]", doc, count=1)
+    return EMPTY_ENUMS_PATTERN.sub("", doc)
+
+
+class PromptAssembler:
+    """
+    시스템 프롬프트의 <DEVICES> 부분을 토큰 예산 안에서 구성합니다.
+    디바이스 설명 조각의 토큰 수는 (카탈로그 버전, 디바이스, 사용자 태그, 압축 단계) 별로 캐시합니다.
+    예산을 넘으면 추천 순위가 낮은 디바이스부터 다음 순서로 줄입니다.
+    1. '//' 주석 제거  2. enum 정리  3. 디바이스 제외 (pinned 디바이스는 제외하지 않음)
+    budget이 0이면 제한하지 않으며 토큰 수도 세지 않습니다.
+    """
+    def __init__(self, tokenizer, device_catalog, budget: int = 0, cache_size: int = 4096):
+        self.tokenizer = tokenizer
+        self.catalog = device_catalog
+        self.budget = budget
+        self.cache_size = cache_size
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"assembled": 0, "compacted": 0, "dropped_devices": 0, "over_budget": 0}
+        self.separator_tokens = self.count_tokens(SEPARATOR) if budget > 0 else 0
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def fragment(self, device_classes, name: str, level: int) -> tuple:
+        """
+        디바이스 설명 조각과 토큰 수를 반환합니다.
+        """
+        key = (self.catalog.version, name, device_classes.extra_tags.get(name, ()), level)
+        with self._lock:
+            cached = self._fragments.get(key)
+            if cached is not None:
+                self._fragments.move_to_end(key)
+                return cached
+
+        text = device_classes[name]
+        if level >= NO_COMMENTS:
+            text = strip_comments(text)
+        if level >= COLLAPSED_ENUMS:
+            text = collapse_enums(text, self.catalog[name].enums)
+        cached = (text, self.count_tokens(text))
+
+        with self._lock:
+            self._fragments[key] = cached
+            while len(self._fragments) > self.cache_size:
+                self._fragments.popitem(last=False)
+        return cached
+
+    def assemble(self, device_classes, ranked: list, pinned: set = (), extra: list = ()) -> dict:
+        """
+        ranked(추천 순위 순 디바이스 이름) 설명 뒤에 extra([(디바이스 이름, 설명)])를 붙인 <DEVICES> 문자열을 구성합니다.
+        반환값: {"service_doc", "devices": 포함된 디바이스, "dropped": 제외된 디바이스, "tokens": 예산 적용 시 추정 토큰 수}
+        """
+        if self.budget <= 0:
+            docs = [device_classes[name] for name in ranked] + [text for _, text in extra]
+            return {"service_doc": SEPARATOR.join(docs), "devices": list(ranked) + [name for name, _ in extra], "dropped": [], "tokens": None}
+
+        levels = {name: FULL for name in ranked}
+        extra_tokens = sum(self.count_tokens(text) for _, text in extra)
+
+        def total() -> int:
+            tokens = sum(self.fragment(device_classes, name, level)[1] for name, level in levels.items())
+            return tokens + extra_tokens + self.separator_tokens * max(0, len(levels) + len(extra) - 1)
+
+        tokens = total()
+        for level in (NO_COMMENTS, COLLAPSED_ENUMS):
+            for name in reversed(ranked):
+                if tokens <= self.budget:
+                    break
+                levels[name] = level
+                tokens = total()
+
+        dropped = []
+        for name in reversed(ranked):
+            if tokens <= self.budget:
+                break
+            if name in pinned:
+                continue
+            del levels[name]
+            dropped.append(name)
+            tokens = total()
+
+        with self._lock:
+            self.counters["assembled"] += 1
+            self.counters["compacted"] += any(level > FULL for level in levels.values()) or bool(dropped)
+            self.counters["dropped_devices"] += len(dropped)
+            self.counters["over_budget"] += tokens > self.budget
+
+        docs = [self.fragment(device_classes, name, level)[0] for name, level in levels.items()] + [text for _, text in extra]
+        return {"service_doc": SEPARATOR.join(docs), "devices": list(levels) + [name for name, _ in extra], "dropped": dropped, "tokens": tokens}
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["cached_fragments"] = len(self._fragments)
+        stats["budget"] = self.budget
+        return stats
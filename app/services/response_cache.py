@@ -0,0 +1,185 @@
+import re, json, copy, time, hashlib, threading
+from datetime import datetime
+from collections import OrderedDict
+import numpy as np
+from .device_profiles import profile_hash
+
+# 현재 시각을 기준으로 해석해야 하는 표현 - 이런 명령은 짧은 시간 단위로만 캐시를 공유
+RELATIVE_TIME_PATTERN = re.compile(
+    r"(\d+\s*(초|분|시간|일)\s*(후|뒤|있다가|동안)|지금|방금|이따|잠시|오늘|내일|모레|이번|다음"
+    r"|\bin \d+|\bafter\b|\bnow\b|\btoday\b|\btonight\b|\btomorrow\b|\bnext\b|\blater\b)",
+    re.IGNORECASE,
+)
+
+
+def normalize_sentence(sentence: str) -> str:
+    """
+    공백, 대소문자, 끝 문장부호 차이를 무시한 비교용 명령어
+    """
+    return " ".join(sentence.split()).rstrip(".!?~ ").lower()
+
+
+def resource_version(*parts: str) -> str:
+    """
+    캐시한 응답을 만든 리소스(서비스 목록, 문법, 모델/어댑터)의 버전 - 하나라도 바뀌면 캐시를 공유하지 않음
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    같은 디바이스 프로필에 반복되는 명령어의 최종 응답을 캐시합니다.
+    - 정확 일치: (정규화된 명령어, 프로필 해시, 리소스 버전, 시간 구간, 추가 정보)
+    - 유사 일치: 같은 그룹(명령어를 제외한 나머지 키) 안에서 번역문의 dense 벡터 코사인 유사도가 threshold 이상
+    최대 항목 수(LRU)와 TTL로 정리하며, similarity_threshold가 0이면 유사 일치를 사용하지 않습니다.
+    """
+    def __init__(self, max_entries: int = 1024, ttl_seconds: int = 3600, similarity_threshold: float = 0.0,
+                 time_bucket: int = 3600, relative_time_bucket: int = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.time_bucket = time_bucket
+        self.relative_time_bucket = relative_time_bucket
+        self._entries = OrderedDict()   # (group, 명령어) -> (결과, dense 벡터, 저장 시각)
+        self._groups = {}               # group -> {(group, 명령어), ...}
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "bypassed": 0, "stored": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def time_bucket_of(self, sentence: str, current_time: str):
+        """
+        current_time이 속한 시간 구간 - 상대적인 시간 표현이 있는 명령은 더 짧은 구간을 사용
+        """
+        bucket = self.relative_time_bucket if RELATIVE_TIME_PATTERN.search(sentence) else self.time_bucket
+        try:
+            timestamp = datetime.fromisoformat(current_time.strip()).timestamp()
+        except (ValueError, AttributeError):
+            return current_time
+        return f"{bucket}:{int(timestamp // bucket)}"
+
+    def make_key(self, sentence: str, profile_hash: str, version: str, current_time: str, other_params=None) -> tuple:
+        params = json.dumps(other_params, sort_keys=True, ensure_ascii=False) if other_params else ""
+        group = (profile_hash, version, self.time_bucket_of(sentence, current_time), params)
+        return group, normalize_sentence(sentence)
+
+    def count_bypassed(self):
+        with self._lock:
+            self.counters["bypassed"] += 1
+
+    def _alive(self, key: tuple, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry[2] >= self.ttl:
+            self._drop(key)
+            return None
+        return entry
+
+    def _drop(self, key: tuple):
+        self._entries.pop(key, None)
+        members = self._groups.get(key[0])
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self._groups[key[0]]
+
+    def get(self, key: tuple):
+        """
+        정확히 일치하는 응답을 반환합니다. 없으면 None을 반환합니다.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._alive(key, time.time())
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.counters["exact_hits"] += 1
+            return entry[0]
+
+    def get_similar(self, key: tuple, vector: np.ndarray):
+        """
+        같은 그룹에서 dense 벡터가 가장 가까운 응답을 반환합니다. threshold 미만이면 None을 반환합니다.
+        """
+        if not self.enabled or self.similarity_threshold <= 0 or vector is None:
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+        now = time.time()
+        with self._lock:
+            members = [k for k in list(self._groups.get(key[0], ())) if self._alive(k, now) is not None and self._entries[k][1] is not None]
+            if members:
+                scores = np.stack([self._entries[k][1] for k in members]) @ vector
+                best = int(scores.argmax())
+                if scores[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(members[best])
+                    self.counters["semantic_hits"] += 1
+                    return self._entries[members[best]][0]
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key: tuple, result: dict, vector: np.ndarray = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (result, vector, time.time())
+            self._groups.setdefault(key[0], set()).add(key)
+            self.counters["stored"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._entries)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["exact_hits"] + stats["semantic_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+def lookup_cached_response(sentence, connected_devices, current_time, other_params, model_resources, profile, use_cache, version=None) -> tuple:
+    """
+    응답 캐시 키를 만들고 정확히 일치하는 응답을 찾습니다.
+    version이 없으면 model_resources의 리소스 버전을 사용합니다.
+    캐시를 사용하지 않으면 키가 None이며, 반환값은 (키, 캐시된 결과 또는 None)입니다.
+    """
+    response_cache = model_resources["response_cache"]
+    if not response_cache.enabled:
+        return None, None
+    if not use_cache:
+        response_cache.count_bypassed()
+        return None, None
+
+    content_hash = profile.content_hash if profile is not None else profile_hash(connected_devices)
+    cache_key = response_cache.make_key(sentence, content_hash, version or model_resources["resource_version"], current_time, other_params)
+    return cache_key, response_cache.get(cache_key)
+
+def build_cached_result(cached: dict, start: datetime, tier: str) -> dict:
+    """
+    캐시된 응답을 같은 형태로 반환합니다. 생성을 건너뛰었으므로 추론 관련 값은 0으로 표시합니다.
+    """
+    end = datetime.now()
+    log = {
+        **cached["log"],
+        "response_time": f"{(end - start).total_seconds():.3f} seconds",
+        "inference_time": "0.000 seconds",
+        "cache_hit": True,
+        "cache_tier": tier,
+    }
+    for name, value in (("batch_size", 0), ("prompt_tokens", 0), ("cached_prompt_tokens", 0), ("speculative", False), ("stage_timings", None)):
+        if name in log:
+            log[name] = value
+    return {"code": copy.deepcopy(cached["code"]), "log": log}
+
+def store_cached_response(cache_key, result: dict, query_vector, model_resources: dict):
+    # 유효한 시나리오가 없는 응답은 일시적인 생성 실패일 수 있으므로 캐시하지 않음
+    if cache_key is not None and result["code"]:
+        model_resources["response_cache"].put(cache_key, copy.deepcopy(result), query_vector)
@@ -1,118 +1,147 @@
 # run.py
 
-import os, re, json, copy, torch
-import concurrent.futures
+import json, threading
 from datetime import datetime
-from transformers import TextStreamer
 from .translate import deepl_translate
-from .embedding import hybrid_recommend
-from .validate import validate
-from .joi_tool import parse_scenarios, extract_last_code_block, extract_device_tags, add_device_tags
+from .embedding import hybrid_recommend, encode_query
+from .validate import validate_batch, translate_string_literals_batch
+from app.config import settings
+from .executor import stage, StageGraph, STAGE_POOL
+from .joi_tool import parse_scenarios, extract_last_code_block, extract_completed_scenarios, build_system_prompt
+from .device_profiles import DeviceProfile, derive_device_state
+from .response_cache import lookup_cached_response, build_cached_result, store_cached_response, resource_version
 import logging
 logger = logging.getLogger("uvicorn")
 
-# JOI 코드 생성 함수
-def generate_joi_code(
+def plan_retrieval(graph: StageGraph, sentence: str, connected_devices: dict, model_resources: dict, profile: DeviceProfile = None):
+    """
+    명령어 번역, 디바이스 전처리, 디바이스 검색 단계를 graph에 등록합니다.
+    - translate, devices: 서로 독립적이므로 동시에 실행
+    - speculative_retrieve: 번역을 기다리는 동안 원문으로 먼저 검색 (BGE-M3는 다국어 모델)
+    - retrieve: 번역문이 원문과 같으면 원문 검색 결과를 그대로 사용하고, 아니면 번역문으로 다시 검색
+    """
+    encoder = model_resources["encoder"]
+    embedding_data = model_resources["embedding_data"]
+    device_catalog = model_resources["device_catalog"]
+
+    # 명령어 번역
+    def translate():
+        try:
+            with stage("http"):
+                sentence_translated = deepl_translate(sentence)
+        except Exception:
+            sentence_translated = sentence
+        logger.info(f"Translated Sentence: {sentence_translated}")
+        return sentence_translated
+
+    # 디바이스 및 태그 정보 추출, 디바이스 클래스 docs에 태그 주석 추가
+    # 등록된 프로필이면 미리 계산된 결과를 사용하고, 아니면 이번 요청에서 계산
+    def devices():
+        if profile is not None:
+            return profile.state
+        return derive_device_state(connected_devices, device_catalog, embedding_data["metadata"]["keys"])
+
+    # 명령어로부터 필요한 디바이스를 추출 - BGE-M3 모델 이용 (동시 요청의 인코딩은 공유 인코더에서 묶어서 처리)
+    def search(text: str, device_state: dict) -> dict:
+        query_emb = encode_query(encoder, text)
+        recommended = hybrid_recommend(encoder, text, embedding_data, device_state["retrieval_mask"], query_emb=query_emb)
+        return {"text": text, "query_emb": query_emb, "recommended": recommended}
+
+    graph.add("translate", translate)
+    graph.add("devices", devices)
+    deps = ("translate", "devices")
+
+    if settings.speculativeRetrieval:
+        def speculative_retrieve(device_state):
+            # 번역이 이미 끝났으면(번역 캐시 적중 등) 원문 검색을 생략
+            if graph.done("translate"):
+                return None
+            return search(sentence, device_state)
+        graph.add("speculative_retrieve", speculative_retrieve, ("devices",))
+        deps += ("speculative_retrieve",)
+
+    def retrieve(sentence_translated, device_state, speculative=None):
+        # 번역이 원문을 그대로 돌려준 경우(번역 불필요, 번역 실패 시 원문 유지)에만 원문 검색 결과를 사용
+        if speculative is not None and sentence_translated == sentence:
+            return {**speculative, "speculative": True}
+        return {**search(sentence_translated, device_state), "speculative": False}
+    graph.add("retrieve", retrieve, deps)
+
+def prepare_request(
     sentence: str,
-    model: str,
     connected_devices: dict,
     current_time: str,
     other_params: dict = None,
-    model_resources: dict = None
+    model_resources: dict = None,
+    profile: DeviceProfile = None
 ) -> dict:
     """
-    Requset로부터 JOI 코드를 생성, 검증 후 반환합니다.
+    명령어 번역, 디바이스 태그 정리, 디바이스 추천을 수행하고 프롬프트를 구성합니다.
+    이후 단계에서 사용할 정보를 딕셔너리로 반환하며, 단계 실행 기록은 "graph"에 담깁니다.
     """
-
-    # 모델 리소스 추출
-    llm_model = model_resources["model"]
-    tokenizer = model_resources["tokenizer"]
-    stop_token_ids = model_resources["stop_token_ids"]
-    embed_model = model_resources["embed_model"]
-    embedding_data = model_resources["embedding_data"]
-    sim_model = model_resources["sim_model"]
-    device_classes = copy.deepcopy(model_resources["device_classes"])
     grammar = model_resources["grammar"]
 
     start = datetime.now()
+    graph = StageGraph(STAGE_POOL)
+    plan_retrieval(graph, sentence, connected_devices, model_resources, profile)
 
-    # 명령어 번역
-    try:
-        sentence_translated = deepl_translate(sentence)
-    except Exception:
-        sentence_translated = sentence 
-    logger.info(f"Translated Sentence: {sentence_translated}")
+    def build_prompt(sentence_translated, device_state, retrieval) -> dict:
+        device_classes = device_state["device_classes"]
+        ranked = list(dict.fromkeys(i["key"] for i in retrieval["recommended"]))
+        if "Clock" not in ranked:
+            ranked.append("Clock") # Clock의 Delay 기능을 위해 항상 포함
 
-    # 디바이스 및 태그 정보 추출
-    tag_device, tag_sets = extract_device_tags(connected_devices, device_classes)
+        # 최소한의 TTS에 필요한 Speaker 정보 추가
+        extra = []
+        if ("Speaker" not in ranked):
+            # 현재 Speaker 디바이스가 사용 가능한 디바이스 목록에 있을 경우 포함
+            speaker_summary = device_classes.summary("Speaker")
+            if speaker_summary:
+                speaker_info = speaker_summary + "\n\nMethods:\n  mediaPlayback_speak(text: STRING) -> VOID  # text-to-speech\n\n"
+                extra.append(("Speaker", speaker_info))
 
-    # 디바이스 클래스 docs에 태그 주석 추가
-    device_classes = add_device_tags(device_classes, tag_device)
+        # 토큰 예산을 넘으면 순위가 낮은 디바이스부터 설명을 줄이거나 제외 - 1순위 디바이스와 Clock은 유지
+        assembled = model_resources["prompt_assembler"].assemble(device_classes, ranked, pinned={ranked[0], "Clock"}, extra=extra)
 
-    # 명령어로부터 필요한 디바이스를 추출 - BGE-M3 모델 이용
-    service_selected = set(i["key"] for i in hybrid_recommend(embed_model, sentence_translated, embedding_data, list(tag_device.keys())))
-    service_selected.add("Clock") # Clock의 Delay 기능을 위해 항상 포함
-    
-    service_doc = "\n---\n".join([device_classes[i] for i in service_selected])
-
-    # 최소한의 TTS에 필요한 Speaker 정보 추가
-    if ("Speaker" not in service_selected):
-        # 현재 Speaker 디바이스가 사용 가능한 디바이스 목록에 있을 경우 포함
-        speaker_doc = device_classes.get("Speaker", "")
-        if speaker_doc:
-            match = re.search(r'Device\s+\w+:(?:.*?\n)*?(?=^\s*Enums:)', speaker_doc, re.MULTILINE)
-            if match:
-                speaker_info = match.group().strip() + "\n\nMethods:\n  mediaPlayback_speak(text: STRING) -> VOID  # text-to-speech\n\n"
-                service_doc += "\n---\n" + speaker_info
-                service_selected.add("Speaker")
-
-    # 모델 호출 및 생성
-    prompt = f"Current Time: {current_time}\n\nGenerate JOI Lang code for \"{sentence_translated}\""
-    
-    if other_params:
-        other_params_str = json.dumps(other_params, indent=2, ensure_ascii=False)
-        prompt += f"\n\n<USER_INFO>\n{other_params_str}\n</USER_INFO>"
-
-    messages = [
-        {"role": "system", "content": f"{grammar}\n<DEVICES>\n{service_doc}\n</DEVICES>",},
-        {"role": "user", "content": prompt}
-    ]
-
-    inputs = tokenizer.apply_chat_template(messages, tokenize=True, add_generation_prompt=True, return_tensors="pt").to("cuda")
-
-    start_inference = datetime.now()
-
-    outputs = llm_model.generate(
-        input_ids=inputs,
-        eos_token_id=stop_token_ids,
-        pad_token_id=tokenizer.pad_token_id,
-        max_new_tokens=1024,
-        use_cache=True,
-        # 더 일관된 출력을 위한 인자들
-        # do_sample=False,
-        temperature=0.1,
-        repetition_penalty=1.2,
-        streamer = TextStreamer(tokenizer, skip_prompt = True),
-    )
-
-    end_inference = datetime.now()
-
-    generated_ids = outputs[0][len(inputs[0]):]
-    
-    # stop_token_ids에 해당하는 토큰이 생성된 경우, 해당 인덱스까지 잘라냄
-    stop_indexes = [i for i, tok_id in enumerate(generated_ids) if tok_id in stop_token_ids]
-    if stop_indexes:
-        generated_ids = generated_ids[:stop_indexes[0]]
+        # 모델 호출 및 생성
+        prompt = f"Current Time: {current_time}\n\nGenerate JOI Lang code for \"{sentence_translated}\""
 
-    response = tokenizer.decode(generated_ids, skip_special_tokens=True).strip()
+        if other_params:
+            other_params_str = json.dumps(other_params, indent=2, ensure_ascii=False)
+            prompt += f"\n\n<USER_INFO>\n{other_params_str}\n</USER_INFO>"
 
-    # logger.info(f"\nModel Response:\n{response}")
-    
-    # 생성한 텍스트에서 코드 추출
+        messages = [
+            {"role": "system", "content": build_system_prompt(grammar, assembled["service_doc"]),},
+            {"role": "user", "content": prompt}
+        ]
+        return {"assembled": assembled, "messages": messages}
+
+    prompt = graph.call("prompt", build_prompt, ("translate", "devices", "retrieve"))
+    device_state = graph.result("devices")
+    retrieval = graph.result("retrieve")
+
+    return {
+        "start": start,
+        "graph": graph,
+        "sentence_translated": graph.result("translate"),
+        "device_classes": device_state["device_classes"],
+        "tag_device": device_state["tag_device"],
+        "tag_sets": device_state["tag_sets"],
+        "service_selected": set(prompt["assembled"]["devices"]),
+        "service_doc": prompt["assembled"]["service_doc"],
+        "dropped_devices": prompt["assembled"]["dropped"],
+        "messages": prompt["messages"],
+        "query_vector": retrieval["query_emb"]["dense"],
+        "speculative_retrieval": retrieval["speculative"],
+    }
+
+def extract_code(response: str) -> list:
+    """
+    생성한 텍스트에서 시나리오 코드를 추출합니다.
+    """
     try:
         code = parse_scenarios(extract_last_code_block(response))['code']
-    except Exception as e:
-        # print(f"Error extracting code block: {e}")
+    except Exception:
         try:
             code = parse_scenarios(response)['code']
         except Exception as e:
@@ -120,19 +149,56 @@ def generate_joi_code(
             code = [{'name': 'Scenario1', 'cron': '', 'period': -1, 'code': ''}]
 
     logger.info(f"\nExtracted Code:\n{code}")
+    return code
 
-    # 각 코드 조각 별로 정제, 검증
-    code_ret = []
-    for c in code:
-        code_piece = c["code"].strip()
-        # 유사도 기반 교정 & 태그 검사 & 영어 문자열 번역
-        # 인자: 코드, docs, 사용 가능한 디바이스, 디바이스 별 태그 집합, sentence transformer 모델
-        code_piece = validate(code_piece, device_classes, list(tag_device.keys()), tag_sets, sim_model)
-        c["code"] = code_piece
-        if (c["code"]==""):
-            continue
-        code_ret.append(c)
+def validate_scenarios(scenarios: list, context: dict, accessor_index, memo: dict = None) -> list:
+    """
+    한 응답의 시나리오 코드를 함께 정제, 검증하여 유효한 시나리오만 반환합니다.
+    미확인 식별자는 모든 시나리오에서 모아 한 번에 인코딩합니다.
+    memo에 같은 코드의 검증 결과가 있으면 재사용합니다.
+    """
+    memo = {} if memo is None else memo
+    pending = list(dict.fromkeys(c["code"].strip() for c in scenarios if c["code"].strip() not in memo))
+    if pending:
+        # 유사도 기반 교정 & 태그 검사 - 문자열 번역은 translate_scenarios에서 한 번에 수행
+        # 인자: 코드, docs, 사용 가능한 디바이스, 디바이스 별 태그 집합, 접근자 임베딩 인덱스
+        validated = validate_batch(pending, context["device_classes"], list(context["tag_device"].keys()), context["tag_sets"], accessor_index)
+        memo.update(zip(pending, validated))
 
+    results = []
+    for c in scenarios:
+        validated = memo[c["code"].strip()]
+        if validated != "":
+            results.append({**c, "code": validated})
+    return results
+
+def translate_scenarios(scenarios: list) -> list:
+    """
+    모든 시나리오의 스피커 출력 문자열을 한 번의 DeepL 요청으로 번역합니다.
+    """
+    with stage("http"):
+        codes = translate_string_literals_batch([c["code"] for c in scenarios])
+    return [{**c, "code": code} for c, code in zip(scenarios, codes)]
+
+def finish_scenarios(graph: StageGraph, scenarios: list, context: dict, accessor_index) -> list:
+    """
+    시나리오를 검증(encode)한 뒤, 통과한 시나리오의 스피커 출력 문자열만 한 번의 DeepL 요청으로 번역(http)합니다.
+    검증 과정에서 문자열 리터럴이 바뀔 수 있으므로(태그 구분자 정리 등) 번역은 검증 결과에 대해 한 번만 수행합니다.
+    """
+    graph.add("validate", lambda _: validate_scenarios(scenarios, context, accessor_index), ("generate",))
+    return graph.call("translate_literals", translate_scenarios, ("validate",))
+
+def select_backend(model_resources: dict, backend: str = None):
+    """
+    요청한 생성 백엔드를 반환합니다. 없으면 배포 기본 백엔드를 사용하며, 불러오지 않은 백엔드면 KeyError가 발생합니다.
+    """
+    backends = model_resources["backends"]
+    name = backend or model_resources["default_backend"]
+    if name not in backends:
+        raise KeyError(f"Unknown generation backend: {name} (available: {', '.join(backends)})")
+    return backends[name]
+
+def build_result(context: dict, code_ret: list, generation: dict, backend) -> dict:
     logger.info(f"\nReturn:\n{code_ret}")
 
     end = datetime.now()
@@ -140,50 +206,160 @@ def generate_joi_code(
     return {
         "code": code_ret,
         "log": {
-            "response_time": f"{(end - start).total_seconds():.3f} seconds",
-            "inference_time": f"{(end_inference - start_inference).total_seconds():.3f} seconds",
-            "translated_sentence": sentence_translated,
-            "mapped_devices": list(service_selected)
+            "response_time": f"{(end - context['start']).total_seconds():.3f} seconds",
+            "inference_time": f"{generation['inference_time']:.3f} seconds",
+            "backend": backend.name,
+            "batch_size": generation["batch_size"],
+            "prompt_tokens": generation["prompt_tokens"],
+            "cached_prompt_tokens": generation["cached_tokens"],
+            "speculative": generation["speculative"],
+            "translated_sentence": context["sentence_translated"],
+            "mapped_devices": list(context["service_selected"]),
+            "dropped_devices": context["dropped_devices"],
+            "speculative_retrieval": context["speculative_retrieval"],
+            "stage_timings": context["graph"].timings(),
+            "cache_hit": False
         }
     }
 
+# JOI 코드 생성 함수
+def generate_joi_code(
+    sentence: str,
+    model: str,
+    connected_devices: dict,
+    current_time: str,
+    other_params: dict = None,
+    model_resources: dict = None,
+    profile: DeviceProfile = None,
+    use_cache: bool = True,
+    backend: str = None
+) -> dict:
+    """
+    Requset로부터 JOI 코드를 생성, 검증 후 반환합니다.
+    backend로 생성 백엔드(local, openai, stub)를 고르며, 없으면 배포 기본 백엔드를 사용합니다.
+    """
+    accessor_index = model_resources["accessor_index"]
+    generator = select_backend(model_resources, backend)
+
+    # 같은 프로필의 반복 명령은 캐시된 응답을 반환 - 번역 전 명령어로 먼저 확인
+    # 백엔드마다 응답이 다르므로 백엔드 버전을 캐시 키에 포함
+    start = datetime.now()
+    version = resource_version(model_resources["resource_version"], generator.version)
+    cache_key, cached = lookup_cached_response(sentence, connected_devices, current_time, other_params, model_resources, profile, use_cache, version)
+    if cached is not None:
+        return build_cached_result(cached, start, "exact")
+
+    context = prepare_request(sentence, connected_devices, current_time, other_params, model_resources, profile)
+
+    # 번역문의 dense 벡터로 유사한 명령의 응답을 확인
+    if cache_key is not None:
+        cached = model_resources["response_cache"].get_similar(cache_key, context["query_vector"])
+        if cached is not None:
+            return build_cached_result(cached, start, "semantic")
+
+    graph = context["graph"]
+    generation = graph.call("generate", lambda _: generator.generate(context), ("prompt",))
+
+    # logger.info(f"\nModel Response:\n{generation['text']}")
+
+    # 각 코드 조각 별로 정제, 검증
+    code_ret = finish_scenarios(graph, extract_code(generation["text"]), context, accessor_index)
+
+    result = build_result(context, code_ret, generation, generator)
+    store_cached_response(cache_key, result, context["query_vector"], model_resources)
+    return result
 
-# def generate_joi_code(sentence: str, model: str, connected_devices: dict, current_time: str, other_params: dict = None) -> dict:
-#     """
-#     하드코딩된 테스트 결과를 반환하는 generate_joi_code 함수.
-#     실제 LLM 호출 없이 테스트 용도로 사용됩니다.
-
-#     Parameters:
-#     - sentence (str): 자연어 명령어
-#     - model (str): 모델 이름 (사용되지 않음)
-#     - connected_devices (dict): 디바이스 정보
-#     - current_time (str): 현재 시각 (YYYY-MM-DD HH:MM:SS)
-#     - other_params (dict, optional): 기타 옵션
-
-#     Returns:
-#     - dict: JOI 시나리오 및 로그 정보
-#     """
-#     return {
-#         "code": [
-#             {
-#                 "name": "Scenario1",
-#                 "cron": "0 9 * * *",
-#                 "period": -1,
-#                 "code": "(#Light #livingroom).switch_on()"
-#             },
-#             {
-#                 "name": "Scenario2",
-#                 "cron": "0 9 * * *",
-#                 "period": 10000,
-#                 "code": "(#Light #livingroom).switch_on()"
-#             }
-#         ],
-#         "log": {
-#             "response_time": "0.321 seconds",
-#             "inference_time": "0.279 seconds",
-#             "translated_sentence": sentence,
-#             "mapped_devices": [
-#                 "Light"
-#             ]
-#         }
-#     }
+# JOI 코드 스트리밍 생성 함수
+def stream_joi_code(
+    sentence: str,
+    model: str,
+    connected_devices: dict,
+    current_time: str,
+    other_params: dict = None,
+    model_resources: dict = None,
+    cancelled: threading.Event = None,
+    profile: DeviceProfile = None,
+    use_cache: bool = True,
+    backend: str = None
+):
+    """
+    JOI 코드를 생성하면서 이벤트를 순서대로 내보냅니다.
+    - token: 생성된 텍스트 조각
+    - scenario: 헤더와 본문이 완성되어 검증까지 끝난 시나리오
+    - done: /generate_joi_code와 동일한 형태의 최종 결과
+    """
+    accessor_index = model_resources["accessor_index"]
+    generator = select_backend(model_resources, backend)
+
+    start = datetime.now()
+    version = resource_version(model_resources["resource_version"], generator.version)
+    cache_key, cached = lookup_cached_response(sentence, connected_devices, current_time, other_params, model_resources, profile, use_cache, version)
+    if cached is not None:
+        yield from replay_cached_result(build_cached_result(cached, start, "exact"))
+        return
+
+    context = prepare_request(sentence, connected_devices, current_time, other_params, model_resources, profile)
+    if cache_key is not None:
+        cached = model_resources["response_cache"].get_similar(cache_key, context["query_vector"])
+        if cached is not None:
+            yield from replay_cached_result(build_cached_result(cached, start, "semantic"))
+            return
+
+    yield {"event": "prepared", "data": {
+        "translated_sentence": context["sentence_translated"],
+        "mapped_devices": list(context["service_selected"]),
+    }}
+
+    chunks, run_generation = generator.stream(context, cancelled)
+    generation_future = context["graph"].add("generate", lambda _: run_generation(), ("prompt",))
+
+    # 완성된 시나리오는 생성이 끝나기 전에 검증하여 내보냄
+    text = ""
+    emitted = 0
+    emitted_codes = set()
+    memo = {}
+    for chunk in chunks:
+        text += chunk
+        yield {"event": "token", "data": {"text": chunk}}
+
+        completed = extract_completed_scenarios(text)
+        for part in completed[emitted:]:
+            try:
+                scenarios = parse_scenarios(part)['code']
+            except Exception as e:
+                logger.error(f"Error parsing streamed scenario: {e}")
+                continue
+            validated_ret = validate_scenarios(scenarios, context, accessor_index, memo)
+            for validated, translated in zip(validated_ret, translate_scenarios(validated_ret)):
+                emitted_codes.add(validated["code"])
+                yield {"event": "scenario", "data": translated}
+        emitted = max(emitted, len(completed))
+
+    generation = generation_future.result()
+
+    # 최종 결과는 전체 응답 기준으로 다시 추출하되, 이미 검증한 시나리오는 재사용
+    # (이미 내보낸 시나리오의 문자열 번역은 번역 캐시에서 처리됨)
+    code_ret = validate_scenarios(extract_code(generation["text"]), context, accessor_index, memo)
+    translated_ret = translate_scenarios(code_ret)
+
+    # 구분자 없이 끝난 마지막 시나리오는 여기서 내보냄
+    for validated, translated in zip(code_ret, translated_ret):
+        if validated["code"] not in emitted_codes:
+            emitted_codes.add(validated["code"])
+            yield {"event": "scenario", "data": translated}
+
+    result = build_result(context, translated_ret, generation, generator)
+    store_cached_response(cache_key, result, context["query_vector"], model_resources)
+    yield {"event": "done", "data": result}
+
+def replay_cached_result(result: dict):
+    """
+    캐시된 응답을 스트리밍 이벤트 순서대로 내보냅니다.
+    """
+    yield {"event": "prepared", "data": {
+        "translated_sentence": result["log"]["translated_sentence"],
+        "mapped_devices": result["log"]["mapped_devices"],
+    }}
+    for scenario in result["code"]:
+        yield {"event": "scenario", "data": scenario}
+    yield {"event": "done", "data": result}
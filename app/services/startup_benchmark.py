@@ -0,0 +1,57 @@
+"""
+서버 시작 시간 측정 - 모듈 import, 가벼운 구성 요소, 구성 요소 별 로드 시간과 전체 준비 시간(초)을 출력합니다.
+
+사용법:
+    python -m app.services.startup_benchmark [--backends local] [--workers 4] [--output startup.jsonl]
+
+--output을 지정하면 결과를 JSON 한 줄로 덧붙여 이전 측정과 비교할 수 있습니다. --workers 1은 순차 로드와 같습니다.
+"""
+import time
+STARTED = time.perf_counter()
+
+import argparse, json, os, platform, sys
+from datetime import datetime
+
+
+def run(backend_names: list, workers: int) -> dict:
+    if "local" in backend_names:
+        import unsloth  # noqa: F401 - transformers보다 먼저 import되어야 함
+    from app.services.loader import ResourceLoader
+    imported = time.perf_counter()
+
+    loader = ResourceLoader(backend_names, workers=workers)
+    loader.load_light()
+    light = time.perf_counter()
+    loader.start()
+    loader.wait()
+    ready = time.perf_counter()
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "backends": backend_names,
+        "workers": workers,
+        "import_seconds": round(imported - STARTED, 3),
+        "light_seconds": round(light - imported, 3),
+        "ready_seconds": round(ready - STARTED, 3),
+        "components": {name: info["seconds"] for name, info in loader.status()["components"].items()},
+    }
+
+
+if __name__ == "__main__":
+    from app.config import settings
+
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the generation server")
+    parser.add_argument("--backends", default=settings.generationBackends, help="comma separated generation backends")
+    parser.add_argument("--workers", type=int, default=settings.startupWorkers, help="loader threads (1 loads serially)")
+    parser.add_argument("--output", default="", help="append the result as a JSON line to this file")
+    args = parser.parse_args()
+
+    result = run([name.strip() for name in args.backends.split(",") if name.strip()], args.workers)
+    print(json.dumps(result, indent=1, ensure_ascii=False))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        print(f"Result appended to {args.output}", file=sys.stderr)
@@ -1,24 +1,61 @@
-import requests
 from app.config import settings
+from .translation_cache import TranslationCache, is_in_target_language
+from .deepl_client import DeepLClient, CircuitBreaker
 
-def deepl_translate(command, source="KO", target="EN", auth_key=settings.deeplAPI):
+# 프로세스 전역 번역 캐시 - 디스크 계층은 워커 간 공유
+TRANSLATION_CACHE = TranslationCache(
+    path=settings.translationCachePath,
+    memory_size=settings.translationCacheMemorySize,
+    disk_size=settings.translationCacheDiskSize,
+    ttl_seconds=settings.translationCacheTTL,
+)
+
+# 프로세스 전역 DeepL 클라이언트 - 연결 풀과 서킷 브레이커를 모든 요청이 공유
+DEEPL_CLIENT = DeepLClient(
+    url=settings.deeplURL,
+    auth_key=settings.deeplAPI,
+    timeout=settings.deeplTimeout,
+    max_connections=settings.deeplMaxConnections,
+    breaker=CircuitBreaker(settings.deeplFailureThreshold, settings.deeplCooldown),
+)
+
+def deepl_translate(command, source="KO", target="EN"):
     """
     DeepL API를 사용하여 명령어를 번역합니다.
+    이미 대상 언어인 입력은 그대로 반환하고, 성공한 번역 결과는 캐시합니다.
     """
     # return command
-    url = "https://api-free.deepl.com/v2/translate"
-    data = {
-        "auth_key": auth_key,
-        "text": command,
-        "source_lang": source,
-        "target_lang": target,
-    }
-
-    try:
-        response = requests.post(url, data=data, timeout=10)
-        if response.status_code == 200:
-            return response.json()['translations'][0]['text']
-        else:
-            raise Exception(f"Error: {response.status_code}, {response.text}")
-    except Exception as e:
-        return command  # 실패 시 원문 유지
+    return deepl_translate_batch([command], source, target)[0]
+
+def deepl_translate_batch(texts: list, source="KO", target="EN") -> list:
+    """
+    여러 문자열을 한 번의 DeepL 요청으로 번역합니다.
+    캐시에 있거나 번역이 필요 없는 문자열은 요청에서 제외하며, 결과는 입력 순서대로 반환합니다.
+    """
+    results = list(texts)
+    pending = {}
+    for i, text in enumerate(texts):
+        if is_in_target_language(text, target):
+            TRANSLATION_CACHE.count_skipped()
+            continue
+        cached = TRANSLATION_CACHE.get(text, source, target)
+        if cached is not None:
+            results[i] = cached
+            continue
+        pending.setdefault(text, []).append(i)
+
+    if not pending:
+        return results
+
+    # DeepL API는 text 필드를 여러 개 받아 같은 순서로 번역 결과를 반환
+    unique_texts = list(pending)
+    translations = DEEPL_CLIENT.translate_sync(unique_texts, source, target)
+    if translations is None:
+        return results  # 실패 시 원문 유지
+
+    for text, translated in zip(unique_texts, translations):
+        TRANSLATION_CACHE.put(text, source, target, translated)
+        for i in pending[text]:
+            results[i] = translated
+
+    return results
@@ -0,0 +1,115 @@
+import os, re, time, sqlite3, threading
+from collections import OrderedDict
+
+HANGUL_PATTERN = re.compile(r"[가-힣ㄱ-ㆎ]")
+LATIN_PATTERN = re.compile(r"[A-Za-z]")
+
+
+def is_in_target_language(text: str, target: str) -> bool:
+    """
+    번역이 필요 없는 입력인지 확인합니다.
+    EN 번역 요청에 한글이 없거나, KO 번역 요청에 영문자가 없으면 이미 대상 언어로 봅니다.
+    """
+    target = target.upper()
+    if target.startswith("EN"):
+        return not HANGUL_PATTERN.search(text)
+    if target == "KO":
+        return not LATIN_PATTERN.search(text)
+    return False
+
+
+class TranslationCache:
+    """
+    (text, source, target)을 키로 하는 2단계 번역 캐시입니다.
+    - 메모리 LRU: 프로세스 내에서 가장 최근에 사용한 번역
+    - SQLite: 워커 프로세스 간에 공유되며 TTL과 최대 항목 수로 정리
+    """
+    def __init__(self, path: str = "", memory_size: int = 2048, disk_size: int = 100000, ttl_seconds: int = 30 * 24 * 3600):
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "skipped": 0}
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                " text TEXT NOT NULL, source TEXT NOT NULL, target TEXT NOT NULL,"
+                " translated TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (text, source, target))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_translations_accessed ON translations (accessed_at)")
+
+    def count_skipped(self):
+        with self._lock:
+            self.counters["skipped"] += 1
+
+    def get(self, text: str, source: str, target: str):
+        key = (text, source, target)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry[0]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT translated, created_at FROM translations WHERE text = ? AND source = ? AND target = ?", key
+                ).fetchone()
+                if row is not None and now - row[1] < self.ttl:
+                    self._db.execute(
+                        "UPDATE translations SET accessed_at = ? WHERE text = ? AND source = ? AND target = ?", (now, *key)
+                    )
+                    self._remember(key, row[0], row[1])
+                    self.counters["disk_hits"] += 1
+                    return row[0]
+
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, text: str, source: str, target: str, translated: str):
+        key = (text, source, target)
+        now = time.time()
+        with self._lock:
+            self._remember(key, translated, now)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)", (*key, translated, now, now)
+            )
+            # 쓰기 때마다 정리하지 않고 일정 횟수마다 만료/초과 항목 삭제
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._evict(now)
+
+    def _remember(self, key, translated: str, created_at: float):
+        self._memory[key] = (translated, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now: float):
+        self._db.execute("DELETE FROM translations WHERE created_at < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM translations WHERE rowid IN ("
+            " SELECT rowid FROM translations ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_size,),
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                stats["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
@@ -1,158 +1,87 @@
 import re, json
-from sentence_transformers import SentenceTransformer, util
-from .translate import deepl_translate
+from .translate import deepl_translate_batch
+from .executor import stage
+from .joi_tool import extract_classes_by_name, extract_accessors
+from .accessor_index import AccessorIndex, ACCESSOR_KINDS
+from .device_catalog import CatalogOverlay
 
 THRESHOLD = 0.7 
 
-def extract_classes_by_name(text: str):
+def protect_strings(code):
     """
-    문자열로 저장된 디바이스 문서에서 각 디바이스의 설명을 추출해
-    디바이스 이름을 키로, 디바이스 설명을 값으로 하는 딕셔너리를 반환합니다.
+    문자열 리터럴을 플레이스홀더로 치환하여
+    코드 내에서 문자열을 보호합니다.
     """
-    # pattern = r'class\s+(\w+)\s*:\s*\n\s+"""(.*?)"""'
-    pattern = r'Device\s+(\w+)\s*:\s*\n\s+"""(.*?)"""'
-    matches = re.finditer(pattern, text, re.DOTALL)
-
-    class_dict = {}
-    for match in matches:
-        class_name = match.group(1)
-        full_class_def = match.group(0)  # 전체 클래스 문자열
-        class_dict[class_name] = full_class_def
+    strings = []
+    
+    # 삼중 따옴표 문자열 (먼저 처리)
+    def replace_triple_quotes(match):
+        strings.append(match.group(0))
+        return f"__STRING_PLACEHOLDER_{len(strings)-1}__"
+    
+    # 단일/이중 따옴표 문자열
+    def replace_quotes(match):
+        strings.append(match.group(0))
+        return f"__STRING_PLACEHOLDER_{len(strings)-1}__"
+    
+    # 삼중 따옴표 문자열 처리 (""" 또는 ''')
+    code = re.sub(r'""".*?"""', replace_triple_quotes, code, flags=re.DOTALL)
+    code = re.sub(r"'''.*?'''", replace_triple_quotes, code, flags=re.DOTALL)
+    
+    # 일반 문자열 처리 (이스케이프 문자 고려)
+    code = re.sub(r'"(?:[^"\\]|\\.)*"', replace_quotes, code)
+    code = re.sub(r"'(?:[^'\\]|\\.)*'", replace_quotes, code)
+    
+    return code, strings
 
-    return class_dict
+def restore_strings(code, strings):
+    """
+    플레이스홀더를 원래 문자열로 복원합니다.
+    """
+    for i, string in enumerate(strings):
+        code = code.replace(f"__STRING_PLACEHOLDER_{i}__", string)
+    return code
 
+# 종류별 식별자 패턴 - 태그, 메서드, 속성 순서로 교정
+ACCESSOR_PATTERNS = {
+    "tag": r"(#[a-zA-Z0-9_]+)\b",
+    "method": r"\.([a-zA-Z_][a-zA-Z0-9_]*)\(",
+    "attribute": r"\.([a-zA-Z_][a-zA-Z0-9_]*)\b(?!\s*\()",
+}
 
-def extract_accessors(dsl_text: str):
+def validate_accessors_batch(codes: list, candidates: dict, accessor_index) -> list:
     """
-    디바이스 설명에서 태그, 속성, 메서드 접근자를 추출합니다.
-    각 접근자는 해당하는 키로 묶인 딕셔너리 형태로 반환됩니다.
+    여러 코드 조각에서 후보에 없는 태그/메서드/속성을 유사도 기반으로 교정합니다.
+    모든 코드 조각의 미확인 식별자를 먼저 모은 뒤 한 번에 인코딩하고 교정합니다.
+    candidates: {kind: (이름 목록, 정규화 행렬)} - AccessorIndex.candidates의 결과
     """
-    block_patterns = {
-        "Tags": re.compile(r"Tags:\n((?:\s+#[^\n]*\n)+)"),
-        # "Enums": re.compile(r"Enums:\n((?:\s+\w+: \[[^\]]+\]\n*)+)"),
-        "Attributes": re.compile(r"Attributes:\n((?:\s+\w+_\w+: [^\n]+\n*)+)"),
-        "Methods": re.compile(r"Methods:\n((?:\s+\w+\([^\)]*\) -> \w+[^\n]*\n*)+)")
-    }
+    # 문자열 보호
+    protected = [protect_strings(code) for code in codes]
 
-    # Apply all patterns to the sample DSL text
-    blocks = {
-        name: (pattern.search(dsl_text).group(1).strip()).split("\n    ")
-        for name, pattern in block_patterns.items()
-        if pattern.search(dsl_text)
-    }
-    
-    if blocks.get("Tags"):
-        blocks["Tags"] = [line.strip() for line in blocks.get("Tags", [])]
-    if blocks.get("Attributes"):
-        blocks["Attributes"] = [line.split(":")[0].strip() for line in blocks.get("Attributes", [])]
-    if blocks.get("Methods"):
-        blocks["Methods"] = [line.split("(")[0].strip() for line in blocks.get("Methods", [])]
-    return blocks
-
-def validate_accessors(code: str, tag_list, method_list, attribute_list, model) -> str:
-
-    def protect_strings(code):
-        """
-        문자열 리터럴을 플레이스홀더로 치환하여
-        코드 내에서 문자열을 보호합니다.
-        """
-        strings = []
-        
-        # 삼중 따옴표 문자열 (먼저 처리)
-        def replace_triple_quotes(match):
-            strings.append(match.group(0))
-            return f"__STRING_PLACEHOLDER_{len(strings)-1}__"
-        
-        # 단일/이중 따옴표 문자열
-        def replace_quotes(match):
-            strings.append(match.group(0))
-            return f"__STRING_PLACEHOLDER_{len(strings)-1}__"
-        
-        # 삼중 따옴표 문자열 처리 (""" 또는 ''')
-        code = re.sub(r'""".*?"""', replace_triple_quotes, code, flags=re.DOTALL)
-        code = re.sub(r"'''.*?'''", replace_triple_quotes, code, flags=re.DOTALL)
-        
-        # 일반 문자열 처리 (이스케이프 문자 고려)
-        code = re.sub(r'"(?:[^"\\]|\\.)*"', replace_quotes, code)
-        code = re.sub(r"'(?:[^'\\]|\\.)*'", replace_quotes, code)
-        
-        return code, strings
-    
-    def restore_strings(code, strings):
-        """
-        플레이스홀더를 원래 문자열로 복원합니다.
-        """
-        for i, string in enumerate(strings):
-            code = code.replace(f"__STRING_PLACEHOLDER_{i}__", string)
-        return code
+    # 후보에 없는 식별자 수집
+    known = {kind: set(names) for kind, (names, _) in candidates.items()}
+    unknown = {kind: [] for kind in ACCESSOR_PATTERNS}
+    for protected_code, _ in protected:
+        for kind, pattern in ACCESSOR_PATTERNS.items():
+            for name in re.findall(pattern, protected_code):
+                if name not in known[kind] and name not in unknown[kind]:
+                    unknown[kind].append(name)
 
-    # 문자열 보호
-    protected_code, string_literals = protect_strings(code)
-
-    if not tag_list:
-        tag_embeddings = None
-    else:
-        tag_embeddings = model.encode(tag_list, convert_to_tensor=True)
-
-    if not method_list:
-        method_embeddings = None
-    else:
-        method_embeddings = model.encode(method_list, convert_to_tensor=True)
-
-    if not attribute_list:
-        attribute_embeddings = None
-    else:
-        attribute_embeddings = model.encode(attribute_list, convert_to_tensor=True)
-
-
-    tag_pattern = r"(#[a-zA-Z0-9_]+)\b"
-    method_pattern = r"\.([a-zA-Z_][a-zA-Z0-9_]*)\("
-    attribute_pattern = r"\.([a-zA-Z_][a-zA-Z0-9_]*)\b(?!\s*\()"
-
-    def validate_tag(match):
-        tag = match.group(1)
-        if tag in tag_list or tag_embeddings is None:
-            return tag
-        query = model.encode(tag, convert_to_tensor=True).to(tag_embeddings.device)
-        scores = util.cos_sim(query, tag_embeddings)[0]
-        best_score = scores.max().item()
-        if best_score < THRESHOLD:
-            return tag
-        best_match = tag_list[scores.argmax().item()]
-        return best_match
-    
-    def validate_method(match):
-        method = match.group(1)
-        if method in method_list or method_embeddings is None:
-            return f".{method}("
-        query = model.encode(method, convert_to_tensor=True).to(method_embeddings.device)
-        scores = util.cos_sim(query, method_embeddings)[0]
-        best_score = scores.max().item()
-        if best_score < THRESHOLD:
-            return f".{method}("
-        best_match = method_list[scores.argmax().item()]
-        return f".{best_match}("
-
-    def validate_attribute(match):
-        attr = match.group(1)
-        if attr in attribute_list or attribute_embeddings is None:
-            return f".{attr}"
-        query = model.encode(attr, convert_to_tensor=True).to(attribute_embeddings.device)
-        scores = util.cos_sim(query, attribute_embeddings)[0]
-        best_score = scores.max().item()
-        if best_score < THRESHOLD:
-            return f".{attr}"
-        best_match = attribute_list[scores.argmax().item()]
-        return f".{best_match}"
-        
-    # 보호된 코드에서 패턴 매칭 수행
-    protected_code = re.sub(tag_pattern, validate_tag, protected_code)
-    protected_code = re.sub(method_pattern, validate_method, protected_code)
-    protected_code = re.sub(attribute_pattern, validate_attribute, protected_code)
-    
-    # 문자열 복원
-    code = restore_strings(protected_code, string_literals)
-    return code
+    corrections = accessor_index.correct(unknown, candidates, THRESHOLD)
+
+    def replace(kind, template):
+        return lambda match: template.format(corrections[kind].get(match.group(1), match.group(1)))
+
+    results = []
+    for protected_code, string_literals in protected:
+        # 보호된 코드에서 패턴 매칭 수행
+        protected_code = re.sub(ACCESSOR_PATTERNS["tag"], replace("tag", "{}"), protected_code)
+        protected_code = re.sub(ACCESSOR_PATTERNS["method"], replace("method", ".{}("), protected_code)
+        protected_code = re.sub(ACCESSOR_PATTERNS["attribute"], replace("attribute", ".{}"), protected_code)
+
+        # 문자열 복원
+        results.append(restore_strings(protected_code, string_literals))
+    return results
 
 def validate_tag_group(code: str, devices: list = []) -> bool:
     tag_list_pattern = r"\((#[^)]+)\)"
@@ -166,59 +95,85 @@ def validate_tag_group(code: str, devices: list = []) -> bool:
 
     return True  # 모두 만족
 
-def translate_string_literals(code: str) -> str:
+SPEAK_PATTERN = r'mediaPlayback_speak\(\s*["\'](.*?)["\']\s*\)'
+
+def translate_string_literals_batch(codes: list) -> list:
     """
-    스피커 출력을 위한 문자열 리터럴을 번역합니다.
+    여러 코드 조각의 스피커 출력 문자열 리터럴을 한 번의 요청으로 번역합니다.
     """
     # pattern = r'(["\'])(.*?)(\1)'
-    pattern = r'mediaPlayback_speak\(\s*["\'](.*?)["\']\s*\)'
+    literals = [match.group(1) for code in codes for match in re.finditer(SPEAK_PATTERN, code)]
+    if not literals:
+        return list(codes)
 
-    # 대체 함수 정의
+    try:
+        translated = deepl_translate_batch(literals, source="EN", target="KO")
+    except Exception:
+        translated = literals
+    translated = iter(translated)
+
+    # 대체 함수 정의 - 리터럴을 찾은 순서대로 번역 결과를 채워 넣음
     def replacer(match):
-        content = match.group(1)
-        try:
-            translated = deepl_translate(content, source="EN", target="KO")
-        except Exception:
-            translated = content
         # print(content, translated, sep=" -> ")
-        return f'mediaPlayback_speak("{translated}")'
+        return f'mediaPlayback_speak("{next(translated)}")'
 
-    return re.sub(pattern, replacer, code)
+    return [re.sub(SPEAK_PATTERN, replacer, code) for code in codes]
 
-def validate(code:str, classes: dict, selected_devices: list, devices_available: list, model, is_translate = True) -> str:
+def translate_string_literals(code: str) -> str:
     """
-    JOI 코드의 유효성을 검사하고 필요한 경우 수정합니다.
-    """ 
-    # 태그 구분자 교정
-    code = re.sub(r'(?<!\()(?<=\w)#(?=\w)', ' #', code)
-
-    # 각 디바이스 설명에서 접근자, 태그 추출
-    classes = {device:extract_accessors(classes[device]) for device in selected_devices}
+    스피커 출력을 위한 문자열 리터럴을 번역합니다.
+    """
+    return translate_string_literals_batch([code])[0]
 
-    tags = set()
-    attributes = set()
-    methods = set()
+def validate_batch(codes: list, classes: dict, selected_devices: list, devices_available: list, accessor_index) -> list:
+    """
+    한 응답의 JOI 코드 조각들을 함께 검사하고 필요한 경우 수정합니다.
+    유효하지 않은 코드 조각은 빈 문자열로 반환합니다.
+    """
+    # 태그 구분자 교정
+    codes = [re.sub(r'(?<!\()(?<=\w)#(?=\w)', ' #', code) for code in codes]
+
+    # 각 디바이스 설명에서 접근자 이름 추출 - 카탈로그에 없는 사용자 태그만 새로 인코딩됨
+    names = {kind: set() for kind in ACCESSOR_KINDS}
+    for device in selected_devices:
+        if isinstance(classes, CatalogOverlay):
+            device_info = classes.accessors(device)
+        else:
+            device_info = extract_accessors(classes[device])
+        for kind, block in ACCESSOR_KINDS.items():
+            names[kind].update(device_info.get(block, []))
+    candidates = {
+        kind: accessor_index.candidates(kind, selected_devices, sorted(names[kind]))
+        for kind in ACCESSOR_KINDS
+    }
 
-    for device_info in classes.values():
-        tags.update(device_info.get("Tags", []))
-        attributes.update(device_info.get("Attributes", []))
-        methods.update(device_info.get("Methods", []))
-    
     # 추출한 정보를 바탕으로 유사도 기반 교정 수행(실제로 존재하지 않는 접근자를 교정)
-    code = validate_accessors(code, list(tags), list(methods), list(attributes), model)
+    codes = validate_accessors_batch(codes, candidates, accessor_index)
     devices_available = [[f"#{t}" for t in tags]for tags in devices_available]
 
     # 태그 그룹으로 유효한 디바이스를 지정할 수 있는지 확인, 유효하지 않으면 빈 문자열 반환
-    if not validate_tag_group(code, devices_available):
-        return ""
-    if is_translate:
-        code = translate_string_literals(code)
+    return [code if validate_tag_group(code, devices_available) else "" for code in codes]
+
+def validate(code:str, classes: dict, selected_devices: list, devices_available: list, model, is_translate = True, accessor_index = None) -> str:
+    """
+    JOI 코드의 유효성을 검사하고 필요한 경우 수정합니다.
+    accessor_index가 없으면 주어진 디바이스 설명으로 새로 만듭니다.
+    """ 
+    if accessor_index is None:
+        accessor_index = AccessorIndex({device: classes[device] for device in selected_devices}, model)
+
+    code = validate_batch([code], classes, selected_devices, devices_available, accessor_index)[0]
+    if code and is_translate:
+        with stage("http"):
+            code = translate_string_literals(code)
     
     return code
 
 if __name__ == "__main__":
 
-    model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
+    from FlagEmbedding import BGEM3FlagModel
+    from .encoder import SharedEncoder
+    model = SharedEncoder(BGEM3FlagModel('BAAI/bge-m3', use_fp16=True))
 
     with open("./resources/service_list_ver1.1.8.txt", "r", encoding="utf-8") as f:
         service_doc = f.read()
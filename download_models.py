@@ -1,5 +1,4 @@
 import os
-from sentence_transformers import SentenceTransformer
 from huggingface_hub import snapshot_download
 
 # 모델을 저장할 디렉토리 설정
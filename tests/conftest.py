@@ -0,0 +1,5 @@
+import os, sys
+
+# app.config의 필수 설정 - 테스트는 외부 API를 호출하지 않음
+os.environ.setdefault("deeplAPI", "test")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,61 @@
+import numpy as np
+from app.services.accessor_index import AccessorIndex, lexical_match, normalize_identifier
+
+DEVICE_CLASSES = {
+    "Light": """Light
+  Tags:
+    #Light
+    #bedroom1
+  Methods:
+    switch_on() -> VOID
+    switch_off() -> VOID
+""",
+}
+
+
+class FakeModel:
+    """
+    정해 둔 벡터를 돌려주는 인코더 - 정해 두지 않은 이름은 서로 직교하는 벡터
+    """
+    def __init__(self, vectors: dict, dim: int = 16):
+        self.vectors = vectors
+        self.dim = dim
+        self.assigned = {}
+        self.calls = 0
+
+    def encode(self, names, **kwargs):
+        self.calls += 1
+        rows = []
+        for name in names:
+            if name not in self.vectors:
+                self.assigned.setdefault(name, np.eye(self.dim)[len(self.assigned)])
+            rows.append(self.vectors.get(name, self.assigned.get(name)))
+        return {"dense_vecs": np.array(rows, dtype=np.float32)}
+
+
+def correct_tag(index: AccessorIndex, name: str) -> str:
+    candidates = {"tag": index.candidates("tag", ["Light"])}
+    return index.correct({"tag": [name]}, candidates, threshold=0.7)["tag"].get(name)
+
+
+def test_lexical_match_excludes_other_numbers():
+    normalized = {normalize_identifier(name): [name] for name in ["#Light", "#bedroom1"]}
+    assert lexical_match("#Bedroom1", normalized) == ("#bedroom1", [])
+    assert lexical_match("#bedrom1", normalized) == (None, ["#bedroom1"])
+    assert lexical_match("#bedroom2", normalized) == (None, [])
+
+
+def test_numbered_tag_not_corrected_to_other_number():
+    index = AccessorIndex(DEVICE_CLASSES, FakeModel({}))
+    assert correct_tag(index, "#bedroom2") is None
+    assert correct_tag(index, "#Bedroom1") == "#bedroom1"
+
+
+def test_typo_requires_embedding_threshold():
+    bedroom = np.eye(16)[15]
+    model = FakeModel({"#bedroom1": bedroom, "#bedrom1": bedroom})
+    index = AccessorIndex(DEVICE_CLASSES, model)
+    assert correct_tag(index, "#bedrom1") == "#bedroom1"
+    # 편집 거리가 가까워도 임베딩이 다르면 교정하지 않음
+    assert correct_tag(index, "#bedroon1") is None
+    assert index.stats()["embedding_lookups"] == 2
@@ -0,0 +1,107 @@
+import asyncio, time
+import httpx
+import pytest
+from app.services.deepl_client import CircuitBreaker, DeepLClient
+
+
+def test_opens_after_threshold_failures():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60.0)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60.0)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_allows_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()    # 시험 호출이 끝날 때까지 다른 호출은 차단
+
+
+def test_half_open_trial_result():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"    # 시험 호출이 실패하면 cooldown부터 다시 시작
+
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_release_lets_next_call_retry():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+
+
+def half_open_client(handler, timeout: float = 1.0) -> DeepLClient:
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.0)
+    breaker.record_failure()
+    client = DeepLClient("http://deepl.test/v2/translate", "key", timeout=timeout, breaker=breaker)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+@pytest.mark.parametrize("response, closed", [
+    (httpx.Response(200, json={"translations": [{"text": "hello"}]}), True),
+    (httpx.Response(400, text="bad request"), True),        # 요청 문제는 서비스 장애가 아님
+    (httpx.Response(200, json={"unexpected": []}), False),  # 응답 형식 오류
+    (httpx.Response(503), False),
+    (httpx.Response(403, text="wrong auth key"), False),   # 인증 키 오류와 사용량 초과는 이후 요청도 실패
+    (httpx.Response(456, text="quota exceeded"), False),
+])
+def test_client_resolves_trial(response, closed):
+    client = half_open_client(lambda request: response)
+    asyncio.run(client.translate(["안녕"], "KO", "EN"))
+    # 어떤 결과든 시험 호출이 끝나면 다음 호출을 받을 수 있음 (cooldown 0)
+    assert (client.breaker.state == "closed") == closed
+    assert client.breaker.allow()
+
+
+def test_client_releases_trial_on_cancel():
+    async def slow(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200)
+
+    async def run(client):
+        task = asyncio.create_task(client.translate(["안녕"], "KO", "EN"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    client = half_open_client(slow, timeout=10.0)
+    asyncio.run(run(client))
+    assert client.breaker.allow()
+
+
+def test_client_timeout_bounds_whole_request():
+    async def slow(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200)
+
+    client = half_open_client(slow, timeout=0.1)
+    start = time.monotonic()
+    assert asyncio.run(client.translate(["안녕"], "KO", "EN")) is None
+    assert time.monotonic() - start < 1.0
+    assert client.stats()["timeouts"] == 1
@@ -0,0 +1,68 @@
+import torch
+from app.services.constrained_decoding import JOIConstraint, ConstrainedDecoding
+from app.services.batching import JOILogitsProcessor
+
+HEADER = '```\nname = "Scenario1"\ncron = ""\nperiod = -1\n'
+
+
+def make_constraint():
+    return JOIConstraint({"Light", "SectorA"}, {"switch_on", "switch_off"})
+
+
+def accepts_each_char(constraint, text):
+    # 한 글자씩 생성하는 것처럼 매 위치에서 다음 글자를 허용하는지 확인
+    return all(constraint.accepts(constraint.scan(text[:i]), text[i]) for i in range(len(text)))
+
+
+def test_unknown_tag_and_member_rejected():
+    constraint = make_constraint()
+    assert accepts_each_char(constraint, HEADER + "(#Light #SectorA).switch_on()\n")
+    assert not accepts_each_char(constraint, HEADER + "(#Lihgt).switch_on()\n")
+    assert not accepts_each_char(constraint, HEADER + "(#Light).switch_onn()\n")
+
+
+def test_comments_not_constrained():
+    constraint = make_constraint()
+    assert accepts_each_char(constraint, HEADER + "# turn on #Bedroom first\n(#Light).switch_on()\n")
+    assert accepts_each_char(constraint, HEADER + "(#Light).switch_on() # (#Fan).rotate\n#\n")
+    assert accepts_each_char(constraint, HEADER + "(#Light).switch_on() // #Fan\n")
+
+
+class CharTokenizer:
+    """
+    글자 하나가 토큰 하나인 토크나이저
+    """
+    def __init__(self, chars):
+        self.chars = chars
+        self.all_special_ids = [len(chars)]
+
+    def decode(self, ids):
+        return "".join(self.chars[i] for i in ids)
+
+
+def test_processor_keeps_commented_line():
+    text = HEADER + "# check the light\n"
+    chars = sorted(set(text + "(#Light).switch_on()x"))
+    decoding = ConstrainedDecoding(CharTokenizer(chars), max_candidates=4)
+    processor = JOILogitsProcessor(decoding, [make_constraint()], 0)
+
+    # 주석 줄을 한 글자씩 생성해도 모든 최상위 토큰이 허용됨
+    for i, ch in enumerate(text):
+        input_ids = torch.tensor([[chars.index(c) for c in text[:i]]])
+        scores = torch.zeros(1, len(chars) + 1)
+        scores[0, chars.index(ch)] = 5.0
+        scores[0, chars.index("x")] = 1.0
+        out = processor(input_ids, scores.clone())
+        assert chars[int(out.argmax())] == ch, text[:i + 1]
+    stats = decoding.stats()
+    assert stats["forced"] == 0 and stats["unconstrained"] == 0
+
+    # 주석이 아닌 태그는 허용된 후보로 제한
+    prefix = text + "(#Li"
+    input_ids = torch.tensor([[chars.index(c) for c in prefix]])
+    scores = torch.zeros(1, len(chars) + 1)
+    scores[0, chars.index("x")] = 5.0
+    scores[0, chars.index("g")] = 1.0
+    out = processor(input_ids, scores.clone())
+    assert chars[int(out.argmax())] == "g"
+    assert decoding.stats()["forced"] == 1
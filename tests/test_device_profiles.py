@@ -0,0 +1,68 @@
+import pytest
+from app.services import device_profiles
+from app.services.device_profiles import ProfileRegistry
+
+HOME_A = {"device-1": {"category": ["Light"], "tags": ["Light", "livingroom"]}}
+HOME_B = {"device-2": {"category": ["Speaker"], "tags": ["Speaker"]}}
+
+
+@pytest.fixture(autouse=True)
+def simple_state(monkeypatch):
+    # 디바이스 카탈로그 없이 저장/조회만 확인
+    monkeypatch.setattr(device_profiles, "derive_device_state", lambda devices, catalog, keys: {"devices": sorted(devices)})
+
+
+@pytest.fixture
+def workers(tmp_path):
+    # 같은 SQLite 파일을 사용하는 두 워커 프로세스의 저장소
+    path = str(tmp_path / "profiles.sqlite3")
+    return ProfileRegistry(None, [], path=path), ProfileRegistry(None, [], path=path)
+
+
+def test_put_is_visible_to_other_worker(workers):
+    a, b = workers
+    a.put("home", HOME_A)
+    profile = b.get("home")
+    assert dict(profile.devices) == HOME_A
+    assert profile.state == {"devices": ["device-1"]}
+
+
+def test_get_reloads_profile_changed_by_other_worker(workers):
+    a, b = workers
+    a.put("home", HOME_A)
+    assert dict(b.get("home").devices) == HOME_A
+    a.put("home", HOME_B)
+    assert dict(b.get("home").devices) == HOME_B
+    assert b.stats()["reloads"] == 2
+
+
+def test_put_persists_even_if_memory_matches(workers):
+    a, b = workers
+    a.put("home", HOME_A)
+    b.put("home", HOME_B)
+    # a는 메모리에 HOME_A를 가지고 있지만 저장된 값은 HOME_B
+    a.put("home", HOME_A)
+    assert dict(b.get("home").devices) == HOME_A
+
+
+def test_delete_is_visible_to_other_worker(workers):
+    a, b = workers
+    a.put("home", HOME_A)
+    assert b.get("home") is not None
+    assert a.delete("home")
+    assert b.get("home") is None
+
+
+def test_patch_updates_single_device(workers):
+    a, b = workers
+    a.put("home", HOME_A)
+    b.patch("home", {"device-1": None, **HOME_B})
+    assert dict(a.get("home").devices) == HOME_B
+
+
+def test_ephemeral_profile_is_not_stored(workers):
+    a, b = workers
+    profile = a.ephemeral(HOME_A)
+    assert profile.state == {"devices": ["device-1"]}
+    assert a.get(profile.profile_id) is None
+    assert b.stats()["stored_profiles"] == 0
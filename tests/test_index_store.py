@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from app.services.embedding import build_colbert_index, build_sparse_index, compute_colbert_scores, normalize_rows
+from app.services.index_store import IndexValidationError, open_index, read_index_header, write_index
+
+
+@pytest.fixture
+def service_list(tmp_path):
+    path = tmp_path / "service_list.txt"
+    path.write_text("Device Light:\n    \"\"\"\n    #Light\n    \"\"\"\n", encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def embedding_data():
+    rng = np.random.default_rng(0)
+    return {
+        "dense": normalize_rows(rng.standard_normal((3, 8))),
+        "colbert": build_colbert_index([rng.standard_normal((n, 8)) for n in (2, 0, 4)]),
+        "sparse": build_sparse_index([{"10": 0.5, "11": 0.1}, {}, {"11": 0.3, "12": 0.2}]),
+        "metadata": {"keys": ["Light", "Speaker", "Clock"], "texts": ["light", "speaker", "clock"]},
+    }
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_round_trip(tmp_path, service_list, embedding_data, dtype):
+    path = str(tmp_path / "index.bin")
+    write_index(path, embedding_data, service_list, dtype, extra={"doc_hashes": {"Light": "x"}})
+    index = open_index(path, service_list, verify_payload=True)
+
+    tolerance = 1e-3 if dtype == "float16" else 0
+    assert index["metadata"] == embedding_data["metadata"]
+    assert index["header"]["doc_hashes"] == {"Light": "x"}
+    assert index["dense"].dtype == np.dtype(dtype)
+    np.testing.assert_allclose(index["dense"], embedding_data["dense"], atol=tolerance)
+    np.testing.assert_allclose(index["colbert"]["matrix"], embedding_data["colbert"]["matrix"], atol=tolerance)
+    np.testing.assert_array_equal(index["colbert"]["offsets"], embedding_data["colbert"]["offsets"])
+    assert index["sparse"]["vocab"] == embedding_data["sparse"]["vocab"]
+    np.testing.assert_allclose(index["sparse"]["matrix"].toarray(), embedding_data["sparse"]["matrix"].toarray())
+
+    query = np.random.default_rng(1).standard_normal((5, 8))
+    np.testing.assert_allclose(
+        compute_colbert_scores(query, index["colbert"]), compute_colbert_scores(query, embedding_data["colbert"]), atol=1e-2
+    )
+
+
+def test_rejects_other_service_list(tmp_path, service_list, embedding_data):
+    path = str(tmp_path / "index.bin")
+    write_index(path, embedding_data, service_list)
+    other = tmp_path / "other.txt"
+    other.write_text("changed", encoding="utf-8")
+    with pytest.raises(IndexValidationError):
+        open_index(path, str(other))
+
+
+def test_detects_corrupted_payload(tmp_path, service_list, embedding_data):
+    path = str(tmp_path / "index.bin")
+    write_index(path, embedding_data, service_list)
+    header, data_start = read_index_header(path)
+    with open(path, "r+b") as f:
+        f.seek(data_start + header["blocks"]["dense"]["offset"])
+        f.write(b"\xff\xff\xff\xff")
+    open_index(path, service_list)    # 체크섬 확인 없이 열면 헤더만 검사
+    with pytest.raises(IndexValidationError):
+        open_index(path, service_list, verify_payload=True)
+
+
+def test_rejects_non_index_file(tmp_path, service_list):
+    path = tmp_path / "index.bin"
+    path.write_bytes(b"not an index")
+    with pytest.raises(IndexValidationError):
+        open_index(str(path), service_list)
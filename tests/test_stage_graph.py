@@ -0,0 +1,57 @@
+import threading, time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.services.executor import StageGraph
+
+
+@pytest.fixture
+def graph():
+    pool = ThreadPoolExecutor(max_workers=4)
+    yield StageGraph(pool)
+    pool.shutdown(wait=True)
+
+
+def test_dependencies_receive_results_in_order(graph):
+    graph.add("a", lambda: 1)
+    graph.add("b", lambda: 2)
+    graph.add("sum", lambda a, b: (a, b), ("a", "b"))
+    assert graph.result("sum") == (1, 2)
+
+
+def test_independent_stages_run_concurrently(graph):
+    barrier = threading.Barrier(2, timeout=2)
+    graph.add("a", lambda: barrier.wait())
+    graph.add("b", lambda: barrier.wait())
+    graph.add("both", lambda a, b: True, ("a", "b"))
+    assert graph.result("both")
+
+
+def test_stage_waits_for_dependencies(graph):
+    graph.add("slow", lambda: time.sleep(0.05) or "done")
+    assert graph.call("after", lambda slow: slow + "!", ("slow",)) == "done!"
+    spans = graph.timings()["stages"]
+    assert set(spans) == {"slow", "after"}
+
+
+def test_error_propagates_to_dependents(graph):
+    def fail():
+        raise ValueError("boom")
+
+    ran = []
+    graph.add("fail", fail)
+    graph.add("child", lambda _: ran.append("child"), ("fail",))
+    graph.add("grandchild", lambda _: ran.append("grandchild"), ("child",))
+    with pytest.raises(ValueError, match="boom"):
+        graph.result("grandchild")
+    assert ran == []
+    assert isinstance(graph.error("child"), ValueError)
+    assert graph.done("grandchild")
+
+
+def test_call_raises_dependency_error(graph):
+    def fail():
+        raise KeyError("missing")
+
+    graph.add("fail", fail)
+    with pytest.raises(KeyError):
+        graph.call("after", lambda _: None, ("fail",))